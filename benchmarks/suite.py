@@ -0,0 +1,376 @@
+"""
+Benchmark suite of `AgentShell`, `BashRuntime`, `IOStreamReader`, `ClixmlDecoder` and `EnvBuilder`.
+Results are written as JSON, and compared against a stored baseline when given.
+
+    python benchmarks/suite.py [--quick] [--output results.json]
+                               [--baseline benchmarks/baseline.json] [--tolerance 0.25]
+                               [--save-baseline benchmarks/baseline.json]
+
+The process exits with status 1 when a metric regressed by more than `--tolerance`
+relative to the baseline, and with status 2 when the baseline was recorded in the
+other mode; `--quick` runs compare against benchmarks/baseline-quick.json. Baselines
+are machine specific, record one on the machine the comparison runs on.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+import psutil
+
+from dais_shell import AgentShell, CommandStep, OutputRedirect, SpawnBackend
+from dais_shell.clixml_decoder import ClixmlDecoder
+from dais_shell.command_policy import CommandPolicy, PolicyRule
+from dais_shell.env_builder import EnvBuilder
+from dais_shell.iostream_reader import IOStreamReader, IOStreamSink
+from dais_shell.output_buffer import OutputRetention
+
+
+@dataclass
+class Metric:
+    value: float
+    unit: str
+    # "lower" or "higher"
+    better: str
+
+
+def _step(command: str, args: list[str], timeout: float | None = None, cwd: str = ".") -> CommandStep:
+    return CommandStep(command=command, args=args, env={}, cwd=cwd, timeout=timeout)
+
+
+def _percentile(samples: list[float], fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def bench_spawn(runs: int) -> dict[str, Metric]:
+    shell = AgentShell()
+    step = _step("true", [])
+    await shell.run(step)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await shell.run(step)
+        samples.append(time.perf_counter() - start)
+    return {
+        "spawn.p50": Metric(_percentile(samples, 0.5) * 1000, "ms", "lower"),
+        "spawn.p99": Metric(_percentile(samples, 0.99) * 1000, "ms", "lower"),
+    }
+
+
+async def bench_session(runs: int) -> dict[str, Metric]:
+    """Per-step latency of the persistent bash session, to set against `spawn.p50`."""
+    shell = AgentShell(session=True)
+    step = _step("true", [])
+    # the session process is started by the first run
+    await shell.run(step)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await shell.run(step)
+        samples.append(time.perf_counter() - start)
+    await shell.aclose()
+    return {
+        "session.p50": Metric(_percentile(samples, 0.5) * 1000, "ms", "lower"),
+        "session.p99": Metric(_percentile(samples, 0.99) * 1000, "ms", "lower"),
+    }
+
+
+def _make_stream(data: bytes) -> asyncio.StreamReader:
+    stream = asyncio.StreamReader(limit=2 ** 16)
+    stream.feed_data(data)
+    stream.feed_eof()
+    return stream
+
+
+async def bench_reader(lines: int) -> dict[str, Metric]:
+    data = b"".join(b"build step %d: compiling module_%d.c\n" % (i, i) for i in range(lines))
+    mb = len(data) / 1024 / 1024
+    metrics = {}
+    for name, callback in {"no_callback": None, "callback": lambda _: None}.items():
+        sink = IOStreamSink(OutputRetention(), callback)
+        start = time.perf_counter()
+        await IOStreamReader._consumer(_make_stream(data), sink)
+        sink.buffer.text
+        elapsed = time.perf_counter() - start
+        metrics[f"reader.{name}.lines_per_sec"] = Metric(lines / elapsed, "lines/s", "higher")
+        metrics[f"reader.{name}.mb_per_sec"] = Metric(mb / elapsed, "MB/s", "higher")
+
+    shell = AgentShell()
+    code = f"import sys; sys.stdout.writelines(f'build step {{i}}: compiling module_{{i}}.c\\n' for i in range({lines}))"
+    start = time.perf_counter()
+    await shell.run(_step(sys.executable, ["-c", code]))
+    elapsed = time.perf_counter() - start
+    metrics["reader.process.lines_per_sec"] = Metric(lines / elapsed, "lines/s", "higher")
+    return metrics
+
+
+async def bench_redirect(lines: int) -> dict[str, Metric]:
+    """Output read through the pipes against output written by the process to a file."""
+    shell = AgentShell()
+    code = f"import sys; sys.stdout.writelines(f'build step {{i}}: compiling module_{{i}}.c\\n' for i in range({lines}))"
+    mb = sum(len(f"build step {i}: compiling module_{i}.c\n") for i in range(lines)) / 1024 / 1024
+    metrics = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, redirect in {"captured": None, "file": OutputRedirect("out.log")}.items():
+            step = CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=directory,
+                               stdout_redirect=redirect)
+            start = time.perf_counter()
+            await shell.run(step)
+            elapsed = time.perf_counter() - start
+            metrics[f"redirect.{name}.mb_per_sec"] = Metric(mb / elapsed, "MB/s", "higher")
+    return metrics
+
+
+def _alive(pid: int) -> bool:
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        # also when it is reaped between the lookup and the status
+        return False
+
+
+async def _wait_dead(pids: list[int]) -> float:
+    while any(_alive(pid) for pid in pids):
+        await asyncio.sleep(0.001)
+    return time.perf_counter()
+
+
+async def bench_kill(runs: int, timeout: float = 0.5) -> dict[str, Metric]:
+    """Time from the expiry of the timeout until every process of the tree is gone."""
+    shell = AgentShell()
+    samples = []
+    with tempfile.TemporaryDirectory() as directory:
+        for run in range(runs):
+            pid_file = os.path.join(directory, f"pids-{run}")
+            # a parent with two children, the pids are written before the timeout
+            script = (
+                "import os, subprocess, sys, time\n"
+                "children = [subprocess.Popen(['sleep', '60']) for _ in range(2)]\n"
+                "with open(sys.argv[1], 'w') as f: f.write(' '.join(str(p) for p in [os.getpid(), *(c.pid for c in children)]))\n"
+                "time.sleep(60)\n"
+            )
+            start = time.perf_counter()
+            await shell.run(_step(sys.executable, ["-c", script, pid_file], timeout=timeout))
+            with open(pid_file) as file:
+                pids = [int(line) for line in file.read().split()]
+            dead = await _wait_dead(pids)
+            samples.append(dead - (start + timeout))
+    return {
+        "kill.p50": Metric(_percentile(samples, 0.5) * 1000, "ms", "lower"),
+        "kill.max": Metric(max(samples) * 1000, "ms", "lower"),
+    }
+
+
+def _strip_clixml_post_hoc(text: str) -> str:
+    """The former approach of `PowerShellRuntime`, which parsed stderr after the process exited."""
+    xml_part = text.strip()[len("#< CLIXML"):].strip()
+    root = ET.fromstring(xml_part)
+    ns = {"ps": "http://schemas.microsoft.com/powershell/2004/04"}
+    parts = []
+    for s in root.findall(".//ps:S", ns):
+        if not s.text: continue
+        t = re.sub(r"_x([0-9A-Fa-f]{4})_", lambda m: chr(int(m.group(1), 16)), s.text)
+        parts.append(re.sub(r"\x1b\[[0-9;]*m", "", t))
+    return "".join(parts)
+
+
+async def bench_clixml(records: int, repeats: int = 5) -> dict[str, Metric]:
+    """The median of `repeats` runs of each way, a single run is dominated by scheduling noise."""
+    data = (
+        b'#< CLIXML\r\n<Objs Version="1.1.0.1" xmlns="http://schemas.microsoft.com/powershell/2004/04">'
+        + b"".join(b'<S S="Error">_x001B_[31;1merror %d: cannot find path C:\\item_%d_x001B_[0m_x000D__x000A_</S>'
+                   % (i, i) for i in range(records))
+        + b"</Objs>"
+    )
+    streaming_samples, post_hoc_samples = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sink = IOStreamSink(OutputRetention(), decoder=ClixmlDecoder())
+        await IOStreamReader._consumer(_make_stream(data), sink)
+        streaming = sink.buffer.lines
+        streaming_samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        buffer = IOStreamSink(OutputRetention()).buffer
+        buffer.extend(line.encode() for line in _strip_clixml_post_hoc(data.decode()).splitlines())
+        post_hoc = buffer.lines
+        post_hoc_samples.append(time.perf_counter() - start)
+        assert streaming == post_hoc
+
+    return {
+        "clixml.streaming.records_per_sec": Metric(records / _percentile(streaming_samples, 0.5), "records/s", "higher"),
+        "clixml.post_hoc.records_per_sec": Metric(records / _percentile(post_hoc_samples, 0.5), "records/s", "higher"),
+    }
+
+
+def bench_policy(rules: int, runs: int = 20000) -> dict[str, Metric]:
+    policy = CommandPolicy(
+        [PolicyRule(f"name-{i}", command=f"tool{i}") for i in range(rules)]
+        + [PolicyRule(f"path-{i}", path_glob=f"/opt/vendor{i}/bin/*") for i in range(rules)]
+        + [PolicyRule(f"args-{i}", command=f"cli{i}", args_pattern=rf"--danger-{i}\b") for i in range(rules)]
+        + [PolicyRule("force-push", command="git", args_pattern=r"\bpush\b.*--force\b")]
+    )
+    step = _step("git", ["push", "origin", "main"])
+    start = time.perf_counter()
+    for _ in range(runs):
+        policy.match(step, "/usr/bin/git")
+    elapsed = time.perf_counter() - start
+    return {f"policy.check_{rules * 3}_rules.mean": Metric(elapsed / runs * 1_000_000, "us", "lower")}
+
+
+def bench_env_build(runs: int) -> dict[str, Metric]:
+    extra = {"CI": "1", "LANG": "C.UTF-8"}
+    EnvBuilder().with_extra(extra).build()
+    # the best of a few batches, a single batch is dominated by scheduling noise
+    batches = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(runs):
+            EnvBuilder().with_extra(extra).build()
+        batches.append((time.perf_counter() - start) / runs)
+    return {"env_build.mean": Metric(min(batches) * 1_000_000, "us", "lower")}
+
+
+async def bench_spawn_rss(levels_mb: list[int], runs: int) -> dict[str, Metric]:
+    """
+    Spawn latency of each backend while the parent holds `level` MB of touched
+    memory, in the current directory and in another one.
+    """
+    metrics = {}
+    with tempfile.TemporaryDirectory() as directory:
+        steps = {"": _step("true", []), ".other_cwd": _step("true", [], cwd=directory)}
+        for level in levels_mb:
+            ballast = b"\x01" * (level * 1024 * 1024)
+            for backend in SpawnBackend:
+                shell = AgentShell(spawn_backend=backend)
+                for suffix, step in steps.items():
+                    await shell.run(step)
+                    samples = []
+                    for _ in range(runs):
+                        start = time.perf_counter()
+                        await shell.run(step)
+                        samples.append(time.perf_counter() - start)
+                    metrics[f"spawn.{backend.value}.rss_{level}mb{suffix}.p50"] = Metric(
+                        _percentile(samples, 0.5) * 1000, "ms", "lower")
+            del ballast
+    return metrics
+
+
+def bench_run_sync(runs: int, threads: int = 8) -> dict[str, Metric]:
+    """Synchronous callers, one after another and from a thread pool."""
+    shell = AgentShell()
+    step = _step("true", [])
+    shell.run_sync(step)
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        shell.run_sync(step)
+        samples.append(time.perf_counter() - start)
+    with ThreadPoolExecutor(threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: shell.run_sync(step), range(runs)))
+        elapsed = time.perf_counter() - start
+    shell.close()
+    return {
+        "run_sync.p50": Metric(_percentile(samples, 0.5) * 1000, "ms", "lower"),
+        f"run_sync.threads_{threads}.steps_per_sec": Metric(runs / elapsed, "steps/s", "higher"),
+    }
+
+
+async def bench_concurrency(levels: list[int]) -> dict[str, Metric]:
+    shell = AgentShell()
+    step = _step("true", [])
+    metrics = {}
+    for level in levels:
+        start = time.perf_counter()
+        await asyncio.gather(*(shell.run(step) for _ in range(level)))
+        elapsed = time.perf_counter() - start
+        metrics[f"concurrency.{level}.steps_per_sec"] = Metric(level / elapsed, "steps/s", "higher")
+    return metrics
+
+
+async def run_suite(quick: bool) -> dict[str, Metric]:
+    metrics: dict[str, Metric] = {}
+    metrics.update(await bench_spawn(50 if quick else 300))
+    metrics.update(await bench_session(50 if quick else 300))
+    metrics.update(await bench_spawn_rss([0, 256] if quick else [0, 512, 2048], 30 if quick else 100))
+    metrics.update(bench_run_sync(50 if quick else 300))
+    metrics.update(await bench_reader(100_000 if quick else 1_000_000))
+    metrics.update(await bench_redirect(100_000 if quick else 1_000_000))
+    metrics.update(await bench_clixml(20_000 if quick else 200_000))
+    metrics.update(await bench_kill(3 if quick else 10))
+    metrics.update(bench_policy(1000 if quick else 10000))
+    metrics.update(bench_env_build(1000 if quick else 20000))
+    metrics.update(await bench_concurrency([1, 4, 16, 64] if quick else [1, 2, 4, 8, 16, 32, 64, 128, 256]))
+    return metrics
+
+
+def compare(metrics: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """Returns a description of each metric which regressed by more than `tolerance`."""
+    regressions = []
+    for name, metric in metrics.items():
+        if name not in baseline: continue
+        base, value = baseline[name]["value"], metric["value"]
+        if base <= 0: continue
+        change = (value - base) / base
+        if metric["better"] == "higher": change = -change
+        if change > tolerance:
+            regressions.append(f"{name}: {value:.3f} {metric['unit']} against {base:.3f}, {change:+.0%} worse")
+    return regressions
+
+
+# one baseline per mode, a --quick run measures smaller inputs
+BASELINES = {False: "benchmarks/baseline.json", True: "benchmarks/baseline-quick.json"}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="fewer runs, for a smoke check")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    metrics = {name: asdict(metric) for name, metric in asyncio.run(run_suite(args.quick)).items()}
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "quick": args.quick,
+        "metrics": metrics,
+    }
+    for name, metric in metrics.items():
+        print(f"{name:<44} {metric['value']:14.3f} {metric['unit']}")
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("quick") != args.quick:
+            # the sizes differ between the modes, so do the rates
+            print(f"error: {args.baseline} was recorded {'with' if baseline.get('quick') else 'without'} --quick,"
+                  f" compare against {BASELINES[args.quick]}")
+            return 2
+        regressions = compare(metrics, baseline["metrics"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,25 @@
-import asyncio
+import os
 import platform
 from dataclasses import replace
-from typing import TypeAlias
+from typing import AsyncIterator, Awaitable, Callable, TypeAlias
 from .env_builder import EnvBuilder
-from .iostream_reader import IOStreamReaderResult, IOStreamReaderStatus
-from .runtimes import BaseShellRuntime, BashRuntime, PowerShellRuntime
-from .types import CommandStep, ShellError, ShellRuntimeNotFoundError, ForbiddenShellTargetError
+from .iostream_reader import IOStreamReaderResult, IOStreamReaderStatus, TerminationPolicy
+from .output_buffer import OutputRetention
+from .output_normalizer import OutputNormalization
+from .output_delivery import DeliveryStats, OutputDelivery, OverflowPolicy
+from .runtimes import BaseShellRuntime, BashRuntime, BashSessionRuntime, PowerShellRuntime
+from .command_policy import CommandPolicy, PolicyAction, PolicyRule
+from .spawn import SpawnBackend
+from .scheduler import AdmissionPolicy, AdmissionScheduler
+from .result_cache import CacheRule, ResultCache, ResultCacheInfo, replay_output
+from .plan import PlanExecutor, PlanPolicy, PlanResult, PlanStep
+from .pipeline import Pipeline
+from .timing import StepTiming, set_timing_hook, emit_timing
+from .stream import ExitEvent, StderrLineEvent, StdoutLineEvent, StreamEvent, stream_step
+from .output_redirect import RedirectedOutput
+from .types import CommandStep, StepPriority, StdinSource, OutputRedirect, ResourceLimits, ShellError, ShellRuntimeNotFoundError, ForbiddenShellTargetError, InvalidPlanError, InvalidPipelineError
 from .constants import DEFAULT_COMMAND_BLACKLIST
+from .utils import CommandResolver
 
 ShellResult: TypeAlias = IOStreamReaderResult
 ShellResultStatus: TypeAlias = IOStreamReaderStatus
@@ -17,44 +30,229 @@ class AgentShell:
                  extra_env: dict[str, str] | None = None,
                  extra_paths: list[str] | None = None,
                  max_lines: int = 10000,
+                 session: bool = False,
+                 retention: OutputRetention | None = None,
+                 limits: ResourceLimits | None = None,
+                 termination: TerminationPolicy | None = None,
+                 delivery: OutputDelivery | None = None,
+                 cache: ResultCache | None = None,
+                 policy: CommandPolicy | None = None,
+                 spawn_backend: SpawnBackend = SpawnBackend.SUBPROCESS,
+                 admission: AdmissionPolicy | None = None,
                  ):
-        self._runtime = self._create_runtime(max_lines)
+        """
+        :param max_lines: bound on the retained tail lines, used when `retention` is not given.
+        :param session: run steps in one persistent bash process instead of
+            spawning a process per step, ignored on Windows.
+        :param retention: byte budgets of the output kept in memory per stream.
+        :param limits: default resource limits of every step, the limits set
+            on a step override them. Not applied on Windows.
+        :param termination: how steps are stopped on timeout or cancellation.
+        :param delivery: delivers the output callbacks from a queue instead of
+            calling them while reading, optionally in batches. Coroutine
+            callbacks are always delivered from a queue.
+        :param cache: reuses the results of read-only commands, such as
+            `git log` or `ls`, see `ResultCache`. Results are marked as `cached`.
+        :param policy: rules checked against the command, its resolved path and its
+            arguments in addition to `command_blacklist`.
+        :param spawn_backend: how steps are started when they are not run in a session,
+            `SpawnBackend.POSIX_SPAWN` and `SpawnBackend.FORK_SERVER` avoid forking
+            a large parent process.
+        :param admission: bounds the steps which run at once, waiting steps are admitted
+            by `CommandStep.priority` and in turns across their working directories.
+            The wait is reported in `ShellResult.queue_wait`.
+        """
+        retention = retention or OutputRetention(max_lines=max_lines)
+        self._resolver = CommandResolver()
+        self._runtime = self._create_runtime(retention, session, self._resolver, termination, delivery,
+                                             spawn_backend)
         self._command_blacklist = command_blacklist or DEFAULT_COMMAND_BLACKLIST
+        self._limits = limits
+        self._delivery = delivery
+        self._cache = cache
+        self._policy = policy
+        self._scheduler = AdmissionScheduler(admission) if admission is not None else None
         self._env_builder = EnvBuilder(blacklist=None, extra=extra_env, extra_paths=extra_paths)
 
     @staticmethod
-    def _create_runtime(max_lines: int) -> BaseShellRuntime:
+    def _create_runtime(retention: OutputRetention,
+                        session: bool = False,
+                        resolver: CommandResolver | None = None,
+                        termination: TerminationPolicy | None = None,
+                        delivery: OutputDelivery | None = None,
+                        spawn_backend: SpawnBackend = SpawnBackend.SUBPROCESS,
+                        ) -> BaseShellRuntime:
         if platform.system() == "Windows":
-            return PowerShellRuntime(max_lines)
+            return PowerShellRuntime(retention, termination, delivery)
+        elif session:
+            return BashSessionRuntime(retention, resolver, termination, delivery)
         else:
-            return BashRuntime(max_lines)
+            return BashRuntime(retention, resolver, termination, delivery, spawn_backend)
+
+    @property
+    def result_cache(self) -> ResultCache | None:
+        """See `ResultCache.cache_info()` for the hit and miss counts."""
+        return self._cache
+
+    @property
+    def command_resolver(self) -> CommandResolver:
+        """The cache of command lookups, see `CommandResolver.cache_info()`."""
+        return self._resolver
+
+    def close(self):
+        self._runtime.close()
+
+    async def aclose(self):
+        await self._runtime.aclose()
 
     def run_sync(self,
                  step: CommandStep,
                  on_stdout=None,
                  on_stderr=None
                  ) -> ShellResult:
-        return asyncio.run(self.run(step, on_stdout, on_stderr))
+        """
+        Runs the step on a background event loop kept by the shell, where the callbacks
+        are called. Can be called from several threads at once, and from a running loop.
+        """
+        return self._runtime.run_coroutine(self.run(step, on_stdout, on_stderr))
 
     async def run(self,
                   step: CommandStep,
                   on_stdout=None,
-                  on_stderr=None
+                  on_stderr=None,
+                  delivery: OutputDelivery | None = None,
                   ) -> ShellResult:
+        """
+        :param delivery: overrides the `OutputDelivery` of the shell for this run.
+        """
+        timing = StepTiming.start()
+        step = self._prepare_step(step)
+        timing.mark("env_built")
+        lookup = self._cache.lookup(step) if self._cache is not None else None
+        if lookup is not None and lookup.result is not None:
+            # the delivery and the admission of the stored run do not apply
+            result = replace(lookup.result, timing=timing, cached=True, queue_wait=None,
+                             stdout_delivery=None, stderr_delivery=None)
+            delivery = delivery or self._delivery
+            await replay_output(result, on_stdout, on_stderr, delivery is not None and delivery.batched)
+        else:
+            result = await self._run_admitted(
+                step, timing, lambda: self._runtime.run(step, on_stdout, on_stderr, timing, delivery))
+            if lookup is not None:
+                assert self._cache is not None
+                self._cache.store(lookup, result)
+        emit_timing(step, timing)
+        return result
+
+    async def run_pipeline(self,
+                           pipeline: Pipeline,
+                           on_stdout=None,
+                           on_stderr=None,
+                           delivery: OutputDelivery | None = None,
+                           ) -> ShellResult:
+        """
+        Runs the stages of the pipeline connected by OS pipes, the data between
+        them does not pass through Python. The exit code of every stage is in
+        `ShellResult.stage_returncodes`, timeouts kill all the stages.
+        The pipeline is admitted, and timed, as its first stage.
+        """
+        timing = StepTiming.start()
+        stages = [self._prepare_step(step) for step in pipeline.stages]
+        pipeline = replace(pipeline, stages=stages)
+        timing.mark("env_built")
+        result = await self._run_admitted(
+            stages[0], timing, lambda: self._runtime.run_pipeline(pipeline, on_stdout, on_stderr, timing, delivery))
+        emit_timing(stages[0], timing)
+        return result
+
+    async def _run_admitted(self, step: CommandStep, timing: StepTiming,
+                            run: Callable[[], Awaitable[ShellResult]]) -> ShellResult:
+        if self._scheduler is None:
+            return await run()
+        queue_wait = await self._scheduler.acquire(step.priority, os.path.abspath(step.cwd))
+        timing.mark("admitted")
+        try:
+            result = await run()
+        finally:
+            self._scheduler.release()
+        result.queue_wait = queue_wait
+        return result
+
+    def stream(self, step: CommandStep, max_pending_lines: int = 1024) -> AsyncIterator[StreamEvent]:
+        """
+        Runs the step and yields `StdoutLineEvent` and `StderrLineEvent` as the lines
+        are read, then one `ExitEvent` with the result. The process is not read much
+        further ahead than the consumer pulls. Closing the iterator early, for example
+        with `contextlib.aclosing`, terminates the process tree.
+        """
+        return stream_step(self.run, step, max_pending_lines)
+
+    async def run_plan(self,
+                       steps: list[PlanStep],
+                       max_concurrency: int | None = None,
+                       policy: PlanPolicy = PlanPolicy.FAIL_FAST,
+                       ) -> PlanResult:
+        """
+        Runs steps with declared dependencies, independent steps run concurrently.
+        With `PlanPolicy.FAIL_FAST` the first failure cancels the running
+        steps, with `PlanPolicy.CONTINUE_ON_ERROR` only the dependents of
+        the failed step are skipped.
+        """
+        for plan_step in steps:
+            plan_step.step.validate_forbidden(self._command_blacklist)
+        executor = PlanExecutor(self.run, max_concurrency, policy)
+        return await executor.execute(steps)
+
+    def _prepare_step(self, step: CommandStep) -> CommandStep:
         step = replace(step)
         step.validate_forbidden(self._command_blacklist)
         step.env = (self._env_builder
                         .with_extra(step.env or {})
                         .build())
-        return await self._runtime.run(step, on_stdout, on_stderr)
+        if self._policy is not None:
+            self._policy.check(step, self._resolver.resolve(step.command, step.env.get("PATH")))
+        if self._limits is not None:
+            step.limits = self._limits.merge(step.limits)
+        return step
 
 __all__ = [
     "AgentShell",
     "CommandStep",
+    "StepPriority",
+    "StdinSource",
+    "OutputRedirect",
+    "RedirectedOutput",
+    "ResourceLimits",
     "ShellResult",
     "ShellResultStatus",
+    "OutputRetention",
+    "OutputNormalization",
+    "ResultCache",
+    "CommandPolicy",
+    "PolicyRule",
+    "PolicyAction",
+    "CacheRule",
+    "ResultCacheInfo",
+    "TerminationPolicy",
+    "OutputDelivery",
+    "SpawnBackend",
+    "AdmissionPolicy",
+    "OverflowPolicy",
+    "DeliveryStats",
+    "StreamEvent",
+    "StdoutLineEvent",
+    "StderrLineEvent",
+    "ExitEvent",
+    "Pipeline",
+    "PlanStep",
+    "PlanPolicy",
+    "PlanResult",
+    "StepTiming",
+    "set_timing_hook",
 
     "ShellError",
     "ShellRuntimeNotFoundError",
     "ForbiddenShellTargetError",
+    "InvalidPlanError",
+    "InvalidPipelineError",
 ]
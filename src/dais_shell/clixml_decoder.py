@@ -0,0 +1,85 @@
+import re
+import xml.etree.ElementTree as ET
+
+
+CLIXML_HEADER = b"#< CLIXML"
+CLIXML_NAMESPACE = "{http://schemas.microsoft.com/powershell/2004/04}"
+# PowerShell encodes special characters as `_xNNNN_`, including the ANSI escape `_x001B_`
+XML_ESCAPE = re.compile(r"_x([0-9A-Fa-f]{4})_")
+ANSI_COLOR = re.compile(r"\x1b\[[0-9;]*m")
+
+def _unescape(match: re.Match) -> str:
+    return chr(int(match.group(1), 16))
+
+class ClixmlDecoder:
+    """
+    Decodes the CLIXML which PowerShell writes to stderr when it is connected
+    to a pipe, as it is read. The text of the string records, such as errors
+    and warnings, is returned without its color codes, the other records such
+    as progress are dropped. A stream which does not start with the CLIXML
+    header is passed through, so is the rest of a stream which fails to parse.
+    """
+    def __init__(self):
+        # bytes held until the header is recognized
+        self._head = b""
+        self._parser: ET.XMLPullParser | None = None
+        self._passthrough = False
+        self._depth = 0
+        self._root: ET.Element | None = None
+
+    def _detect(self, chunk: bytes) -> bytes | None:
+        """Returns the bytes after the header, or None while it is undecided."""
+        self._head += chunk
+        head = self._head.lstrip()
+        if len(head) < len(CLIXML_HEADER) and CLIXML_HEADER.startswith(head):
+            return None
+        if not head.startswith(CLIXML_HEADER):
+            self._passthrough = True
+            return None
+        self._head = b""
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        return head[len(CLIXML_HEADER):]
+
+    def _read_events(self) -> bytes:
+        assert self._parser is not None
+        parts = []
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._depth == 0: self._root = elem
+                self._depth += 1
+                continue
+            self._depth -= 1
+            if self._depth != 1: continue
+            # a top level record is complete
+            if elem.tag == CLIXML_NAMESPACE + "S" and elem.text:
+                parts.append(ANSI_COLOR.sub("", XML_ESCAPE.sub(_unescape, elem.text)))
+            assert self._root is not None
+            self._root.remove(elem)
+        return "".join(parts).encode("utf-8")
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self._passthrough: return chunk
+        if self._parser is None:
+            rest = self._detect(chunk)
+            if rest is None:
+                if not self._passthrough: return b""
+                head, self._head = self._head, b""
+                return head
+            chunk = rest
+        try:
+            self._parser.feed(chunk)
+            return self._read_events()
+        except ET.ParseError:
+            self._passthrough = True
+            return chunk
+
+    def flush(self) -> bytes:
+        """Returns what is still held back at the end of the stream."""
+        head, self._head = self._head, b""
+        if self._parser is None or self._passthrough: return head
+        try:
+            self._parser.close()
+            return self._read_events()
+        except ET.ParseError:
+            # a truncated document, the complete records were already returned
+            return b""
@@ -0,0 +1,166 @@
+import fnmatch
+import glob
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterable
+from .types import CommandStep, ForbiddenShellTargetError
+from .utils import EnvExpander
+
+
+class PolicyAction(str, Enum):
+    ALLOW = "allow"
+    DENY = "deny"
+
+@dataclass
+class PolicyRule:
+    """
+    Matches a step by the name of its command, a glob on its resolved
+    executable path, or a regular expression searched in its arguments joined
+    by spaces. The conditions which are set must all match. Allowing rules
+    override the denying ones, such as `rm -rf ./build` under a broad `rm -rf`;
+    their pattern must match the whole joined arguments, so that an allowed
+    command line can not carry further arguments.
+    """
+    id: str
+    # matched case-insensitively against the basenames of the command and of its resolved path
+    command: str | None = None
+    path_glob: str | None = None
+    # must not use numbered backreferences, the patterns of a command are combined into one
+    args_pattern: str | None = None
+    action: PolicyAction = PolicyAction.DENY
+
+_GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+def _scoped(pattern: str) -> str:
+    """Turns the leading global flags of a pattern, such as `(?i)`, into a group they apply to."""
+    re.compile(pattern)
+    flags, start = "", 0
+    while match := _GLOBAL_FLAGS.match(pattern, start):
+        flags += match[1]
+        start = match.end()
+    if not flags: return pattern
+    # a trailing comment of a verbose pattern would hide the closing parenthesis
+    end = "\n" if "x" in flags else ""
+    return f"(?{flags}:{pattern[start:]}{end})"
+
+class _Alternation:
+    """One regular expression for many rules, the group which matched tells the rule."""
+    def __init__(self, patterns: list[tuple[PolicyRule, str]]):
+        self._rules = [rule for rule, _ in patterns]
+        self._regex = re.compile("|".join(f"(?P<_r{i}>{_scoped(pattern)})" for i, (_, pattern) in enumerate(patterns))) \
+            if patterns else None
+
+    def _rule(self, match: re.Match | None) -> PolicyRule | None:
+        if match is None or match.lastgroup is None: return None
+        return self._rules[int(match.lastgroup[2:])]
+
+    def fullmatch(self, text: str) -> PolicyRule | None:
+        return self._rule(self._regex.fullmatch(text)) if self._regex is not None else None
+
+    def search(self, text: str) -> PolicyRule | None:
+        return self._rule(self._regex.search(text)) if self._regex is not None else None
+
+class _Bucket:
+    """
+    The rules which share an index key, compiled by the conditions they have left.
+    With `full_args` the argument patterns must match all of the arguments.
+    """
+    def __init__(self, rules: list[PolicyRule], full_args: bool = False):
+        self._full_args = full_args
+        self._plain = next((rule for rule in rules if rule.path_glob is None and rule.args_pattern is None), None)
+        self._paths = _Alternation([(rule, fnmatch.translate(rule.path_glob)) for rule in rules
+                                    if rule.path_glob is not None and rule.args_pattern is None])
+        self._args = _Alternation([(rule, rule.args_pattern) for rule in rules
+                                   if rule.args_pattern is not None and rule.path_glob is None])
+        self._both = [(rule, re.compile(fnmatch.translate(rule.path_glob)), re.compile(rule.args_pattern))
+                      for rule in rules if rule.path_glob is not None and rule.args_pattern is not None]
+
+    def match(self, paths: list[str], args: str) -> PolicyRule | None:
+        if self._plain is not None: return self._plain
+        for path in paths:
+            if rule := self._paths.fullmatch(path): return rule
+        if rule := (self._args.fullmatch(args) if self._full_args else self._args.search(args)): return rule
+        for rule, path_glob, args_pattern in self._both:
+            matched = args_pattern.fullmatch(args) if self._full_args else args_pattern.search(args)
+            if matched and any(path_glob.fullmatch(path) for path in paths):
+                return rule
+        return None
+
+class _Index:
+    """
+    Buckets rules by command name, or by the basename or the directory of
+    their path glob when it is literal, so that a step is only checked against
+    the rules which can apply to it and the generic ones.
+    """
+    def __init__(self, rules: list[PolicyRule], full_args: bool = False):
+        by_name: dict[str, list[PolicyRule]] = defaultdict(list)
+        by_path_name: dict[str, list[PolicyRule]] = defaultdict(list)
+        by_path_dir: dict[str, list[PolicyRule]] = defaultdict(list)
+        generic: list[PolicyRule] = []
+        for rule in rules:
+            if rule.command is not None:
+                by_name[rule.command.lower()].append(rule)
+                continue
+            directory, _, name = (rule.path_glob or "").rpartition("/")
+            if rule.path_glob is None:
+                generic.append(rule)
+            elif not glob.has_magic(name):
+                by_path_name[name].append(rule)
+            elif directory and not glob.has_magic(directory):
+                by_path_dir[directory].append(rule)
+            else:
+                generic.append(rule)
+        self._by_name = {name: _Bucket(bucket, full_args) for name, bucket in by_name.items()}
+        self._by_path_name = {name: _Bucket(bucket, full_args) for name, bucket in by_path_name.items()}
+        self._by_path_dir = {directory: _Bucket(bucket, full_args) for directory, bucket in by_path_dir.items()}
+        self._generic = _Bucket(generic, full_args)
+
+    def match(self, names: set[str], paths: list[str], args: str) -> PolicyRule | None:
+        for name in names:
+            if (bucket := self._by_name.get(name)) and (rule := bucket.match(paths, args)):
+                return rule
+        for path in paths:
+            directory, _, name = path.rpartition("/")
+            for bucket in (self._by_path_name.get(name), self._by_path_dir.get(directory)):
+                if bucket and (rule := bucket.match(paths, args)):
+                    return rule
+        return self._generic.match(paths, args)
+
+class CommandPolicy:
+    """
+    Checks steps against a large set of `PolicyRule`, compiled once into
+    indexes, so that the cost of a check depends on the rules which share
+    the name of the command rather than on the number of rules.
+    """
+    def __init__(self, rules: Iterable[PolicyRule]):
+        rules = list(rules)
+        for rule in rules:
+            if rule.command is None and rule.path_glob is None and rule.args_pattern is None:
+                raise ValueError(f"Policy rule {rule.id} has no condition")
+        self._deny = _Index([rule for rule in rules if rule.action == PolicyAction.DENY])
+        self._allow = _Index([rule for rule in rules if rule.action == PolicyAction.ALLOW], full_args=True)
+
+    def match(self, step: CommandStep, resolved: str | None = None) -> PolicyRule | None:
+        """
+        Returns the rule which denies the step, or None. `resolved` is the
+        executable the command resolves to, None for shell builtins.
+        """
+        names = {os.path.basename(step.command).lower()}
+        paths = []
+        if resolved is not None:
+            paths = list(dict.fromkeys([resolved, os.path.realpath(resolved)]))
+            names.update(os.path.basename(path).lower() for path in paths)
+        expander = EnvExpander(step.env or {})
+        args = " ".join(expander.expand(arg) for arg in step.args)
+        rule = self._deny.match(names, paths, args)
+        if rule is None or self._allow.match(names, paths, args) is not None:
+            return None
+        return rule
+
+    def check(self, step: CommandStep, resolved: str | None = None):
+        """Raises `ForbiddenShellTargetError` naming the rule which denies the step."""
+        if (rule := self.match(step, resolved)) is not None:
+            raise ForbiddenShellTargetError(os.path.basename(step.command), rule.id)
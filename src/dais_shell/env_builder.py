@@ -88,6 +88,10 @@ CONSTANT_VARS = {
 }
 
 class EnvBuilder:
+    # filtered base environments shared by all builders, keyed by blacklist,
+    # together with the `os.environ` content they were computed from
+    _base_cache: dict[frozenset[str] | None, tuple[object, dict, dict[str, str]]] = {}
+
     def __init__(self,
                  blacklist: set[str] | None = None,
                  extra: dict[str, str] | None = None,
@@ -111,7 +115,19 @@ class EnvBuilder:
             extra_paths=self._extra_paths + paths,
         )
 
-    def build(self) -> dict[str, str]:
+    @classmethod
+    def invalidate_cache(cls):
+        """Drops the cached base environments, they are rebuilt on the next `build()`."""
+        cls._base_cache.clear()
+
+    @staticmethod
+    def _environ_data() -> dict:
+        # `os.environ` keeps its content in a plain dict, which is much
+        # cheaper to compare than going through the mapping interface
+        data = getattr(os.environ, "_data", os.environ)
+        return data if isinstance(data, dict) else dict(data)
+
+    def _filter_environ(self) -> dict[str, str]:
         base_env = os.environ.copy()
         final_env = CONSTANT_VARS.copy()
 
@@ -122,9 +138,22 @@ class EnvBuilder:
             # insert essential vars
             if key.upper() in ESSENTIAL_VARS:
                 final_env[key] = var
+        return final_env
+
+    def _base_env(self) -> dict[str, str]:
+        key = frozenset(self._blacklist) if self._blacklist else None
+        environ, data = os.environ, self._environ_data()
+        cached = EnvBuilder._base_cache.get(key)
+        if cached is not None and cached[0] is environ and cached[1] == data:
+            return cached[2]
 
+        base_env = self._filter_environ()
+        EnvBuilder._base_cache[key] = (environ, data.copy(), base_env)
+        return base_env
+
+    def build(self) -> dict[str, str]:
         # insert extra vars
-        final_env.update(self._extra)
+        final_env = {**self._base_env(), **self._extra}
 
         # insert extra paths
         if len(self._extra_paths) > 0:
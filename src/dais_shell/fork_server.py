@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any
+from .output_redirect import RedirectedFile
+from .spawn import SpawnedProcess
+from .types import ShellError
+from . import fork_server_helper
+
+HEADER = fork_server_helper.HEADER
+
+
+class ForkServer:
+    """
+    Spawns steps from a small helper process, started once, instead of forking
+    the current process. Requests are sent over a Unix socket, the helper forks
+    and execs the child and passes its stdout and stderr pipes back with
+    SCM_RIGHTS. The helper reaps the children and reports their exit codes
+    and CPU times.
+    A helper which exited is started again on the next spawn.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sock: socket.socket | None = None
+        self._helper: subprocess.Popen | None = None
+        # replies are in the order of the requests
+        self._pending: deque[Future] = deque()
+        # pid -> exit code and CPU time of the running children
+        self._exits: dict[int, Future] = {}
+
+    def _start(self) -> socket.socket:
+        sock, helper_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        with helper_sock:
+            self._helper = subprocess.Popen(
+                [sys.executable, "-I", "-S", fork_server_helper.__file__, str(helper_sock.fileno())],
+                pass_fds=(helper_sock.fileno(),),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+            )
+        self._sock = sock
+        threading.Thread(target=self._read_replies, args=(sock,), name="dais-fork-server", daemon=True).start()
+        return sock
+
+    def _read_replies(self, sock: socket.socket):
+        buffer = b""
+        fds: deque[int] = deque()
+        try:
+            while True:
+                data, received, _, _ = socket.recv_fds(sock, 65536, 64)
+                fds.extend(received)
+                if not data: break
+                buffer += data
+                while len(buffer) >= HEADER.size and len(buffer) >= HEADER.size + (size := HEADER.unpack_from(buffer)[0]):
+                    self._dispatch(json.loads(buffer[HEADER.size:HEADER.size + size]), fds)
+                    buffer = buffer[HEADER.size + size:]
+        except OSError:
+            pass
+        self._helper_exited(sock)
+
+    def _dispatch(self, message: dict[str, Any], fds: deque[int]):
+        with self._lock:
+            if "exit" in message:
+                if (exited := self._exits.pop(message["exit"], None)) is not None:
+                    exited.set_result((message["code"], message["cpu_time"]))
+                return
+            reply = self._pending.popleft()
+            if "error" in message:
+                reply.set_exception(OSError(message["error"], message["message"]))
+                return
+            # registered before the next message, which may be the exit
+            exited = self._exits[message["pid"]] = Future()
+        pipes = {name: fds.popleft() for name in message["pipes"]}
+        reply.set_result((message["pid"], pipes, exited))
+
+    def _helper_exited(self, sock: socket.socket):
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            sock.close()
+            pending, self._pending = self._pending, deque()
+            exits, self._exits = self._exits, {}
+        for reply in pending:
+            reply.set_exception(ShellError("The fork server exited"))
+        for pid, exited in exits.items():
+            # the children can not be reaped anymore, they are killed instead
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            exited.set_result((-signal.SIGKILL, None))
+
+    async def spawn(self,
+                    cmd: list[str],
+                    cwd: Any,
+                    env: dict[str, str] | None,
+                    stdin_file: str | None = None,
+                    stdin_pipe: bool = False,
+                    stdout_file: RedirectedFile | None = None,
+                    stderr_file: RedirectedFile | None = None,
+                    ) -> SpawnedProcess:
+        """
+        Starts `cmd` in a new session, stdout and stderr are pipes unless they
+        are redirected to a file. Stdin is `stdin_file`, a pipe with `stdin_pipe`,
+        or /dev/null. The helper opens the files.
+        """
+        request = json.dumps({
+            "argv": list(cmd),
+            "cwd": None if cwd is None else os.fspath(cwd),
+            "env": env,
+            "stdin_file": stdin_file,
+            "stdin_pipe": stdin_pipe,
+            "stdout_file": [stdout_file.path, stdout_file.append] if stdout_file is not None else None,
+            "stderr_file": [stderr_file.path, stderr_file.append] if stderr_file is not None else None,
+        }).encode("utf-8")
+        reply: Future = Future()
+        with self._lock:
+            sock = self._sock or self._start()
+            self._pending.append(reply)
+            sock.sendall(HEADER.pack(len(request)) + request)
+        pid, pipes, exited = await asyncio.wrap_future(reply)
+        proc = SpawnedProcess(pid)
+        proc._watch_future(exited)
+        if "stdin" in pipes:
+            proc.stdin = await proc._connect_stdin(pipes["stdin"])
+        if "stdout" in pipes:
+            proc.stdout = await proc._connect(pipes["stdout"])
+        if "stderr" in pipes:
+            proc.stderr = await proc._connect(pipes["stderr"])
+        return proc
+
+    def close(self):
+        """Stops the helper, the children which still run are killed."""
+        with self._lock:
+            sock, helper = self._sock, self._helper
+            self._sock = self._helper = None
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+        if helper is not None:
+            helper.wait()
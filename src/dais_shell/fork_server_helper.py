@@ -0,0 +1,112 @@
+"""
+The spawner process of `ForkServer`, run as a script with the file descriptor
+of its socket as argument. It only imports the standard library, so that it
+stays small. Requests and replies are JSON messages prefixed with their length.
+The pipes of a child, its output pipes unless they are redirected to files and
+the write end of its stdin pipe when one was requested, are passed back with
+its pid, and its exit code and CPU time are reported once it was reaped.
+"""
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+
+HEADER = struct.Struct(">I")
+
+
+def send(sock: socket.socket, message: dict, fds: list[int] | None = None):
+    data = json.dumps(message).encode("utf-8")
+    socket.send_fds(sock, [HEADER.pack(len(data)) + data], fds or [])
+
+
+def open_output(target: list | None):
+    """A `[path, append]` redirect target, or a pipe."""
+    if target is None: return subprocess.PIPE
+    path, append = target
+    flags = os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC | (os.O_APPEND if append else os.O_TRUNC)
+    return os.open(path, flags, 0o666)
+
+
+def spawn(sock: socket.socket, request: dict, children: dict[int, subprocess.Popen]):
+    argv = request["argv"]
+    stdin = subprocess.PIPE if request["stdin_pipe"] else subprocess.DEVNULL
+    # fds opened for the child, closed once it has them
+    opened = []
+    try:
+        if request["stdin_file"] is not None:
+            stdin = os.open(request["stdin_file"], os.O_RDONLY | os.O_CLOEXEC)
+            opened.append(stdin)
+        stdout = open_output(request["stdout_file"])
+        if stdout != subprocess.PIPE: opened.append(stdout)
+        stderr = open_output(request["stderr_file"])
+        if stderr != subprocess.PIPE: opened.append(stderr)
+        # `subprocess` execs from C, with vfork where it can, instead of running Python in the child
+        child = subprocess.Popen(argv, executable=argv[0], cwd=request["cwd"], env=request["env"],
+                                 stdin=stdin, stdout=stdout, stderr=stderr,
+                                 start_new_session=True)
+    except OSError as exc:
+        send(sock, {"error": exc.errno, "message": str(exc)})
+        return
+    finally:
+        for fd in opened:
+            os.close(fd)
+    # kept until it is reaped, so that `subprocess` does not wait for it itself
+    children[child.pid] = child
+    pipes = {name: pipe for name, pipe in (("stdin", child.stdin), ("stdout", child.stdout), ("stderr", child.stderr))
+             if pipe is not None}
+    send(sock, {"pid": child.pid, "pipes": list(pipes)}, [pipe.fileno() for pipe in pipes.values()])
+    for pipe in pipes.values():
+        pipe.close()
+
+
+def reap(sock: socket.socket, children: dict[int, subprocess.Popen]):
+    while True:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0: return
+        code = os.waitstatus_to_exitcode(status)
+        if (child := children.pop(pid, None)) is not None:
+            child.returncode = code
+        send(sock, {"exit": pid, "code": code, "cpu_time": rusage.ru_utime + rusage.ru_stime})
+
+
+def main(fd: int):
+    sock = socket.socket(fileno=fd)
+    # not inherited by the children
+    sock.set_inheritable(False)
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    # a handler is needed for the wakeup fd to receive the signal
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(wakeup_read, selectors.EVENT_READ)
+    children: dict[int, subprocess.Popen] = {}
+    buffer = b""
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is sock:
+                data = sock.recv(65536)
+                if not data: return
+                buffer += data
+                while len(buffer) >= HEADER.size and len(buffer) >= HEADER.size + (size := HEADER.unpack_from(buffer)[0]):
+                    spawn(sock, json.loads(buffer[HEADER.size:HEADER.size + size]), children)
+                    buffer = buffer[HEADER.size + size:]
+            else:
+                os.read(wakeup_read, 512)
+        reap(sock, children)
+
+
+if __name__ == "__main__":
+    try:
+        main(int(sys.argv[1]))
+    except (BrokenPipeError, ConnectionResetError):
+        # the client went away
+        pass
@@ -1,19 +1,60 @@
 import asyncio
+import inspect
+import math
+import os
+import signal
+import time
 import psutil
 from enum import Enum
 from dataclasses import dataclass
-from collections import deque
-from typing import Callable
+from typing import Awaitable, Callable
+from .clixml_decoder import ClixmlDecoder
+from .output_buffer import IOStreamBuffer, LineSplitter, OutputRetention
+from .output_normalizer import OutputNormalizer
+from .output_delivery import CallbackDispatcher, DeliveryStats, OutputDelivery
+from .output_redirect import RedirectedFile, RedirectedOutput
+from .output_spill import SpillFile
+from .pipeline import PipelineProcess
+from .spawn import SpawnedProcess, write_stdin
+from .timing import StepTiming
+from .types import StdinSource
 
 
-IOStreamCallback = Callable[[str], None]
-IOStreamBuffer = deque[str]
+# receives a list of lines instead when the delivery is batched, see `OutputDelivery`
+IOStreamCallback = Callable[[str], None | Awaitable[None]]
+
+# bytes requested from the pipe per read
+CHUNK_SIZE = 256 * 1024
+
+@dataclass
+class TerminationPolicy:
+    """
+    How a step is stopped on timeout or cancellation. The process group of the
+    step receives `signal`, and SIGKILL once `grace_period` seconds passed;
+    with no grace period SIGKILL is sent right away.
+    """
+    signal: int = getattr(signal, "SIGTERM", 15)
+    grace_period: float = 0.0
+    # seconds the output is still read after the process exited, processes
+    # which outlive it may hold the pipes open; the time a callback holds
+    # the reading back under OverflowPolicy.BLOCK is not counted
+    drain_timeout: float = 2.0
+    # the same, after the step was killed
+    kill_drain_timeout: float = 0.1
 
 class IOStreamReaderStatus(str, Enum):
     SUCCESS = "success"
     TIMEOUT = "timeout"
     CANCELED = "canceled"
     ERROR = "error"
+    SKIPPED = "skipped"
+    # ended by one of the step's `ResourceLimits`, see `exceeded_limit`
+    LIMIT_EXCEEDED = "limit_exceeded"
+    # killed after writing no output for the step's `idle_timeout`
+    IDLE_TIMEOUT = "idle_timeout"
+
+class IdleTimeout(Exception):
+    """Raised by `wait_with_deadlines` when the step wrote no output for its idle timeout."""
 
 @dataclass
 class IOStreamReaderResult:
@@ -22,37 +63,258 @@ class IOStreamReaderResult:
     error: Exception | None
     stdout_buf: IOStreamBuffer
     stderr_buf: IOStreamBuffer
+    stdout_spill: SpillFile | None = None
+    stderr_spill: SpillFile | None = None
+    timing: StepTiming | None = None
+    # name of the `ResourceLimits` field which was hit
+    exceeded_limit: str | None = None
+    # set when the callbacks are delivered through `OutputDelivery`
+    stdout_delivery: DeliveryStats | None = None
+    stderr_delivery: DeliveryStats | None = None
+    # returned by the `ResultCache` instead of running the step
+    cached: bool = False
+    # seconds the step waited for the `AdmissionScheduler`, when the shell has one
+    queue_wait: float | None = None
+    # exit codes of the stages of a `Pipeline`, `returncode` is the one of the last stage
+    stage_returncodes: list[int | None] | None = None
+    # set for the streams written to an `OutputRedirect`, only their tail is in the buffers
+    stdout_redirected: RedirectedOutput | None = None
+    stderr_redirected: RedirectedOutput | None = None
+    # CPU seconds used by the step and its reaped children, when the runtime knows them
+    cpu_time: float | None = None
 
     @property
     def stdout(self) -> str:
         """Get the full text of stdout"""
-        return "\n".join(self.stdout_buf)
+        return self.stdout_buf.text
 
     @property
     def stderr(self) -> str:
         """Get the full text of stderr"""
-        return "\n".join(self.stderr_buf)
+        return self.stderr_buf.text
+
+    @staticmethod
+    def _page(spill: SpillFile | None, buf: IOStreamBuffer, start_line: int, count: int) -> list[str]:
+        if spill is not None:
+            return spill.page(start_line, count)
+        # without spilling, only the retained lines can be paged
+        return buf.lines[start_line:start_line + count]
+
+    def stdout_page(self, start_line: int, count: int) -> list[str]:
+        """Get `count` lines of the full stdout starting from `start_line`"""
+        return self._page(self.stdout_spill, self.stdout_buf, start_line, count)
+
+    def stderr_page(self, start_line: int, count: int) -> list[str]:
+        """Get `count` lines of the full stderr starting from `start_line`"""
+        return self._page(self.stderr_spill, self.stderr_buf, start_line, count)
+
+    def close(self):
+        """Removes the spill files, if any."""
+        if self.stdout_spill is not None: self.stdout_spill.close()
+        if self.stderr_spill is not None: self.stderr_spill.close()
+
+    def __enter__(self) -> "IOStreamReaderResult":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+class IOStreamSink:
+    """
+    Receives the chunks read from one stream and passes them on
+    to the spill file, the retained buffer and the line callback.
+    A synchronous callback is called inline unless `delivery` is given,
+    a coroutine function is always delivered through a `CallbackDispatcher`.
+    A `decoder` rewrites the chunks before anything else receives them.
+    A stream written to a `redirect` file is not fed, the sink takes its tail
+    from the file when it is closed.
+    """
+    def __init__(self,
+                 retention: OutputRetention,
+                 callback: IOStreamCallback | None = None,
+                 delivery: OutputDelivery | None = None,
+                 decoder: ClixmlDecoder | None = None,
+                 redirect: RedirectedFile | None = None,
+                 ):
+        self.buffer = IOStreamBuffer(retention)
+        self.redirect = redirect
+        self.redirected: RedirectedOutput | None = None
+        self.spill = SpillFile(retention.spill_dir) if retention.spill_to_disk and redirect is None else None
+        if redirect is not None:
+            # the file has the full output, as the process wrote it
+            callback = decoder = None
+        self._callback = callback
+        self.dispatcher: CallbackDispatcher | None = None
+        if callback is not None and (delivery is not None or inspect.iscoroutinefunction(callback)):
+            self.dispatcher = CallbackDispatcher(callback, delivery or OutputDelivery())
+            self._callback = None
+        normalization = retention.normalization
+        self._normalizer = OutputNormalizer(normalization) if normalization is not None else None
+        self._splitter = LineSplitter(retention.max_line_bytes,
+                                      normalization is not None and normalization.fold_carriage_returns)
+        self._decoder = decoder
+        self.first_chunk_at: float | None = None
+        # also moved on once reading resumes after waiting for the callback
+        self.last_chunk_at: float | None = None
+
+    def _deliver(self, lines: list[bytes]):
+        if self._normalizer is not None:
+            lines = self._normalizer.process(lines)
+            if not lines: return
+        self._emit(lines)
+
+    def _emit(self, lines: list[bytes]):
+        self.buffer.extend(lines)
+        if self._callback:
+            for text in b"\n".join(lines).decode("utf-8", errors="replace").split("\n"):
+                self._callback(text)
+        elif self.dispatcher is not None:
+            self.dispatcher.put(b"\n".join(lines).decode("utf-8", errors="replace").split("\n"))
+
+    def last_output_at(self) -> float | None:
+        if self.dispatcher is not None and self.dispatcher.paused:
+            # the step is blocked on the callback rather than idle
+            return time.monotonic()
+        if self.redirect is not None:
+            return self.redirect.last_write_at()
+        return self.last_chunk_at
+
+    def feed(self, chunk: bytes):
+        if chunk:
+            self.last_chunk_at = time.monotonic()
+            if self.first_chunk_at is None:
+                self.first_chunk_at = self.last_chunk_at
+        if self._decoder is not None:
+            chunk = self._decoder.feed(chunk)
+        self._write(chunk)
+
+    def _write(self, chunk: bytes):
+        if not chunk: return
+        if self.spill is not None:
+            self.spill.write(chunk)
+        if lines := self._splitter.feed(chunk):
+            self._deliver(lines)
+
+    def close(self):
+        if self.redirect is not None:
+            tail, self.redirected = self.redirect.read_tail()
+            self._write(tail)
+        if self._decoder is not None:
+            self._write(self._decoder.flush())
+        if lines := self._splitter.flush():
+            self._deliver(lines)
+        if self._normalizer is not None and (lines := self._normalizer.flush()):
+            self._emit(lines)
+        if self.spill is not None:
+            self.spill.finish()
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+
+    async def finish_delivery(self, cancel: bool = False) -> DeliveryStats | None:
+        if self.dispatcher is None: return None
+        return await self.dispatcher.finish(cancel)
+
+async def wait_with_deadlines(aw: Awaitable,
+                              timing: StepTiming,
+                              sinks: list[IOStreamSink],
+                              timeout: float | None,
+                              soft_timeout: float | None = None,
+                              idle_timeout: float | None = None,
+                              on_soft_timeout: Callable[[], None] | None = None):
+    """
+    Awaits `aw`, raises `asyncio.TimeoutError` past the hard `timeout` and
+    `IdleTimeout` once none of the sinks received output for `idle_timeout`
+    seconds. Past `soft_timeout`, `on_soft_timeout` is called once and the
+    step may still exit by itself before the hard deadline.
+    """
+    if soft_timeout is None and idle_timeout is None:
+        return await asyncio.wait_for(aw, timeout)
+    started = time.monotonic()
+    hard_at = started + timeout if timeout is not None else math.inf
+    soft_at = started + soft_timeout if soft_timeout is not None else math.inf
+    task = asyncio.ensure_future(aw)
+    try:
+        while not task.done():
+            now = time.monotonic()
+            if now >= hard_at:
+                raise asyncio.TimeoutError
+            idle_at = math.inf
+            if idle_timeout is not None:
+                last_output = max([started, *(at for sink in sinks if (at := sink.last_output_at()) is not None)])
+                idle_at = last_output + idle_timeout
+                if now >= idle_at:
+                    raise IdleTimeout
+            if now >= soft_at:
+                timing.mark("soft_deadline")
+                soft_at = math.inf
+                if on_soft_timeout is not None: on_soft_timeout()
+            wakeup = min(hard_at, soft_at, idle_at) - now
+            await asyncio.wait([task], timeout=None if wakeup == math.inf else wakeup)
+        return task.result()
+    finally:
+        if not task.done(): task.cancel()
+
+async def wait_drained(consumers: asyncio.Future, sinks: list[IOStreamSink], timeout: float) -> bool:
+    """
+    Waits up to `timeout` seconds for the consumers, False if they are still
+    reading. While a callback holds the reading back under
+    `OverflowPolicy.BLOCK` the timeout does not run, the output left in the
+    pipes is still delivered.
+    """
+    while True:
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(consumers), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            dispatchers = [sink.dispatcher for sink in sinks if sink.dispatcher is not None]
+            # reading resumes and pauses again as long as the callback is behind
+            if not any(d.paused or (d.paused_at or 0) >= started for d in dispatchers):
+                return False
 
 class IOStreamReader:
     def __init__(self,
-                 proc: asyncio.subprocess.Process,
-                 max_lines: int,
+                 proc: asyncio.subprocess.Process | SpawnedProcess,
+                 retention: OutputRetention,
                  on_stdout: IOStreamCallback | None = None,
                  on_stderr: IOStreamCallback | None = None,
+                 timing: StepTiming | None = None,
+                 termination: TerminationPolicy | None = None,
+                 delivery: OutputDelivery | None = None,
+                 stderr_decoder: ClixmlDecoder | None = None,
+                 stdin: StdinSource | None = None,
+                 stdout_file: RedirectedFile | None = None,
+                 stderr_file: RedirectedFile | None = None,
                  ):
+        """
+        :param stdin: data written to the stdin pipe of the process while its output
+            is read, a file source is connected by `spawn` instead.
+        :param stdout_file: the file stdout was redirected to by `spawn`, the process
+            has no stdout pipe then. The same for `stderr_file`.
+        """
         self._proc = proc
-        self._max_lines = max_lines
+        self._retention = retention
         self._on_stdout = on_stdout
         self._on_stderr = on_stderr
+        self._timing = timing or StepTiming.start()
+        self._termination = termination or TerminationPolicy()
+        self._delivery = delivery
+        self._stderr_decoder = stderr_decoder
+        self._stdin = stdin
+        self._stdout_file = stdout_file
+        self._stderr_file = stderr_file
 
     @staticmethod
-    async def _consumer(stream: asyncio.StreamReader, callback: IOStreamCallback | None, buf: IOStreamBuffer):
-        while not stream.at_eof():
-            line = await stream.readline()
-            if not line: break
-            text = line.decode("utf-8", errors="replace").rstrip("\r\n")
-            buf.append(text)
-            if callback: callback(text)
+    async def _consumer(stream: asyncio.StreamReader, sink: IOStreamSink):
+        try:
+            while chunk := await stream.read(CHUNK_SIZE):
+                sink.feed(chunk)
+                if sink.dispatcher is not None:
+                    # pauses reading while the callback is behind
+                    await sink.dispatcher.wait_writable()
+                    sink.last_chunk_at = time.monotonic()
+        finally:
+            sink.close()
 
     @staticmethod
     def _terminate_process_tree(proc: asyncio.subprocess.Process):
@@ -73,44 +335,175 @@ class IOStreamReader:
             try: proc.kill()
             except Exception: pass
 
-    async def read(self, timeout_sec: int | None = None) -> IOStreamReaderResult:
-        stdout_buf = IOStreamBuffer(maxlen=self._max_lines)
-        stderr_buf = IOStreamBuffer(maxlen=self._max_lines)
+    async def _wait_exit(self) -> int:
+        """
+        Waits for the process to exit. `Process.wait()` also waits for its pipes
+        to be closed, which processes outliving the step may hold open.
+        """
+        wait = asyncio.ensure_future(self._proc.wait())
+        delay = 0.001
+        try:
+            while not wait.done() and self._proc.returncode is None:
+                await asyncio.wait([wait], timeout=delay)
+                delay = min(delay * 2, 0.05)
+        finally:
+            if not wait.done(): wait.cancel()
+        assert self._proc.returncode is not None
+        return self._proc.returncode
 
-        assert self._proc.stdout is not None
-        assert self._proc.stderr is not None
-        consumer_task = [
-            asyncio.create_task(IOStreamReader._consumer(self._proc.stdout, self._on_stdout, stdout_buf)),
-            asyncio.create_task(IOStreamReader._consumer(self._proc.stderr, self._on_stderr, stderr_buf))
-        ]
+    async def _wait_exit_or_input_error(self, stdin_task: asyncio.Task | None) -> int:
+        """Waits for the process to exit, raises the error of the stdin source if it fails first."""
+        if stdin_task is None: return await self._wait_exit()
+        exit_task = asyncio.ensure_future(self._wait_exit())
+        try:
+            await asyncio.wait([exit_task, stdin_task], return_when=asyncio.FIRST_COMPLETED)
+            if not exit_task.done() and (input_error := stdin_task.exception()) is not None:
+                raise input_error
+            return await exit_task
+        finally:
+            if not exit_task.done(): exit_task.cancel()
+
+    def _signal_group(self, sig: int) -> bool:
+        signaled = False
+        # every stage of a pipeline leads a process group
+        for pid in self._proc.pids if isinstance(self._proc, PipelineProcess) else [self._proc.pid]:
+            try:
+                os.killpg(pid, sig)
+                signaled = True
+            except (ProcessLookupError, PermissionError):
+                pass
+        return signaled
+
+    async def _terminate(self) -> int:
+        """
+        Stops the process group of the step, which is the whole tree unless a
+        process started its own session. Falls back to walking the process tree
+        where process groups are not available, or the process does not lead one.
+        """
+        self._timing.mark("killed")
+        if not hasattr(os, "killpg"):
+            self._terminate_process_tree(self._proc)
+            return await self._wait_exit()
+        policy = self._termination
+        try:
+            if policy.grace_period > 0 and self._signal_group(policy.signal):
+                try:
+                    await asyncio.wait_for(self._wait_exit(), policy.grace_period)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # also kills the members of the group which outlive its leader
+            if not self._signal_group(signal.SIGKILL) and self._proc.returncode is None:
+                self._terminate_process_tree(self._proc)
+        return await self._wait_exit()
+
+    def _close_pipes(self):
+        if isinstance(self._proc, SpawnedProcess):
+            self._proc.close_pipes()
+            return
+        transport = getattr(self._proc, "_transport", None)
+        if transport is None: return
+        for fd in (1, 2):
+            if (pipe := transport.get_pipe_transport(fd)) is not None:
+                # the stream receives EOF once the transport is closed
+                pipe.close()
+
+    async def _drain(self, consumers: list[asyncio.Task], sinks: list[IOStreamSink], timeout: float):
+        done = asyncio.gather(*consumers, return_exceptions=True)
+        if await wait_drained(done, sinks, timeout): return
+        self._close_pipes()
+        try:
+            await asyncio.wait_for(done, timeout=1)
+        except asyncio.TimeoutError:
+            for task in consumers: task.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+
+    def _soft_stop(self):
+        if hasattr(os, "killpg"):
+            self._signal_group(self._termination.signal)
+        elif self._proc.returncode is None:
+            self._proc.terminate()
+
+    async def read(self,
+                   timeout_sec: float | None = None,
+                   soft_timeout_sec: float | None = None,
+                   idle_timeout_sec: float | None = None,
+                   ) -> IOStreamReaderResult:
+        """
+        :param soft_timeout_sec: the process group receives the signal of the
+            `TerminationPolicy` past it, and is killed past `timeout_sec`.
+        :param idle_timeout_sec: the process is killed when it writes no output for it.
+        """
+        timing = self._timing
+        stdout_sink = IOStreamSink(self._retention, self._on_stdout, self._delivery,
+                                   redirect=self._stdout_file)
+        stderr_sink = IOStreamSink(self._retention, self._on_stderr, self._delivery,
+                                   self._stderr_decoder, self._stderr_file)
+
+        consumer_task = []
+        for stream, sink in ((self._proc.stdout, stdout_sink), (self._proc.stderr, stderr_sink)):
+            if sink.redirect is None:
+                assert stream is not None
+                consumer_task.append(asyncio.create_task(IOStreamReader._consumer(stream, sink)))
+        stdin_task = None
+        if self._stdin is not None and self._proc.stdin is not None:
+            stdin_task = asyncio.create_task(write_stdin(self._proc.stdin, self._stdin))
 
         status = IOStreamReaderStatus.SUCCESS
         error: Exception | None = None
         try:
-            if timeout_sec is not None:
-                returncode = await asyncio.wait_for(self._proc.wait(), timeout=timeout_sec)
-            else:
-                returncode = await self._proc.wait()
+            returncode = await wait_with_deadlines(self._wait_exit_or_input_error(stdin_task),
+                                                   timing, [stdout_sink, stderr_sink],
+                                                   timeout_sec, soft_timeout_sec, idle_timeout_sec,
+                                                   self._soft_stop)
+            if timing.soft_deadline is not None:
+                status = IOStreamReaderStatus.TIMEOUT
         except asyncio.TimeoutError:
-            self._terminate_process_tree(self._proc)
-            returncode = await self._proc.wait()
+            returncode = await self._terminate()
             status = IOStreamReaderStatus.TIMEOUT
+        except IdleTimeout:
+            returncode = await self._terminate()
+            status = IOStreamReaderStatus.IDLE_TIMEOUT
         except asyncio.CancelledError:
-            self._terminate_process_tree(self._proc)
-            returncode = await self._proc.wait()
+            returncode = await self._terminate()
             status = IOStreamReaderStatus.CANCELED
         except Exception as exc:
-            self._terminate_process_tree(self._proc)
-            returncode = await self._proc.wait()
+            returncode = await self._terminate()
             status = IOStreamReaderStatus.ERROR
             error = exc
         finally:
-            try:
-                await asyncio.wait_for(
-                    asyncio.gather(*consumer_task, return_exceptions=True),
-                    timeout=2)
-            except asyncio.TimeoutError:
-                for task in consumer_task: task.cancel()
-                await asyncio.gather(*consumer_task, return_exceptions=True)
-
-        return IOStreamReaderResult(returncode, status, error, stdout_buf, stderr_buf)
+            timing.mark("exited")
+            if stdin_task is not None:
+                # the rest of the input can not be read anymore
+                stdin_task.cancel()
+                input_error, = await asyncio.gather(stdin_task, return_exceptions=True)
+                if self._proc.stdin is not None: self._proc.stdin.close()
+                if isinstance(input_error, Exception) and status == IOStreamReaderStatus.SUCCESS:
+                    # the source failed as the step exited
+                    status = IOStreamReaderStatus.ERROR
+                    error = input_error
+            killed = timing.killed is not None
+            policy = self._termination
+            canceled = status == IOStreamReaderStatus.CANCELED
+            if canceled:
+                # drops the queued output first, the consumers may wait for the callbacks
+                await asyncio.gather(stdout_sink.finish_delivery(True), stderr_sink.finish_delivery(True))
+            await self._drain(consumer_task, [stdout_sink, stderr_sink],
+                              policy.kill_drain_timeout if killed else policy.drain_timeout)
+            for sink in (stdout_sink, stderr_sink):
+                if sink.redirect is not None: sink.close()
+            stdout_delivery, stderr_delivery = await asyncio.gather(
+                stdout_sink.finish_delivery(canceled),
+                stderr_sink.finish_delivery(canceled))
+            timing.mark("drained")
+            timing.first_stdout = stdout_sink.first_chunk_at
+            timing.first_stderr = stderr_sink.first_chunk_at
+
+        return IOStreamReaderResult(returncode, status, error,
+                                    stdout_sink.buffer, stderr_sink.buffer,
+                                    stdout_sink.spill, stderr_sink.spill,
+                                    timing,
+                                    stdout_delivery=stdout_delivery,
+                                    stderr_delivery=stderr_delivery,
+                                    stdout_redirected=stdout_sink.redirected,
+                                    stderr_redirected=stderr_sink.redirected)
@@ -0,0 +1,261 @@
+from dataclasses import dataclass
+from collections import deque
+from typing import Iterable, Iterator
+from .output_normalizer import OutputNormalization
+
+
+@dataclass
+class OutputRetention:
+    """
+    How much output of each stream is kept in memory. The first `head_bytes`
+    and the last `tail_bytes` are retained, lines longer than
+    `max_line_bytes` are split into several lines.
+    """
+    head_bytes: int = 64 * 1024
+    tail_bytes: int = 1024 * 1024
+    max_line_bytes: int = 64 * 1024
+    # optional bound on the number of retained tail lines
+    max_lines: int | None = None
+    # also write the full stream to a temporary file, see `SpillFile`
+    spill_to_disk: bool = False
+    spill_dir: str | None = None
+    # rewrites progress frames, escapes and repeated lines before they are retained
+    normalization: OutputNormalization | None = None
+
+class IOStreamBuffer:
+    """
+    Keeps the head and the tail of a stream as raw bytes lines, within the
+    byte budgets of `OutputRetention`. Lines are only decoded when the buffer
+    is read, the decoded text is cached until the next write.
+    """
+    def __init__(self, retention: OutputRetention | None = None):
+        self._retention = retention or OutputRetention(head_bytes=0, tail_bytes=2 ** 63, max_line_bytes=2 ** 63)
+        self._head: list[bytes] = []
+        self._head_size = 0
+        self._head_closed = self._retention.head_bytes <= 0
+        # the tail is kept as whole batches so that eviction does not cost a
+        # Python step per line, it may exceed its budget by one batch until
+        # it is trimmed on read
+        self._tail: deque[list[bytes]] = deque()
+        self._batch_sizes: deque[int] = deque()
+        self._tail_size = 0
+        self._tail_lines = 0
+        self._dropped_bytes = 0
+        self._dropped_lines = 0
+        self._text: str | None = None
+
+    @staticmethod
+    def _size(lines: list[bytes]) -> int:
+        # counts the newline which terminates each line; the lengths are
+        # summed in C without copying the data, as a join would
+        return sum(map(len, lines)) + len(lines)
+
+    def _fill_head(self, lines: list[bytes]) -> list[bytes]:
+        """Moves lines into the head while they fit, returns the rest."""
+        taken = 0
+        for line in lines:
+            size = len(line) + 1
+            if self._head_size + size > self._retention.head_bytes:
+                self._head_closed = True
+                break
+            self._head_size += size
+            taken += 1
+        self._head.extend(lines[:taken])
+        return lines[taken:]
+
+    def _over_budget(self, size: int, count: int) -> bool:
+        max_lines = self._retention.max_lines
+        return size > self._retention.tail_bytes or (max_lines is not None and count > max_lines)
+
+    def _drop_batch(self):
+        batch = self._tail.popleft()
+        size = self._batch_sizes.popleft()
+        self._tail_size -= size
+        self._tail_lines -= len(batch)
+        self._dropped_bytes += size
+        self._dropped_lines += len(batch)
+
+    def _trim(self):
+        """Trims the oldest tail batch so that the tail fits its budget exactly."""
+        if not self._tail or not self._over_budget(self._tail_size, self._tail_lines): return
+        batch = self._tail[0]
+        cut = 0
+        while cut < len(batch) and self._over_budget(self._tail_size, self._tail_lines):
+            size = len(batch[cut]) + 1
+            self._tail_size -= size
+            self._tail_lines -= 1
+            self._dropped_bytes += size
+            self._dropped_lines += 1
+            cut += 1
+        self._batch_sizes[0] -= self._size(batch[:cut])
+        del batch[:cut]
+
+    def append(self, line: bytes):
+        self.extend([line])
+
+    def extend(self, lines: Iterable[bytes]):
+        lines = list(lines)
+        self._text = None
+        if not self._head_closed:
+            lines = self._fill_head(lines)
+        if not lines: return
+
+        size = self._size(lines)
+        self._tail.append(lines)
+        self._batch_sizes.append(size)
+        self._tail_size += size
+        self._tail_lines += len(lines)
+        while len(self._tail) > 1:
+            remaining_size = self._tail_size - self._batch_sizes[0]
+            if not self._over_budget(remaining_size, self._tail_lines - len(self._tail[0])):
+                break
+            self._drop_batch()
+
+    def clear(self):
+        self._head.clear()
+        self._head_size = 0
+        self._head_closed = self._retention.head_bytes <= 0
+        self._tail.clear()
+        self._batch_sizes.clear()
+        self._tail_size = 0
+        self._tail_lines = 0
+        self._dropped_bytes = 0
+        self._dropped_lines = 0
+        self._text = None
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Number of bytes between the head and the tail which are not retained."""
+        self._trim()
+        return self._dropped_bytes
+
+    @property
+    def dropped_lines(self) -> int:
+        """Number of lines between the head and the tail which are not retained."""
+        self._trim()
+        return self._dropped_lines
+
+    def _retained(self) -> list[bytes]:
+        self._trim()
+        lines = list(self._head)
+        if self._dropped_lines:
+            lines.append(f"... {self._dropped_lines} lines ({self._dropped_bytes} bytes) omitted ...".encode())
+        for batch in self._tail:
+            lines.extend(batch)
+        return lines
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            # b"\n" never appears inside a multibyte UTF-8 sequence,
+            # so decoding the joined lines equals decoding them one by one
+            self._text = b"\n".join(self._retained()).decode("utf-8", errors="replace")
+        return self._text
+
+    @property
+    def lines(self) -> list[str]:
+        return self.text.split("\n") if len(self) else []
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.lines)
+
+    def __len__(self) -> int:
+        self._trim()
+        return len(self._head) + self._tail_lines + (1 if self._dropped_lines else 0)
+
+    def __repr__(self) -> str:
+        return f"IOStreamBuffer({self.lines!r})"
+
+class LineSplitter:
+    """
+    Splits chunks of a byte stream into lines without the line endings,
+    a line spanning multiple chunks is emitted once it is complete, and
+    lines longer than `max_line_bytes` are emitted in pieces. With
+    `fold_carriage_returns`, only the text after the last `\r` of a line
+    is kept, and the overwritten frames are not held in memory.
+    """
+    def __init__(self, max_line_bytes: int | None = None, fold_carriage_returns: bool = False):
+        self._max_line_bytes = max_line_bytes
+        self._fold = fold_carriage_returns
+        self._pending: list[bytes] = []
+        self._pending_size = 0
+
+    def _split_long(self, line: bytes) -> list[bytes]:
+        assert self._max_line_bytes is not None
+        limit = self._max_line_bytes
+        pieces = []
+        start = 0
+        while len(line) - start > limit:
+            end = start + limit
+            # do not cut through a multibyte UTF-8 sequence
+            while end > start + limit - 3 and (line[end] & 0xC0) == 0x80:
+                end -= 1
+            pieces.append(line[start:end])
+            start = end
+        pieces.append(line[start:])
+        return pieces
+
+    def _split(self, data: bytes) -> list[bytes]:
+        fold = False
+        if b"\r" in data:
+            data = data.replace(b"\r\n", b"\n")
+            if data.endswith(b"\r"): data = data[:-1]
+            fold = self._fold and b"\r" in data
+        lines = data.split(b"\n")
+        if fold:
+            lines = [line[line.rfind(b"\r") + 1:] for line in lines]
+        if self._max_line_bytes is not None and max(map(len, lines)) > self._max_line_bytes:
+            lines = [piece for line in lines for piece in self._split_long(line)]
+        return lines
+
+    def _take_pending(self) -> bytes:
+        data = b"".join(self._pending)
+        self._pending.clear()
+        self._pending_size = 0
+        return data
+
+    def _fold_pending(self, data: bytes) -> bytes:
+        """Drops the frames which `data` overwrites, `data` does not contain a newline."""
+        if self._pending and self._pending[-1].endswith(b"\r"):
+            # the `\r` is not part of a `\r\n`
+            self._take_pending()
+        # a final `\r` may still be followed by `\n`
+        cut = data.rfind(b"\r", 0, len(data) - 1)
+        if cut >= 0:
+            self._take_pending()
+            data = data[cut + 1:]
+        return data
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            if self._fold:
+                chunk = self._fold_pending(chunk)
+            self._pending.append(chunk)
+            self._pending_size += len(chunk)
+            if self._max_line_bytes is not None and self._pending_size > self._max_line_bytes:
+                # emits the complete pieces of an overlong line right away
+                # instead of holding it in memory until its end
+                pieces = self._split_long(self._take_pending())
+                last = pieces.pop()
+                self._pending.append(last)
+                self._pending_size = len(last)
+                return pieces
+            return []
+        if self._pending:
+            self._pending.append(chunk[:end])
+            data = self._take_pending()
+        else:
+            data = chunk[:end]
+        if end + 1 < len(chunk):
+            tail = chunk[end + 1:]
+            if self._fold and b"\r" in tail:
+                tail = self._fold_pending(tail)
+            self._pending.append(tail)
+            self._pending_size = len(tail)
+        return self._split(data)
+
+    def flush(self) -> list[bytes]:
+        """Returns the trailing line which is not terminated by a newline."""
+        if not self._pending: return []
+        return self._split(self._take_pending())
@@ -0,0 +1,211 @@
+import asyncio
+import inspect
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable
+
+
+class OverflowPolicy(str, Enum):
+    # reading pauses until the callback catches up, which blocks the process once the pipe is full
+    BLOCK = "block"
+    # the oldest queued lines are dropped
+    DROP_OLDEST = "drop_oldest"
+    # the queued lines are replaced by the newest ones, preceded by a line telling how many were skipped
+    COALESCE = "coalesce"
+
+@dataclass
+class OutputDelivery:
+    """
+    How output callbacks are delivered. Lines are queued by the reader and
+    delivered by a separate task, so a slow callback does not stall reading.
+    With `batch_lines` or `batch_interval` set, callbacks receive lists of lines,
+    coalesced until `batch_lines` lines are queued or `batch_interval` seconds
+    passed since the oldest one.
+    """
+    batch_lines: int | None = None
+    batch_interval: float | None = None
+    max_queued_lines: int = 10000
+    overflow: OverflowPolicy = OverflowPolicy.BLOCK
+    # seconds the result waits for the queued lines after the stream ended,
+    # the lines which are not delivered by then are dropped
+    flush_timeout: float | None = 5.0
+
+    @property
+    def batched(self) -> bool:
+        return self.batch_lines is not None or self.batch_interval is not None
+
+@dataclass
+class DeliveryStats:
+    delivered_lines: int = 0
+    dropped_lines: int = 0
+    deliveries: int = 0
+    # seconds from reading a line until its delivery started
+    max_lag: float = 0.0
+    total_lag: float = 0.0
+    error: Exception | None = None
+
+    @property
+    def mean_lag(self) -> float:
+        return self.total_lag / self.deliveries if self.deliveries else 0.0
+
+class CallbackDispatcher:
+    """
+    Delivers the lines of one stream to its callback from a separate task
+    through a bounded queue. The callback may be a coroutine function.
+    """
+    def __init__(self, callback: Callable[[Any], Any], delivery: OutputDelivery):
+        self._callback = callback
+        self._delivery = delivery
+        # (time the lines were read, lines)
+        self._queue: deque[tuple[float, list[str]]] = deque()
+        self._queued_lines = 0
+        # lines dropped by COALESCE since the last delivery
+        self._skipped = 0
+        self._closed = False
+        self._finished = False
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        # the last time reading was paused for the callback
+        self.paused_at: float | None = None
+        self.stats = DeliveryStats()
+        self._task = asyncio.create_task(self._run())
+
+    def put(self, lines: list[str]):
+        if self.stats.error is not None or self._finished:
+            self.stats.dropped_lines += len(lines)
+            return
+        self._queue.append((time.monotonic(), lines))
+        self._queued_lines += len(lines)
+        overflow = self._queued_lines - self._delivery.max_queued_lines
+        if overflow > 0:
+            if self._delivery.overflow == OverflowPolicy.BLOCK:
+                self._writable.clear()
+                self.paused_at = time.monotonic()
+            else:
+                self._drop_oldest(overflow)
+        self._readable.set()
+
+    def _drop_oldest(self, count: int):
+        dropped = 0
+        while dropped < count:
+            _, lines = self._queue[0]
+            if len(lines) <= count - dropped:
+                self._queue.popleft()
+                dropped += len(lines)
+            else:
+                del lines[:count - dropped]
+                dropped = count
+        self._queued_lines -= dropped
+        self.stats.dropped_lines += dropped
+        if self._delivery.overflow == OverflowPolicy.COALESCE:
+            self._skipped += dropped
+
+    @property
+    def paused(self) -> bool:
+        """Whether reading waits for the callback to catch up."""
+        return not self._writable.is_set()
+
+    async def wait_writable(self):
+        if not self._writable.is_set():
+            await self._writable.wait()
+
+    def _take(self, limit: int | None) -> tuple[float, list[str]]:
+        read_at = self._queue[0][0]
+        lines: list[str] = []
+        while self._queue and (limit is None or len(lines) < limit):
+            _, batch = self._queue[0]
+            if limit is not None and len(lines) + len(batch) > limit:
+                taken = limit - len(lines)
+                lines.extend(batch[:taken])
+                del batch[:taken]
+                break
+            self._queue.popleft()
+            lines.extend(batch)
+        self._queued_lines -= len(lines)
+        if self._queued_lines <= self._delivery.max_queued_lines:
+            self._writable.set()
+        if self._skipped:
+            lines.insert(0, f"... {self._skipped} lines skipped ...")
+            self._skipped = 0
+        return read_at, lines
+
+    async def _wait_batch(self):
+        """Waits until a batch is complete, or the window of its oldest line passed."""
+        delivery = self._delivery
+        while not self._closed and (delivery.batch_lines is None or self._queued_lines < delivery.batch_lines):
+            if delivery.batch_interval is None:
+                self._readable.clear()
+                await self._readable.wait()
+                continue
+            remaining = self._queue[0][0] + delivery.batch_interval - time.monotonic()
+            if remaining <= 0: return
+            self._readable.clear()
+            try:
+                await asyncio.wait_for(self._readable.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def _call(self, value):
+        result = self._callback(value)
+        if inspect.isawaitable(result):
+            await result
+
+    async def _run(self):
+        delivery = self._delivery
+        while True:
+            if not self._queue:
+                if self._closed: return
+                self._readable.clear()
+                await self._readable.wait()
+                continue
+            if delivery.batched:
+                await self._wait_batch()
+            read_at, lines = self._take(delivery.batch_lines if delivery.batched else None)
+            lag = time.monotonic() - read_at
+            self.stats.deliveries += 1
+            self.stats.total_lag += lag
+            self.stats.max_lag = max(self.stats.max_lag, lag)
+            try:
+                if delivery.batched:
+                    await self._call(lines)
+                else:
+                    for line in lines:
+                        await self._call(line)
+            except Exception as exc:
+                # the rest of the output is dropped instead of blocking the reader
+                self.stats.error = exc
+                self.stats.dropped_lines += self._queued_lines
+                self._queue.clear()
+                self._queued_lines = 0
+                self._writable.set()
+                return
+            self.stats.delivered_lines += len(lines)
+
+    def close(self):
+        """No more lines are put, the queued ones are still delivered."""
+        self._closed = True
+        self._readable.set()
+
+    async def finish(self, cancel: bool = False) -> DeliveryStats:
+        """Waits for the queued lines up to `flush_timeout`, or drops them if `cancel` is set."""
+        self.close()
+        if not cancel:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), self._delivery.flush_timeout)
+            except asyncio.TimeoutError:
+                pass
+            except Exception:
+                pass
+        if not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.stats.dropped_lines += self._queued_lines
+        self._queue.clear()
+        self._queued_lines = 0
+        # lines put afterwards are dropped, and the reader is not held back anymore
+        self._finished = True
+        self._writable.set()
+        return self.stats
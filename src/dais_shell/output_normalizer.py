@@ -0,0 +1,70 @@
+import re
+from dataclasses import dataclass
+
+
+# CSI sequences, OSC sequences terminated by BEL or ST, and two-byte escapes
+ANSI_ESCAPE = re.compile(rb"\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]")
+NUMBER = re.compile(rb"\d+")
+
+@dataclass
+class OutputNormalization:
+    """
+    Rewrites the output before it is retained and passed to callbacks,
+    the spill file still receives the raw stream.
+    """
+    # keeps only the last frame of lines redrawn with `\r`, such as progress bars
+    fold_carriage_returns: bool = True
+    strip_ansi: bool = True
+    # collapses runs of identical lines into their last line and a repeat count
+    collapse_repeats: bool = True
+    # also treats lines which only differ in their numbers as identical
+    collapse_similar: bool = False
+
+class OutputNormalizer:
+    """
+    Applies `OutputNormalization` to complete lines, carriage returns are folded
+    by the `LineSplitter`. The last line of a run of repeats is held back until
+    a different line arrives or the stream is flushed.
+    """
+    def __init__(self, normalization: OutputNormalization):
+        self._normalization = normalization
+        self._run_line: bytes | None = None
+        self._run_key: bytes | None = None
+        self._run_count = 0
+
+    def _key(self, line: bytes) -> bytes:
+        return NUMBER.sub(b"#", line) if self._normalization.collapse_similar else line
+
+    def _run_output(self) -> bytes:
+        assert self._run_line is not None
+        if self._run_count == 1: return self._run_line
+        return b"%s [repeated %d times]" % (self._run_line, self._run_count)
+
+    def _collapse(self, lines: list[bytes]) -> list[bytes]:
+        output = []
+        for line in lines:
+            key = self._key(line)
+            if key == self._run_key:
+                self._run_line = line
+                self._run_count += 1
+                continue
+            if self._run_line is not None:
+                output.append(self._run_output())
+            self._run_line, self._run_key, self._run_count = line, key, 1
+        return output
+
+    def process(self, lines: list[bytes]) -> list[bytes]:
+        if self._normalization.strip_ansi:
+            data = b"\n".join(lines)
+            if b"\x1b" in data:
+                lines = ANSI_ESCAPE.sub(b"", data).split(b"\n")
+        if self._normalization.collapse_repeats:
+            lines = self._collapse(lines)
+        return lines
+
+    def flush(self) -> list[bytes]:
+        """Returns the held back line of the current run."""
+        if self._run_line is None: return []
+        output = [self._run_output()]
+        self._run_line, self._run_key, self._run_count = None, None, 0
+        return output
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, NamedTuple
+from .types import CommandStep, OutputRedirect
+
+# bytes read back from the end of a redirect file at most
+TAIL_MAX_BYTES = 1024 * 1024
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+class RedirectedOutput(NamedTuple):
+    path: str
+    # bytes the step wrote to the file
+    size: int
+
+@dataclass
+class RedirectedFile:
+    """An `OutputRedirect` resolved against the cwd of its step."""
+    path: str
+    append: bool
+    tail_lines: int
+    # size of the file before the step, its output starts there
+    offset: int = 0
+
+    @classmethod
+    def resolve(cls, redirect: OutputRedirect | None, cwd: Any) -> "RedirectedFile | None":
+        if redirect is None: return None
+        path = os.path.join(os.path.abspath(cwd if cwd is not None else "."), os.fspath(redirect.path))
+        offset = 0
+        if redirect.append:
+            try:
+                offset = os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+        return cls(path, redirect.append, redirect.tail_lines, offset)
+
+    def open(self) -> int:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC | (os.O_APPEND if self.append else os.O_TRUNC)
+        return os.open(self.path, flags, 0o666)
+
+    def read_tail(self) -> tuple[bytes, RedirectedOutput]:
+        """Reads back the last lines the step wrote, with the size of its output."""
+        try:
+            with open(self.path, "rb") as file:
+                end = size = os.fstat(file.fileno()).st_size
+                data = b""
+                # one newline more than the lines, the output may end with one
+                while end > self.offset and data.count(b"\n") <= self.tail_lines and len(data) < TAIL_MAX_BYTES:
+                    start = max(self.offset, end - TAIL_BLOCK_SIZE)
+                    file.seek(start)
+                    data = file.read(end - start) + data
+                    end = start
+        except FileNotFoundError:
+            return b"", RedirectedOutput(self.path, 0)
+        lines = data.removesuffix(b"\n").split(b"\n")[-self.tail_lines:] if data and self.tail_lines > 0 else []
+        tail = b"".join(line + b"\n" for line in lines)
+        return tail, RedirectedOutput(self.path, max(0, size - self.offset))
+
+    def last_write_at(self) -> float | None:
+        """When the file was last written, as a `time.monotonic()` timestamp."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        return time.monotonic() - max(0.0, time.time() - mtime)
+
+def resolve_redirects(step: CommandStep) -> tuple[RedirectedFile | None, RedirectedFile | None]:
+    return (RedirectedFile.resolve(step.stdout_redirect, step.cwd),
+            RedirectedFile.resolve(step.stderr_redirect, step.cwd))
+
+@contextmanager
+def subprocess_output(file: RedirectedFile | None) -> Iterator[Any]:
+    """The `stdout` or `stderr` argument of `asyncio.create_subprocess_exec`, a file is closed once the child has it."""
+    if file is None:
+        yield asyncio.subprocess.PIPE
+        return
+    fd = file.open()
+    try:
+        yield fd
+    finally:
+        os.close(fd)
@@ -0,0 +1,101 @@
+import bisect
+import mmap
+import os
+import tempfile
+import weakref
+
+
+def _remove_spill(file, mapping: "list[mmap.mmap]", path: str):
+    if not file.closed: file.close()
+    for mm in mapping: mm.close()
+    mapping.clear()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class SpillFile:
+    """
+    Captures the full content of a stream in a temporary file, and reads it
+    back by line ranges through a memory mapping without loading the file.
+    A sparse line index is recorded while writing, one entry per `CHECKPOINT_BYTES`.
+    The file is removed by `close()`, or when the object is garbage collected.
+    """
+    CHECKPOINT_BYTES = 1024 * 1024
+
+    def __init__(self, directory: str | None = None):
+        fd, self.path = tempfile.mkstemp(prefix="dais-shell-", suffix=".log", dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._size = 0
+        self._newlines = 0
+        self._ends_with_newline = True
+        # (offset, line number) pairs where a line starts
+        self._checkpoints: list[tuple[int, int]] = [(0, 0)]
+        self._mapping: list[mmap.mmap] = []
+        self._finalizer = weakref.finalize(self, _remove_spill, self._file, self._mapping, self.path)
+
+    def write(self, chunk: bytes):
+        if not chunk: return
+        self._file.write(chunk)
+        if self._size - self._checkpoints[-1][0] >= self.CHECKPOINT_BYTES:
+            first = chunk.find(b"\n")
+            if first >= 0:
+                self._checkpoints.append((self._size + first + 1, self._newlines + 1))
+        self._newlines += chunk.count(b"\n")
+        self._size += len(chunk)
+        self._ends_with_newline = chunk.endswith(b"\n")
+
+    def finish(self):
+        """Flushes the written content, the file can be paged afterwards."""
+        if not self._file.closed: self._file.close()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def line_count(self) -> int:
+        return self._newlines + (0 if self._ends_with_newline else 1)
+
+    def _mmap(self) -> mmap.mmap:
+        if not self._mapping:
+            self.finish()
+            with open(self.path, "rb") as file:
+                self._mapping.append(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._mapping[0]
+
+    def page(self, start_line: int, count: int) -> list[str]:
+        """Returns up to `count` lines starting from the zero-based `start_line`."""
+        if start_line < 0 or count < 0:
+            raise ValueError("start_line and count must not be negative")
+        if self._size == 0 or start_line >= self.line_count or count == 0:
+            return []
+        if not self._finalizer.alive:
+            raise ValueError("spill file is closed")
+
+        mm = self._mmap()
+        index = bisect.bisect_right(self._checkpoints, start_line, key=lambda c: c[1]) - 1
+        offset, line = self._checkpoints[index]
+        while line < start_line:
+            offset = mm.find(b"\n", offset) + 1
+            line += 1
+
+        lines = []
+        while len(lines) < count and offset < self._size:
+            end = mm.find(b"\n", offset)
+            if end < 0: end = self._size
+            raw = mm[offset:end]
+            if raw.endswith(b"\r"): raw = raw[:-1]
+            lines.append(raw.decode("utf-8", errors="replace"))
+            offset = end + 1
+        return lines
+
+    def close(self):
+        """Removes the spill file."""
+        self._finalizer()
+
+    def __enter__(self) -> "SpillFile":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import signal
+from dataclasses import dataclass
+from .output_redirect import RedirectedFile
+from .spawn import SpawnedProcess, limited_command, stdin_path
+from .types import CommandStep, InvalidPipelineError
+
+
+@dataclass
+class Pipeline:
+    """
+    Steps whose stdout is connected to the stdin of the next one by a pipe,
+    as `cmd1 | cmd2` in a shell. Only the stdout of the last stage is read,
+    the stages share one stderr pipe, which is the stderr of the result; the
+    lines of the stages are interleaved as they are written. The timeouts
+    apply to the whole pipeline, those of the stages are not used. Only the
+    stdout of the last stage can be redirected to a file.
+    """
+    stages: list[CommandStep]
+    timeout: float | None = None
+    soft_timeout: float | None = None
+    idle_timeout: float | None = None
+
+    def __post_init__(self):
+        if not self.stages:
+            raise InvalidPipelineError("a pipeline needs at least one stage")
+        if any(stage.stdin is not None for stage in self.stages[1:]):
+            raise InvalidPipelineError("only the first stage can have a stdin source")
+        if any(stage.stdout_redirect is not None for stage in self.stages[:-1]):
+            raise InvalidPipelineError("only the last stage can redirect its stdout")
+        if any(stage.stderr_redirect is not None for stage in self.stages):
+            raise InvalidPipelineError("the stages share their stderr, it can not be redirected")
+
+class PipelineProcess(SpawnedProcess):
+    """
+    The stages of a pipeline as one process for `IOStreamReader`. Each stage
+    leads its own process group, which are all signaled together. The exit
+    code is the one of the last stage, as in a shell.
+    """
+    def __init__(self, stages: list[asyncio.subprocess.Process]):
+        super().__init__(stages[0].pid)
+        self.stages = stages
+        self._waiter = asyncio.ensure_future(self._wait_stages())
+
+    async def _wait_stages(self):
+        for stage in self.stages:
+            await stage.wait()
+        self._set_code(self.stages[-1].returncode)
+
+    @property
+    def pids(self) -> list[int]:
+        return [stage.pid for stage in self.stages]
+
+    @property
+    def returncodes(self) -> list[int | None]:
+        return [stage.returncode for stage in self.stages]
+
+    def send_signal(self, sig: int):
+        for stage in self.stages:
+            if stage.returncode is None:
+                stage.send_signal(sig)
+
+async def spawn_pipeline(stages: list[tuple[list[str], CommandStep]],
+                         stdout_file: RedirectedFile | None = None,
+                         shell: str | None = None,
+                         ) -> PipelineProcess:
+    """
+    Starts the commands of the stages, each in a new session, connected by
+    pipes which the parent does not read. The stdin source of the first stage
+    is connected as `spawn` does, the last stage writes to `stdout_file` if given.
+    Stages with limits are run through `limited_command` with `shell`.
+    """
+    first = stages[0][1]
+    stdin_write = None
+    if (path := stdin_path(first.stdin, first.cwd)) is not None:
+        stage_stdin = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    elif first.stdin is not None:
+        stage_stdin, stdin_write = os.pipe()
+    else:
+        stage_stdin = os.open(os.devnull, os.O_RDONLY | os.O_CLOEXEC)
+    stdout_read, stdout_write = os.pipe() if stdout_file is None else (None, stdout_file.open())
+    stderr_read, stderr_write = os.pipe()
+    procs: list[asyncio.subprocess.Process] = []
+    next_stdin = None
+    try:
+        for index, (cmd, step) in enumerate(stages):
+            next_stdin, stage_stdout = (None, stdout_write) if index == len(stages) - 1 else os.pipe()
+            if rlimits := step.limits.rlimits() if step.limits is not None else []:
+                cmd = limited_command(cmd, step.cwd, rlimits, shell, step.env)
+            try:
+                procs.append(await asyncio.create_subprocess_exec(
+                    *cmd,
+                    cwd=step.cwd,
+                    env=step.env,
+                    stdin=stage_stdin,
+                    stdout=stage_stdout,
+                    stderr=stderr_write,
+                    start_new_session=True,
+                ))
+            finally:
+                # the children hold their ends, a pipe sees EOF once its writer exits
+                os.close(stage_stdin)
+                if stage_stdout != stdout_write: os.close(stage_stdout)
+            stage_stdin = next_stdin
+    except BaseException:
+        for started in procs:
+            try:
+                os.killpg(started.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        for fd in (next_stdin, stdin_write, stdout_read, stderr_read):
+            if fd is not None: os.close(fd)
+        raise
+    finally:
+        os.close(stdout_write)
+        os.close(stderr_write)
+    proc = PipelineProcess(procs)
+    if stdin_write is not None:
+        proc.stdin = await proc._connect_stdin(stdin_write)
+    if stdout_read is not None:
+        proc.stdout = await proc._connect(stdout_read)
+    proc.stderr = await proc._connect(stderr_read)
+    return proc
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from enum import Enum
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from .types import CommandStep, InvalidPlanError
+from .iostream_reader import IOStreamBuffer, IOStreamReaderResult, IOStreamReaderStatus
+
+
+class PlanPolicy(str, Enum):
+    FAIL_FAST = "fail_fast"
+    CONTINUE_ON_ERROR = "continue_on_error"
+
+@dataclass
+class PlanStep:
+    id: str
+    step: CommandStep
+    depends_on: list[str] = field(default_factory=list)
+
+@dataclass
+class PlanResult:
+    results: dict[str, IOStreamReaderResult]
+    durations: dict[str, float]
+    wall_time: float
+    critical_path: list[str]
+    critical_path_time: float
+
+    @property
+    def success(self) -> bool:
+        return all(not PlanExecutor.is_failure(result) for result in self.results.values())
+
+    @property
+    def skipped(self) -> list[str]:
+        return [id for id, result in self.results.items()
+                if result.status == IOStreamReaderStatus.SKIPPED]
+
+class PlanExecutor:
+    """
+    Runs a set of steps with declared dependencies, independent steps
+    are executed concurrently up to `max_concurrency`.
+    """
+    def __init__(self,
+                 run: Callable[[CommandStep], Awaitable[IOStreamReaderResult]],
+                 max_concurrency: int | None = None,
+                 policy: PlanPolicy = PlanPolicy.FAIL_FAST,
+                 ):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self._run = run
+        self._max_concurrency = max_concurrency
+        self._policy = policy
+
+    @staticmethod
+    def is_failure(result: IOStreamReaderResult) -> bool:
+        return result.status != IOStreamReaderStatus.SUCCESS or result.returncode != 0
+
+    @staticmethod
+    def _empty_result(status: IOStreamReaderStatus, error: Exception | None = None) -> IOStreamReaderResult:
+        return IOStreamReaderResult(-1, status, error, IOStreamBuffer(), IOStreamBuffer())
+
+    @staticmethod
+    def _task_result(task: "asyncio.Task[IOStreamReaderResult]") -> IOStreamReaderResult:
+        if task.cancelled():
+            # canceled before the process is spawned
+            return PlanExecutor._empty_result(IOStreamReaderStatus.CANCELED)
+        if isinstance(exc := task.exception(), Exception):
+            return PlanExecutor._empty_result(IOStreamReaderStatus.ERROR, exc)
+        return task.result()
+
+    @staticmethod
+    def validate(steps: list[PlanStep]):
+        ids = [plan_step.id for plan_step in steps]
+        if len(set(ids)) != len(ids):
+            duplicated = next(id for id in ids if ids.count(id) > 1)
+            raise InvalidPlanError(f"duplicated step id: {duplicated}")
+
+        deps = {plan_step.id: plan_step.depends_on for plan_step in steps}
+        for id, depends_on in deps.items():
+            for dep in depends_on:
+                if dep not in deps:
+                    raise InvalidPlanError(f"step {id} depends on unknown step: {dep}")
+
+        # depth-first search for cycles
+        visiting: set[str] = set()
+        visited: set[str] = set()
+        def visit(id: str):
+            if id in visited: return
+            if id in visiting:
+                raise InvalidPlanError(f"dependency cycle through step: {id}")
+            visiting.add(id)
+            for dep in deps[id]: visit(dep)
+            visiting.remove(id)
+            visited.add(id)
+        for id in deps: visit(id)
+
+    @staticmethod
+    def _critical_path(steps: list[PlanStep], durations: dict[str, float]) -> tuple[list[str], float]:
+        """The longest chain of dependent steps, weighted by their actual durations."""
+        deps = {plan_step.id: plan_step.depends_on for plan_step in steps}
+        finish: dict[str, float] = {}
+        previous: dict[str, str | None] = {}
+        def visit(id: str) -> float:
+            if id in finish: return finish[id]
+            longest, longest_dep = 0.0, None
+            for dep in deps[id]:
+                dep_finish = visit(dep)
+                if longest_dep is None or dep_finish > longest:
+                    longest, longest_dep = dep_finish, dep
+            finish[id] = longest + durations.get(id, 0.0)
+            previous[id] = longest_dep
+            return finish[id]
+
+        if not steps: return [], 0.0
+        last = max(deps, key=visit)
+        path = []
+        current: str | None = last
+        while current is not None:
+            path.append(current)
+            current = previous[current]
+        return path[::-1], finish[last]
+
+    async def execute(self, steps: list[PlanStep]) -> PlanResult:
+        self.validate(steps)
+        by_id = {plan_step.id: plan_step for plan_step in steps}
+        waiting_on = {plan_step.id: set(plan_step.depends_on) for plan_step in steps}
+        dependents: dict[str, list[str]] = {plan_step.id: [] for plan_step in steps}
+        for plan_step in steps:
+            for dep in plan_step.depends_on:
+                dependents[dep].append(plan_step.id)
+
+        ready = [plan_step.id for plan_step in steps if not plan_step.depends_on]
+        running: dict[asyncio.Task[IOStreamReaderResult], str] = {}
+        started_at: dict[str, float] = {}
+        results: dict[str, IOStreamReaderResult] = {}
+        durations: dict[str, float] = {}
+        aborted = False
+
+        def skip_dependents(id: str):
+            for dependent in dependents[id]:
+                if dependent in results: continue
+                results[dependent] = self._empty_result(IOStreamReaderStatus.SKIPPED)
+                skip_dependents(dependent)
+
+        plan_start = time.monotonic()
+        try:
+            while ready or running:
+                while ready and not aborted and (
+                    self._max_concurrency is None or len(running) < self._max_concurrency
+                ):
+                    id = ready.pop(0)
+                    started_at[id] = time.monotonic()
+                    running[asyncio.create_task(self._run(by_id[id].step))] = id
+
+                if not running: break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    id = running.pop(task)
+                    durations[id] = time.monotonic() - started_at[id]
+                    result = results[id] = self._task_result(task)
+
+                    if not self.is_failure(result):
+                        for dependent in dependents[id]:
+                            waiting_on[dependent].discard(id)
+                            if not waiting_on[dependent] and dependent not in results:
+                                ready.append(dependent)
+                    elif self._policy == PlanPolicy.CONTINUE_ON_ERROR:
+                        skip_dependents(id)
+                    elif not aborted:
+                        # the canceled siblings terminate their process trees
+                        # and are collected by the following iterations
+                        aborted = True
+                        for sibling in running: sibling.cancel()
+        finally:
+            for task in running: task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        for plan_step in steps:
+            results.setdefault(plan_step.id, self._empty_result(IOStreamReaderStatus.SKIPPED))
+        critical_path, critical_path_time = self._critical_path(steps, durations)
+        return PlanResult(
+            results={plan_step.id: results[plan_step.id] for plan_step in steps},
+            durations=durations,
+            wall_time=time.monotonic() - plan_start,
+            critical_path=critical_path,
+            critical_path_time=critical_path_time,
+        )
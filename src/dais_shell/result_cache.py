@@ -0,0 +1,191 @@
+import copy
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Hashable, NamedTuple
+from .iostream_reader import IOStreamCallback, IOStreamReaderResult, IOStreamReaderStatus
+from .types import CommandStep
+from .utils import EnvExpander
+
+
+@dataclass
+class CacheRule:
+    """
+    A read-only command whose results may be reused. Dependency paths are
+    relative to the cwd of the step, or to the directory `root` finds from
+    it; the result is invalid once the mtime of one of them changed. The
+    mtime of a directory only changes when an entry is added, removed or
+    renamed, edits within the TTL may go unnoticed.
+    """
+    command: str
+    # the first arguments which are cached, such as git subcommands, None allows any
+    subcommands: set[str] | None = None
+    depends_on: list[str] = field(default_factory=list)
+    # also depends on the arguments which do not start with `-`, such as the files of `cat`
+    path_args: bool = False
+    # returns the directory of the dependencies for a cwd, such as `git_dir`
+    root: Callable[[str], str | None] | None = None
+
+def git_dir(cwd: str) -> str | None:
+    """The git dir of the repository `cwd` is in, found by walking up from it."""
+    path = os.path.abspath(cwd)
+    while True:
+        candidate = os.path.join(path, ".git")
+        if os.path.isdir(candidate): return candidate
+        if os.path.isfile(candidate):
+            # worktrees and submodules point to their git dir
+            try:
+                with open(candidate) as file:
+                    line = file.readline()
+            except OSError:
+                return None
+            if not line.startswith("gitdir:"): return None
+            return os.path.normpath(os.path.join(path, line[len("gitdir:"):].strip()))
+        parent = os.path.dirname(path)
+        if parent == path: return None
+        path = parent
+
+# `git status` and `git diff` read the files of the working tree, which are not
+# dependencies, an edit would not invalidate their results. `pip` is not
+# cached, the environment it installs into can not be told from the step.
+DEFAULT_CACHE_RULES = [
+    CacheRule("git", {"log", "show", "branch", "rev-parse", "ls-files"},
+              ["index", "HEAD", "refs/heads", "packed-refs"], root=git_dir),
+    CacheRule("ls", depends_on=["."], path_args=True),
+    CacheRule("cat", path_args=True),
+    CacheRule("head", path_args=True),
+    CacheRule("wc", path_args=True),
+    CacheRule("pwd"),
+]
+
+class ResultCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    bytes: int
+
+class CacheLookup(NamedTuple):
+    key: Hashable
+    # mtimes of the dependencies, taken before the step runs
+    stamps: tuple[tuple[str, int | None], ...]
+    result: IOStreamReaderResult | None
+
+@dataclass
+class _Entry:
+    result: IOStreamReaderResult
+    stamps: tuple[tuple[str, int | None], ...]
+    stored_at: float
+    size: int
+
+class ResultCache:
+    """
+    Reuses the results of read-only commands, keyed by command, expanded
+    arguments, cwd and environment. Entries expire after `ttl` seconds or
+    when a dependency changed, and the least recently used ones are evicted
+    beyond `max_entries` or `max_bytes` of retained output. Only successful
+    results without spill files are stored. Results are copied when they are
+    stored and returned, so that changing the buffers of one does not change
+    the entry.
+    """
+    def __init__(self,
+                 ttl: float = 5.0,
+                 max_entries: int = 256,
+                 max_bytes: int = 16 * 1024 * 1024,
+                 rules: list[CacheRule] | None = None,
+                 ):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._rules = {rule.command: rule for rule in (DEFAULT_CACHE_RULES if rules is None else rules)}
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        # the shell may run steps from several threads
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def _rule(self, step: CommandStep) -> CacheRule | None:
+        rule = self._rules.get(os.path.basename(step.command))
+        if rule is None: return None
+        if rule.subcommands is not None and (not step.args or step.args[0] not in rule.subcommands):
+            return None
+        return rule
+
+    @staticmethod
+    def _stamps(rule: CacheRule, cwd: str, args: list[str]) -> tuple[tuple[str, int | None], ...]:
+        root = (rule.root(cwd) if rule.root is not None else None) or cwd
+        paths = [os.path.join(root, path) for path in rule.depends_on]
+        if rule.path_args:
+            paths.extend(os.path.join(cwd, arg) for arg in args if not arg.startswith("-"))
+        stamps = []
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+            stamps.append((path, mtime))
+        return tuple(stamps)
+
+    def lookup(self, step: CommandStep) -> CacheLookup | None:
+        """Returns None when the step is not cacheable, the result is None on a miss."""
+        rule = self._rule(step)
+        # the output may depend on the input, and a redirect writes a file
+        if rule is None or step.stdin is not None: return None
+        if step.stdout_redirect is not None or step.stderr_redirect is not None: return None
+        env = step.env or {}
+        expander = EnvExpander(env)
+        args = [expander.expand(arg) for arg in step.args]
+        cwd = os.path.abspath(step.cwd)
+        key = (step.command, tuple(args), cwd, tuple(sorted(env.items())))
+        stamps = self._stamps(rule, cwd, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (time.monotonic() - entry.stored_at > self._ttl or entry.stamps != stamps):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return CacheLookup(key, stamps, None)
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return CacheLookup(key, stamps, copy.deepcopy(entry.result))
+
+    def store(self, lookup: CacheLookup, result: IOStreamReaderResult):
+        if (result.status != IOStreamReaderStatus.SUCCESS or result.returncode != 0
+                or result.stdout_spill is not None or result.stderr_spill is not None):
+            return
+        size = len(result.stdout) + len(result.stderr)
+        if size > self._max_bytes: return
+        entry = _Entry(copy.deepcopy(result), lookup.stamps, time.monotonic(), size)
+        with self._lock:
+            if lookup.key in self._entries: self._remove(lookup.key)
+            self._entries[lookup.key] = entry
+            self._bytes += size
+            while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        self._bytes -= self._entries.pop(key).size
+
+    def cache_info(self) -> ResultCacheInfo:
+        with self._lock:
+            return ResultCacheInfo(self._hits, self._misses, len(self._entries), self._bytes)
+
+    def cache_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+async def replay_output(result: IOStreamReaderResult,
+                        on_stdout: IOStreamCallback | None,
+                        on_stderr: IOStreamCallback | None,
+                        batched: bool = False):
+    """Passes the retained lines of a cached result to the callbacks."""
+    for callback, buf in ((on_stdout, result.stdout_buf), (on_stderr, result.stderr_buf)):
+        if callback is None or not (lines := buf.lines): continue
+        for value in ([lines] if batched else lines):
+            if inspect.isawaitable(returned := callback(value)):
+                await returned
@@ -1,19 +1,60 @@
 from abc import ABC, abstractmethod
-from ..types import CommandStep
+from typing import Coroutine, TypeVar
+from ..pipeline import Pipeline
+from ..types import CommandStep, ShellError
 from ..iostream_reader import IOStreamReaderResult
+from ..output_delivery import OutputDelivery
+from ..timing import StepTiming
+from ..utils import LoopThread
+
+T = TypeVar("T")
 
 
 class BaseShellRuntime(ABC):
-    @abstractmethod
+    def __init__(self):
+        # runs the steps of `run_sync`, started on its first call
+        self._loop_thread = LoopThread()
+
     def run_sync(self,
                  step: CommandStep,
                  on_stdout=None,
                  on_stderr=None,
-                 ) -> IOStreamReaderResult: ...
+                 timing: StepTiming | None = None,
+                 ) -> IOStreamReaderResult:
+        """
+        Runs the step on the loop thread of the runtime, the callbacks are called
+        from that thread. Safe to call from several threads at once.
+        """
+        return self.run_coroutine(self.run(step, on_stdout, on_stderr, timing))
+
+    def run_coroutine(self, coro: Coroutine[object, object, T]) -> T:
+        """Runs `coro` on the loop thread of the runtime and waits for its result."""
+        return self._loop_thread.run(coro)
 
     @abstractmethod
     async def run(self,
                   step: CommandStep,
                   on_stdout=None,
-                  on_stderr=None
-                  ) -> IOStreamReaderResult: ...
+                  on_stderr=None,
+                  timing: StepTiming | None = None,
+                  delivery: OutputDelivery | None = None,
+                  ) -> IOStreamReaderResult:
+        """`delivery` overrides the `OutputDelivery` of the runtime for this run."""
+
+    async def run_pipeline(self,
+                           pipeline: Pipeline,
+                           on_stdout=None,
+                           on_stderr=None,
+                           timing: StepTiming | None = None,
+                           delivery: OutputDelivery | None = None,
+                           ) -> IOStreamReaderResult:
+        raise ShellError(f"Pipelines are not supported by {type(self).__name__}")
+
+    def close(self):
+        """Releases the resources held by the runtime, if any, and stops its loop thread."""
+        if self._loop_thread.running:
+            self._loop_thread.run(self.aclose())
+            self._loop_thread.close()
+
+    async def aclose(self):
+        pass
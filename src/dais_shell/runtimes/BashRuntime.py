@@ -1,18 +1,31 @@
-import asyncio
 import shutil
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass, fields
 
 from dais_shell.utils.env_expander import EnvExpander
+from dais_shell.utils.command_resolver import CommandResolver
 from .BaseShellRuntime import BaseShellRuntime
 from ..types import CommandStep, ShellRuntimeNotFoundError
-from ..iostream_reader import IOStreamReader, IOStreamReaderResult
+from ..iostream_reader import (
+    IOStreamReader,
+    IOStreamReaderResult,
+    IOStreamReaderStatus,
+    OutputDelivery,
+    OutputRetention,
+    TerminationPolicy,
+)
+from ..fork_server import ForkServer
+from ..output_redirect import resolve_redirects
+from ..pipeline import Pipeline, spawn_pipeline
+from ..spawn import SpawnBackend, SpawnedProcess, spawn
+from ..timing import StepTiming
 
 
 @dataclass
 class BashCommandStep(CommandStep):
     @classmethod
     def from_command_step(cls, step: CommandStep):
-        return cls(**asdict(step))
+        # `asdict` would turn nested dataclasses such as `limits` into dicts
+        return cls(**{field.name: getattr(step, field.name) for field in fields(step)})
 
     def to_wrapper_script(self):
         return 'exec "$1" "${@:2}"'
@@ -20,9 +33,21 @@ class BashCommandStep(CommandStep):
 # --- --- --- --- --- ---
 
 class BashRuntime(BaseShellRuntime):
-    def __init__(self, max_lines: int):
+    def __init__(self,
+                 retention: OutputRetention,
+                 resolver: CommandResolver | None = None,
+                 termination: TerminationPolicy | None = None,
+                 delivery: OutputDelivery | None = None,
+                 spawn_backend: SpawnBackend = SpawnBackend.SUBPROCESS,
+                 ):
+        super().__init__()
         self._shell = self._detect_shell()
-        self._max_lines = max_lines
+        self._retention = retention
+        self._resolver = resolver or CommandResolver()
+        self._termination = termination or TerminationPolicy()
+        self._delivery = delivery
+        self._spawn_backend = spawn_backend
+        self._fork_server = ForkServer() if spawn_backend == SpawnBackend.FORK_SERVER else None
 
     def _detect_shell(self) -> str:
         if bash := shutil.which("bash"):
@@ -45,34 +70,82 @@ class BashRuntime(BaseShellRuntime):
         env_expander = EnvExpander(step.env or {})
         step.args = [env_expander.expand(arg) for arg in step.args]
         step = BashCommandStep.from_command_step(step)
-        resolved = shutil.which(step.command)
+        resolved = self._resolver.resolve(step.command, (step.env or {}).get("PATH"))
         is_shell_command = resolved is None
         if is_shell_command:
             return self._make_bash_commands(step)
         else:
             return [resolved, *step.args]
 
-    def run_sync(self,
-                 step: CommandStep,
-                 on_stdout=None,
-                 on_stderr=None,
-                ) -> IOStreamReaderResult:
-        return asyncio.run(self.run(step, on_stdout, on_stderr))
+    def close(self):
+        super().close()
+        if self._fork_server is not None:
+            self._fork_server.close()
+
+    @staticmethod
+    def _check_limits(step: CommandStep, result: IOStreamReaderResult) -> IOStreamReaderResult:
+        if step.limits is None or result.status != IOStreamReaderStatus.SUCCESS:
+            return result
+        if (name := step.limits.exceeded(result.returncode, result.stderr, result.cpu_time)) is not None:
+            result.status = IOStreamReaderStatus.LIMIT_EXCEEDED
+            result.exceeded_limit = name
+        return result
 
     async def run(self,
                         step: CommandStep,
                         on_stdout=None,
-                        on_stderr=None
+                        on_stderr=None,
+                        timing: StepTiming | None = None,
+                        delivery: OutputDelivery | None = None,
                         ) -> IOStreamReaderResult:
-        proc = await asyncio.create_subprocess_exec(
-            *self._prepare_cmd(step),
-            cwd=step.cwd,
-            env=step.env,
-            stdin=asyncio.subprocess.DEVNULL,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            start_new_session=True,
-        )
+        timing = timing or StepTiming.start()
+        cmd = self._prepare_cmd(step)
+        timing.mark("resolved")
+        rlimits = step.limits.rlimits() if step.limits is not None else []
+        stdout_file, stderr_file = resolve_redirects(step)
+        proc = await spawn(cmd, step.cwd, step.env, rlimits, self._spawn_backend, self._fork_server,
+                           step.stdin, stdout_file, stderr_file, self._shell)
+        timing.mark("spawned")
+
+        reader = IOStreamReader(proc, self._retention, on_stdout, on_stderr,
+                                timing, self._termination, delivery or self._delivery,
+                                stdin=step.stdin, stdout_file=stdout_file, stderr_file=stderr_file)
+        result = await reader.read(step.timeout, step.soft_timeout, step.idle_timeout)
+        if isinstance(proc, SpawnedProcess):
+            result.cpu_time = proc.cpu_time
+        return self._check_limits(step, result)
+
+    async def run_pipeline(self,
+                           pipeline: Pipeline,
+                           on_stdout=None,
+                           on_stderr=None,
+                           timing: StepTiming | None = None,
+                           delivery: OutputDelivery | None = None,
+                           ) -> IOStreamReaderResult:
+        """
+        Runs the stages connected by pipes, each spawned as a process of its
+        own with the subprocess backend. Only the last stdout and the shared
+        stderr are read by the runtime. The exit code of every stage is
+        checked against its limits; the limits recognized by an error message
+        are searched in the shared stderr, which may come from another stage.
+        """
+        timing = timing or StepTiming.start()
+        stages = [(self._prepare_cmd(step), step) for step in pipeline.stages]
+        timing.mark("resolved")
+        stdout_file, _ = resolve_redirects(pipeline.stages[-1])
+        proc = await spawn_pipeline(stages, stdout_file, self._shell)
+        timing.mark("spawned")
 
-        reader = IOStreamReader(proc, self._max_lines, on_stdout, on_stderr)
-        return await reader.read(step.timeout)
+        reader = IOStreamReader(proc, self._retention, on_stdout, on_stderr,
+                                timing, self._termination, delivery or self._delivery,
+                                stdin=pipeline.stages[0].stdin, stdout_file=stdout_file)
+        result = await reader.read(pipeline.timeout, pipeline.soft_timeout, pipeline.idle_timeout)
+        result.stage_returncodes = proc.returncodes
+        if result.status != IOStreamReaderStatus.SUCCESS: return result
+        for step, returncode in zip(pipeline.stages, proc.returncodes):
+            if step.limits is None or returncode is None: continue
+            if (name := step.limits.exceeded(returncode, result.stderr)) is not None:
+                result.status = IOStreamReaderStatus.LIMIT_EXCEEDED
+                result.exceeded_limit = name
+                break
+        return result
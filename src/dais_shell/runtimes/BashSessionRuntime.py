@@ -0,0 +1,360 @@
+import asyncio
+import os
+import shlex
+import signal
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+import psutil
+
+from dais_shell.utils.env_expander import EnvExpander
+from dais_shell.utils.command_resolver import CommandResolver
+from .BashRuntime import BashRuntime
+from ..types import CommandStep
+from ..types.resource_limits import ulimit_args
+from ..spawn import stdin_path
+from ..timing import StepTiming
+from ..iostream_reader import (
+    CHUNK_SIZE,
+    IOStreamReaderResult,
+    IOStreamReaderStatus,
+    IOStreamSink,
+    IdleTimeout,
+    OutputDelivery,
+    OutputRetention,
+    TerminationPolicy,
+    wait_drained,
+    wait_with_deadlines,
+)
+
+
+# The session starts with an empty environment, and each step runs in a subshell
+# of it, so `cd`, `export`, `ulimit` and `exec` never leak into the next step.
+# Limits are passed as `ulimit:<option>:<soft>:<hard>` words before the variables,
+# and the file connected as the step's stdin after the cwd.
+SESSION_PRELUDE = r"""
+builtin export -n OLDPWD PWD SHLVL
+__dais_run() {
+    local __dais_token=$1 __dais_cwd=$2 __dais_stdin=$3
+    shift 3
+    (
+        builtin cd -- "$__dais_cwd" || exit 1
+        while [ "$1" != "--" ]; do
+            case $1 in
+                ulimit:*)
+                    IFS=: builtin read -r _ __opt __soft __hard <<< "$1"
+                    builtin ulimit -S "$__opt" "$__soft" && builtin ulimit -H "$__opt" "$__hard" || exit 126
+                    ;;
+                *) builtin export "$1" ;;
+            esac
+            shift
+        done
+        shift
+        exec "$@"
+    ) <"$__dais_stdin"
+    builtin printf '%s %d\n' "$__dais_token" $?
+    builtin printf '%s\n' "$__dais_token" >&2
+}
+"""
+
+# the signals which bash may report as an exit status of 128 + signum
+SIGNAL_NUMBERS = frozenset(int(sig) for sig in signal.valid_signals())
+
+@dataclass
+class _LoopSession:
+    """The bash process of one event loop, which runs its steps one at a time."""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    proc: asyncio.subprocess.Process | None = None
+
+class BashSessionRuntime(BashRuntime):
+    """
+    Runs every step inside one long-lived bash process instead of spawning
+    a new process per step. Steps are written to the session's stdin and
+    a per-session sentinel marks where each step's output and exit code end.
+    Steps are executed one at a time; concurrent calls wait for their turn.
+    asyncio processes are bound to the loop which created them, so each event
+    loop which runs steps gets a session of its own.
+    Steps which write data to their stdin are spawned as with `BashRuntime`,
+    as the stdin of the session carries the steps, and so are the steps
+    which redirect their output to files.
+    """
+    def __init__(self,
+                 retention: OutputRetention,
+                 resolver: CommandResolver | None = None,
+                 termination: TerminationPolicy | None = None,
+                 delivery: OutputDelivery | None = None,
+                 ):
+        super().__init__(retention, resolver, termination, delivery)
+        self._token = f"__DAIS_{uuid.uuid4().hex}__"
+        self._sessions: dict[asyncio.AbstractEventLoop, _LoopSession] = {}
+        self._sessions_lock = threading.Lock()
+
+    def _session(self) -> _LoopSession:
+        """The session of the running loop, those of the loops which were closed are killed."""
+        loop = asyncio.get_running_loop()
+        with self._sessions_lock:
+            closed = [self._sessions.pop(other) for other in list(self._sessions) if other.is_closed()]
+            if (session := self._sessions.get(loop)) is None:
+                session = self._sessions[loop] = _LoopSession()
+        for stale in closed:
+            self._kill_session(stale)
+        return session
+
+    async def _ensure_session(self, session: _LoopSession) -> asyncio.subprocess.Process:
+        if session.proc is None or session.proc.returncode is not None:
+            session.proc = await asyncio.create_subprocess_exec(
+                self._shell, "--noprofile", "--norc", "-s",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env={},
+                start_new_session=True,
+            )
+            await self._send(session.proc, SESSION_PRELUDE)
+        return session.proc
+
+    @staticmethod
+    async def _send(proc: asyncio.subprocess.Process, script: str):
+        assert proc.stdin is not None
+        proc.stdin.write(script.encode("utf-8"))
+        await proc.stdin.drain()
+
+    def _make_session_script(self, step: CommandStep) -> str:
+        env_expander = EnvExpander(step.env or {})
+        args = [env_expander.expand(arg) for arg in step.args]
+        resolved = self._resolver.resolve(step.command, (step.env or {}).get("PATH"))
+        argv = [resolved or step.command, *args]
+        env = [f"{key}={value}" for key, value in (step.env or {}).items()]
+        limits = []
+        for option, soft, hard in ulimit_args(step.limits.rlimits() if step.limits is not None else []):
+            limits.append(f"ulimit:{option}:{soft}:{hard}")
+        cwd = os.path.abspath(step.cwd)
+        stdin = stdin_path(step.stdin, cwd) or os.devnull
+        words = ["__dais_run", self._token, cwd, stdin, *limits, *env, "--", *argv]
+        return " ".join(shlex.quote(word) for word in words) + "\n"
+
+    async def _consumer(self, stream: asyncio.StreamReader, sink: IOStreamSink) -> str | None:
+        """
+        Consumes the stream until the session sentinel, returns the text after
+        it, or None if the session exited before the sentinel is seen.
+        """
+        token = self._token.encode("ascii")
+        # holds back the bytes which may be the beginning of a split sentinel
+        held = b""
+        try:
+            while chunk := await stream.read(CHUNK_SIZE):
+                # the held back bytes count as output for the idle timeout
+                sink.last_chunk_at = time.monotonic()
+                data = held + chunk
+                index = data.find(token)
+                if index < 0:
+                    keep = min(len(token) - 1, len(data))
+                    sink.feed(data[:len(data) - keep])
+                    held = data[len(data) - keep:]
+                    if sink.dispatcher is not None:
+                        await sink.dispatcher.wait_writable()
+                        sink.last_chunk_at = time.monotonic()
+                    continue
+
+                # the step output may not end with a newline, and nothing is
+                # written after the sentinel until the next step is sent
+                sink.feed(data[:index])
+                rest = data[index + len(token):]
+                while b"\n" not in rest:
+                    if not (chunk := await stream.read(CHUNK_SIZE)): return None
+                    rest += chunk
+                return rest[:rest.index(b"\n")].decode("ascii", errors="replace").strip()
+            return None
+        finally:
+            sink.close()
+
+    @staticmethod
+    def _signal_step(proc: asyncio.subprocess.Process, sig: int):
+        """Signals the running step and its descendants, the session is kept alive."""
+        try:
+            children = psutil.Process(proc.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        for child in children:
+            try:
+                child.send_signal(sig)
+            except psutil.NoSuchProcess:
+                pass
+
+    async def _interrupt_step(self, proc: asyncio.subprocess.Process, stdout_task: asyncio.Task):
+        # the steps share the process group of the session,
+        # so they are signaled one by one
+        policy = self._termination
+        try:
+            if policy.grace_period > 0:
+                self._signal_step(proc, policy.signal)
+                # the sentinel is printed once the step is gone
+                await asyncio.wait([stdout_task], timeout=policy.grace_period)
+        finally:
+            self._signal_step(proc, signal.SIGKILL)
+
+    @staticmethod
+    def _children_cpu_time(proc: asyncio.subprocess.Process) -> float | None:
+        """CPU seconds of the reaped children of the session, the steps run one at a time."""
+        try:
+            times = psutil.Process(proc.pid).cpu_times()
+        except psutil.NoSuchProcess:
+            return None
+        return times.children_user + times.children_system
+
+    @staticmethod
+    def _kill_session(session: _LoopSession) -> asyncio.subprocess.Process | None:
+        proc, session.proc = session.proc, None
+        if proc is None or proc.returncode is not None: return proc
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        return proc
+
+    def _take_sessions(self) -> dict[asyncio.AbstractEventLoop, _LoopSession]:
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        return sessions
+
+    def close(self):
+        """Kills the session processes, new ones are started on the next run."""
+        super().close()
+        for session in self._take_sessions().values():
+            self._kill_session(session)
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        for session_loop, session in self._take_sessions().items():
+            proc = self._kill_session(session)
+            # the process can only be awaited on its own loop
+            if proc is not None and session_loop is loop:
+                await proc.communicate()
+
+    async def _run_in_session(self,
+                              session: _LoopSession,
+                              step: CommandStep,
+                              on_stdout=None,
+                              on_stderr=None,
+                              timing: StepTiming | None = None,
+                              delivery: OutputDelivery | None = None,
+                              ) -> IOStreamReaderResult:
+        timing = timing or StepTiming.start()
+        proc = await self._ensure_session(session)
+        assert proc.stdout is not None
+        assert proc.stderr is not None
+        delivery = delivery or self._delivery
+        stdout_sink = IOStreamSink(self._retention, on_stdout, delivery)
+        stderr_sink = IOStreamSink(self._retention, on_stderr, delivery)
+
+        if (path := stdin_path(step.stdin, step.cwd)) is not None:
+            # raises as the other runtimes do, instead of failing inside the session
+            with open(path, "rb"): pass
+        script = self._make_session_script(step)
+        timing.mark("resolved")
+        cpu_before = self._children_cpu_time(proc)
+        await self._send(proc, script)
+        # the step is handed to the session instead of being spawned
+        timing.mark("spawned")
+        stdout_task = asyncio.create_task(self._consumer(proc.stdout, stdout_sink))
+        stderr_task = asyncio.create_task(self._consumer(proc.stderr, stderr_sink))
+
+        status = IOStreamReaderStatus.SUCCESS
+        error: Exception | None = None
+        try:
+            await wait_with_deadlines(asyncio.shield(stdout_task), timing, [stdout_sink, stderr_sink],
+                                      step.timeout, step.soft_timeout, step.idle_timeout,
+                                      lambda: self._signal_step(proc, self._termination.signal))
+            # the exit is only known once the sentinel is read
+            timing.mark("exited")
+            if timing.soft_deadline is not None:
+                status = IOStreamReaderStatus.TIMEOUT
+        except asyncio.TimeoutError:
+            timing.mark("killed")
+            await self._interrupt_step(proc, stdout_task)
+            status = IOStreamReaderStatus.TIMEOUT
+        except IdleTimeout:
+            timing.mark("killed")
+            await self._interrupt_step(proc, stdout_task)
+            status = IOStreamReaderStatus.IDLE_TIMEOUT
+        except asyncio.CancelledError:
+            timing.mark("killed")
+            await self._interrupt_step(proc, stdout_task)
+            status = IOStreamReaderStatus.CANCELED
+        except Exception as exc:
+            timing.mark("killed")
+            await self._interrupt_step(proc, stdout_task)
+            status = IOStreamReaderStatus.ERROR
+            error = exc
+        finally:
+            canceled = status == IOStreamReaderStatus.CANCELED
+            if canceled:
+                # drops the queued output first, the consumers may wait for the callbacks
+                await asyncio.gather(stdout_sink.finish_delivery(True), stderr_sink.finish_delivery(True))
+            # the sentinels are printed as soon as the step is gone
+            consumers = asyncio.gather(stdout_task, stderr_task, return_exceptions=True)
+            policy = self._termination
+            drain_timeout = policy.kill_drain_timeout if timing.killed is not None else policy.drain_timeout
+            drain_expired = not await wait_drained(consumers, [stdout_sink, stderr_sink], drain_timeout)
+            if drain_expired:
+                consumers.cancel()
+                results = [None, None]
+            else:
+                results = consumers.result()
+            if timing.exited is None and stdout_task.done():
+                timing.mark("exited")
+            stdout_delivery, stderr_delivery = await asyncio.gather(
+                stdout_sink.finish_delivery(canceled),
+                stderr_sink.finish_delivery(canceled))
+            timing.mark("drained")
+            timing.first_stdout = stdout_sink.first_chunk_at
+            timing.first_stderr = stderr_sink.first_chunk_at
+
+        exit_text, stderr_end = results
+        cpu_time = None
+        if error is None and isinstance(exit_text, str) and isinstance(stderr_end, str):
+            returncode = int(exit_text)
+            if cpu_before is not None and (cpu_after := self._children_cpu_time(proc)) is not None:
+                cpu_time = cpu_after - cpu_before
+            if returncode - 128 in SIGNAL_NUMBERS and (
+                    status != IOStreamReaderStatus.SUCCESS
+                    or step.limits is not None and step.limits.exceeded(128 - returncode, "", cpu_time)):
+                # bash reports a signaled child as 128 + signum, a spawned
+                # process reports it as -signum. The status can not be told
+                # from an `exit 130`, it is only taken as a signal when the
+                # runtime stopped the step or a limit signal fits it.
+                returncode = 128 - returncode
+        elif drain_expired and status != IOStreamReaderStatus.SUCCESS:
+            # the stopped step did not end within the drain timeout, it is
+            # killed with the session, which is restarted on the next run
+            self._kill_session(session)
+            returncode = -signal.SIGKILL
+        else:
+            # the session itself died, it is restarted on the next run
+            self._kill_session(session)
+            returncode = -1
+            status = IOStreamReaderStatus.ERROR
+            error = error or next((r for r in results if isinstance(r, Exception)),
+                                  RuntimeError("Bash session exited unexpectedly"))
+        return self._check_limits(step, IOStreamReaderResult(returncode, status, error,
+                                                             stdout_sink.buffer, stderr_sink.buffer,
+                                                             stdout_sink.spill, stderr_sink.spill,
+                                                             timing,
+                                                             stdout_delivery=stdout_delivery,
+                                                             stderr_delivery=stderr_delivery,
+                                                             cpu_time=cpu_time))
+
+    async def run(self,
+                  step: CommandStep,
+                  on_stdout=None,
+                  on_stderr=None,
+                  timing: StepTiming | None = None,
+                  delivery: OutputDelivery | None = None,
+                  ) -> IOStreamReaderResult:
+        piped_stdin = step.stdin is not None and stdin_path(step.stdin, step.cwd) is None
+        if piped_stdin or step.stdout_redirect is not None or step.stderr_redirect is not None:
+            return await super().run(step, on_stdout, on_stderr, timing, delivery)
+        session = self._session()
+        async with session.lock:
+            return await self._run_in_session(session, step, on_stdout, on_stderr, timing, delivery)
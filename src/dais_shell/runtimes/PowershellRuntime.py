@@ -3,21 +3,31 @@ import base64
 import json
 import shutil
 import re
-import xml.etree.ElementTree as ET
 import subprocess
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass, fields
 
 from dais_shell.utils.env_expander import EnvExpander
 from .BaseShellRuntime import BaseShellRuntime
-from ..iostream_reader import IOStreamReader, IOStreamReaderResult
+from ..clixml_decoder import ClixmlDecoder
+from ..iostream_reader import (
+    IOStreamReader,
+    IOStreamReaderResult,
+    OutputDelivery,
+    OutputRetention,
+    TerminationPolicy,
+)
+from ..output_redirect import resolve_redirects, subprocess_output
+from ..spawn import subprocess_stdin
 from ..types import CommandStep, ShellRuntimeNotFoundError
+from ..timing import StepTiming
 
 
 @dataclass
 class PowerShellCommandStep(CommandStep):
     @classmethod
     def from_command_step(cls, step: CommandStep):
-        return cls(**asdict(step))
+        # `asdict` would turn nested dataclasses such as `limits` into dicts
+        return cls(**{field.name: getattr(step, field.name) for field in fields(step)})
 
     def to_wrapper_script(self):
 
@@ -49,9 +59,16 @@ exit $LASTEXITCODE"""
 # --- --- --- --- --- ---
 
 class PowerShellRuntime(BaseShellRuntime):
-    def __init__(self, max_lines: int):
+    def __init__(self,
+                 retention: OutputRetention,
+                 termination: TerminationPolicy | None = None,
+                 delivery: OutputDelivery | None = None,
+                 ):
+        super().__init__()
         self._shell = self._detect_shell()
-        self._max_lines = max_lines
+        self._retention = retention
+        self._termination = termination or TerminationPolicy()
+        self._delivery = delivery
 
     @staticmethod
     def _detect_shell() -> str:
@@ -68,38 +85,6 @@ class PowerShellRuntime(BaseShellRuntime):
             source.encode("utf-16-le")
         ).decode("ascii")
 
-    @staticmethod
-    def _strip_clixml(text: str) -> str:
-        """
-        Powershell outputs CLIXML when its stderr is connected to a pipe,
-        so we need to strip the original text from the stderr.
-        """
-        if not text.strip().startswith("#< CLIXML"):
-            return text
-
-        xml_part = text.strip()[len("#< CLIXML"):].strip()
-        try:
-            root = ET.fromstring(xml_part)
-            ns = {"ps": "http://schemas.microsoft.com/powershell/2004/04"}
-            parts = []
-            for s in root.findall(".//ps:S", ns):
-                if not s.text:
-                    continue
-                t = s.text
-                # PowerShell 用 _xNNNN_ 编码特殊字符（包括 ANSI escape \x1b = _x001B_）
-                t = re.sub(
-                    r"_x([0-9A-Fa-f]{4})_",
-                    lambda m: chr(int(m.group(1), 16)),
-                    t
-                )
-                # 剥掉 ANSI 颜色码
-                t = re.sub(r"\x1b\[[0-9;]*m", "", t)
-                parts.append(t)
-            return "".join(parts)
-        except ET.ParseError:
-            # returns the raw text as fallback
-            return text
-
     def _make_powershell_commands(self, encoded: str):
         return [
             self._shell,
@@ -117,33 +102,35 @@ class PowerShellRuntime(BaseShellRuntime):
         encoded = self._encode(script)
         return self._make_powershell_commands(encoded)
 
-    def run_sync(
-        self,
-        step: CommandStep,
-        on_stdout=None,
-        on_stderr=None,
-    ) -> IOStreamReaderResult:
-        return asyncio.run(self.run(step, on_stdout, on_stderr))
-
     async def run(
         self,
         step: CommandStep,
         on_stdout=None,
-        on_stderr=None
+        on_stderr=None,
+        timing: StepTiming | None = None,
+        delivery: OutputDelivery | None = None,
     ) -> IOStreamReaderResult:
-        proc = await asyncio.create_subprocess_exec(
-            *self._prepare_cmd(step),
-            cwd=step.cwd,
-            env=step.env,
-            stdin=asyncio.subprocess.DEVNULL,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            creationflags=subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
-        )
-
-        reader = IOStreamReader(proc, self._max_lines, on_stdout, on_stderr)
-        read_result = await reader.read(step.timeout)
-        cleaned_stderr = self._strip_clixml(read_result.stderr)
-        read_result.stderr_buf.clear()
-        read_result.stderr_buf.extend(cleaned_stderr.splitlines())
-        return read_result
+        timing = timing or StepTiming.start()
+        cmd = self._prepare_cmd(step)
+        timing.mark("resolved")
+        stdout_file, stderr_file = resolve_redirects(step)
+        with subprocess_stdin(step.stdin, step.cwd) as stdin, \
+                subprocess_output(stdout_file) as stdout, \
+                subprocess_output(stderr_file) as stderr:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                cwd=step.cwd,
+                env=step.env,
+                stdin=stdin,
+                stdout=stdout,
+                stderr=stderr,
+                creationflags=subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
+            )
+        timing.mark("spawned")
+
+        # powershell writes CLIXML to stderr when it is connected to a pipe
+        reader = IOStreamReader(proc, self._retention, on_stdout, on_stderr,
+                                timing, self._termination, delivery or self._delivery,
+                                stderr_decoder=ClixmlDecoder(), stdin=step.stdin,
+                                stdout_file=stdout_file, stderr_file=stderr_file)
+        return await reader.read(step.timeout, step.soft_timeout, step.idle_timeout)
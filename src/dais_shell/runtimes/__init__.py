@@ -1,3 +1,4 @@
 from .BaseShellRuntime import BaseShellRuntime
 from .BashRuntime import BashRuntime
+from .BashSessionRuntime import BashSessionRuntime
 from .PowershellRuntime import PowerShellRuntime
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+import psutil
+from .types import StepPriority
+
+
+# the priority classes in the order they are admitted
+PRIORITY_ORDER = [StepPriority.INTERACTIVE, StepPriority.NORMAL, StepPriority.BACKGROUND]
+
+@dataclass
+class AdmissionPolicy:
+    """
+    Bounds the steps of an `AgentShell` which run at once. Waiting steps are
+    admitted by priority class, and in turns across workspaces within a class.
+    """
+    max_concurrent: int = 8
+    # no further step is admitted while the system CPU usage is above this
+    # percentage, unless none of the steps of the shell is running
+    max_cpu_percent: float | None = None
+    # seconds between the checks of the CPU usage while steps wait for it
+    load_check_interval: float = 0.5
+
+class AdmissionScheduler:
+    """
+    Admits steps according to an `AdmissionPolicy`. Steps may wait on
+    different event loops, the state is shared under a lock.
+    """
+    def __init__(self, policy: AdmissionPolicy):
+        self._policy = policy
+        self._lock = threading.Lock()
+        self._running = 0
+        # priority -> workspace -> waiting steps, the workspaces take turns
+        self._queues: dict[StepPriority, OrderedDict[str, deque[asyncio.Future]]] = {
+            priority: OrderedDict() for priority in PRIORITY_ORDER
+        }
+        # (time of the sample, CPU percent)
+        self._cpu_sample: tuple[float, float] | None = None
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for queues in self._queues.values() for waiters in queues.values())
+
+    def _throttled(self) -> bool:
+        limit = self._policy.max_cpu_percent
+        if limit is None or self._running == 0: return False
+        now = time.monotonic()
+        if self._cpu_sample is None or now - self._cpu_sample[0] >= self._policy.load_check_interval:
+            # the usage since the previous sample, does not block
+            self._cpu_sample = (now, psutil.cpu_percent(interval=None))
+        return self._cpu_sample[1] > limit
+
+    def _next_waiter(self) -> asyncio.Future | None:
+        for priority in PRIORITY_ORDER:
+            queues = self._queues[priority]
+            if not queues: continue
+            workspace, waiters = next(iter(queues.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                queues.move_to_end(workspace)
+            else:
+                del queues[workspace]
+            return waiter
+        return None
+
+    def _grant(self, waiter: asyncio.Future):
+        """Runs on the loop of the waiter."""
+        if waiter.done():
+            # canceled in the meantime
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    def _dispatch(self):
+        """Admits waiting steps while there is room, the lock is held."""
+        while self._running < self._policy.max_concurrent and not self._throttled():
+            waiter = self._next_waiter()
+            if waiter is None: return
+            self._running += 1
+            waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+
+    def _remove(self, priority: StepPriority, workspace: str, waiter: asyncio.Future) -> bool:
+        waiters = self._queues[priority].get(workspace)
+        if waiters is None or waiter not in waiters: return False
+        waiters.remove(waiter)
+        if not waiters:
+            del self._queues[priority][workspace]
+        return True
+
+    async def acquire(self, priority: StepPriority, workspace: str) -> float:
+        """Waits until the step is admitted, returns the seconds it waited."""
+        start = time.monotonic()
+        with self._lock:
+            if self._running < self._policy.max_concurrent and self.queued == 0 and not self._throttled():
+                self._running += 1
+                return 0.0
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues[priority].setdefault(workspace, deque()).append(waiter)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), self._policy.load_check_interval)
+                    break
+                except asyncio.TimeoutError:
+                    # the CPU usage may have dropped without any step finishing
+                    with self._lock:
+                        self._dispatch()
+        except asyncio.CancelledError:
+            with self._lock:
+                removed = self._remove(priority, workspace, waiter)
+            if not removed and not waiter.cancel():
+                # admitted already, `_grant` releases the other case
+                self.release()
+            raise
+        return time.monotonic() - start
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
@@ -0,0 +1,285 @@
+import asyncio
+import errno
+import os
+import shutil
+import signal
+from contextlib import contextmanager
+from concurrent.futures import Future
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Iterator
+from .output_redirect import RedirectedFile, subprocess_output
+from .types import StdinSource, validate_stdin
+from .types.resource_limits import ulimit_args
+
+if TYPE_CHECKING:
+    from .fork_server import ForkServer
+
+
+class SpawnBackend(str, Enum):
+    # `asyncio.create_subprocess_exec`, which forks the parent
+    SUBPROCESS = "subprocess"
+    # `os.posix_spawn`, which does not copy the page tables of a large parent.
+    # posix_spawn can not change the directory, steps with a cwd other than
+    # the current directory are started through /bin/sh, see `chdir_command`.
+    POSIX_SPAWN = "posix_spawn"
+    # a helper process forks the steps, see `ForkServer`
+    FORK_SERVER = "fork_server"
+
+# signals which Python ignores, reset for the child as `subprocess` does
+_RESET_SIGNALS = tuple(getattr(signal, name) for name in ("SIGPIPE", "SIGXFSZ") if hasattr(signal, name))
+
+class SpawnedProcess:
+    """
+    A process started by `os.posix_spawn` or a `ForkServer`, with the part of
+    the interface of `asyncio.subprocess.Process` which `IOStreamReader` uses.
+    It is reaped with its resource usage, `cpu_time` is set once it exited.
+    """
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.returncode: int | None = None
+        # user and system CPU seconds of the process and its reaped children
+        self.cpu_time: float | None = None
+        self.stdin: asyncio.StreamWriter | None = None
+        self.stdout: asyncio.StreamReader | None = None
+        self.stderr: asyncio.StreamReader | None = None
+        self._transports: list[asyncio.BaseTransport] = []
+        self._exited = asyncio.get_running_loop().create_future()
+
+    async def _connect_stdin(self, fd: int) -> asyncio.StreamWriter:
+        loop = asyncio.get_running_loop()
+        protocol = asyncio.StreamReaderProtocol(asyncio.StreamReader(loop=loop), loop=loop)
+        transport, _ = await loop.connect_write_pipe(lambda: protocol, os.fdopen(fd, "wb", 0))
+        return asyncio.StreamWriter(transport, protocol, None, loop)
+
+    async def _connect(self, fd: int) -> asyncio.StreamReader:
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(loop=loop)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader, loop=loop), os.fdopen(fd, "rb", 0))
+        self._transports.append(transport)
+        return reader
+
+    def _set_status(self, status: int, rusage):
+        self.cpu_time = rusage.ru_utime + rusage.ru_stime
+        self._set_code(os.waitstatus_to_exitcode(status))
+
+    def _set_code(self, returncode: int):
+        self.returncode = returncode
+        if not self._exited.done():
+            self._exited.set_result(self.returncode)
+
+    def _watch(self):
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(self.pid)
+        except (AttributeError, OSError):
+            # without pidfd, a thread waits for the process
+            future = loop.run_in_executor(None, os.wait4, self.pid, 0)
+            future.add_done_callback(lambda done: self._set_status(*done.result()[1:]))
+            return
+
+        def reap():
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+            self._set_status(*os.wait4(self.pid, 0)[1:])
+        loop.add_reader(pidfd, reap)
+
+    def _watch_future(self, exited: Future):
+        """Takes the exit code and CPU time from `exited`, which is set by another thread."""
+        def set_exit(done: asyncio.Future):
+            if done.cancelled(): return
+            self._set_code(done.result()[0])
+            self.cpu_time = done.result()[1]
+        asyncio.wrap_future(exited).add_done_callback(set_exit)
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._exited)
+
+    def send_signal(self, sig: int):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def close_pipes(self):
+        """Closes stdout and stderr, the streams receive EOF."""
+        for transport in self._transports:
+            transport.close()
+
+def stdin_path(source: StdinSource | None, cwd: Any) -> str | None:
+    """The absolute path of a file source, None for data written through a pipe."""
+    validate_stdin(source)
+    if not isinstance(source, os.PathLike): return None
+    return os.path.join(os.path.abspath(cwd if cwd is not None else "."), os.fspath(source))
+
+@contextmanager
+def subprocess_stdin(source: StdinSource | None, cwd: Any) -> Iterator[Any]:
+    """The `stdin` argument of `asyncio.create_subprocess_exec`, a file is closed once the child has it."""
+    if source is None:
+        yield asyncio.subprocess.DEVNULL
+    elif (path := stdin_path(source, cwd)) is None:
+        yield asyncio.subprocess.PIPE
+    else:
+        with open(path, "rb") as file:
+            yield file
+
+def needs_chdir(cwd: Any) -> bool:
+    """Whether a step in `cwd` can not be started by posix_spawn directly."""
+    return cwd is not None and os.path.abspath(cwd) != os.getcwd()
+
+# changes to the directory, unsets the variables given before the first `--`
+# and applies the `ulimit` arguments given before the second, then execs the
+# command
+LIMITS_SCRIPT = (
+    'builtin cd -- "$1" || exit 126; shift; '
+    'while [ "$1" != -- ]; do builtin unset "$1"; shift; done; shift; '
+    'while [ "$1" != -- ]; do builtin ulimit -S "$1" "$2" && builtin ulimit -H "$1" "$3" || exit 126; shift 3; done; '
+    'shift; exec "$@"'
+)
+
+# the same without limits for a POSIX shell, which starts faster than bash
+CHDIR_SCRIPT = 'cd -- "$1" || exit 126; shift; while [ "$1" != -- ]; do unset "$1"; shift; done; shift; exec "$@"'
+
+def _set_by_cd(cwd: Any, env: dict[str, str] | None) -> list[str]:
+    """The directory and the variables which `cd` sets and the environment of the step does not have."""
+    env = os.environ if env is None else env
+    return [os.path.abspath(cwd if cwd is not None else "."), *(name for name in ("PWD", "OLDPWD") if name not in env)]
+
+def limited_command(cmd: list[str],
+                    cwd: Any,
+                    rlimits: list,
+                    shell: str | None = None,
+                    env: dict[str, str] | None = None,
+                    ) -> list[str]:
+    """
+    `cmd` run by bash, which sets the limits and the directory before it
+    execs the command, as the session prelude does. This needs no Python
+    code between fork and exec, which is not safe with threads and keeps
+    `subprocess` from using vfork, and lets posix_spawn start the step.
+    `env` is the environment bash is started with, bash always passes
+    SHLVL, as 0 when it has none.
+    """
+    words = [str(word) for args in ulimit_args(rlimits) for word in args]
+    return [shell or shutil.which("bash") or "/bin/bash", "-c", LIMITS_SCRIPT, "dais-limits",
+            *_set_by_cd(cwd, env), "--", *words, "--", *cmd]
+
+def chdir_command(cmd: list[str], cwd: Any, env: dict[str, str] | None = None) -> list[str]:
+    """`cmd` run by /bin/sh in `cwd`, so that posix_spawn can start a step in any directory."""
+    return ["/bin/sh", "-c", CHDIR_SCRIPT, "dais-chdir", *_set_by_cd(cwd, env), "--", *cmd]
+
+async def posix_spawn_exec(*cmd: str,
+                           env: dict[str, str] | None,
+                           stdin_file: str | None = None,
+                           stdin_pipe: bool = False,
+                           stdout_file: RedirectedFile | None = None,
+                           stderr_file: RedirectedFile | None = None,
+                           ) -> SpawnedProcess:
+    """
+    Starts `cmd` in a new session, stdout and stderr are pipes unless they
+    are redirected to a file. Stdin is `stdin_file`, a pipe with `stdin_pipe`,
+    or /dev/null.
+    """
+    # opened here, so that a missing file raises the same error as with the other backends
+    stdin_read = os.open(stdin_file or os.devnull, os.O_RDONLY | os.O_CLOEXEC)
+    stdin_write = None
+    if stdin_pipe:
+        os.close(stdin_read)
+        stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe() if stdout_file is None else (None, stdout_file.open())
+    stderr_read, stderr_write = os.pipe() if stderr_file is None else (None, stderr_file.open())
+    try:
+        pid = os.posix_spawn(cmd[0], list(cmd), os.environ if env is None else env,
+                             file_actions=[
+                                 (os.POSIX_SPAWN_DUP2, stdin_read, 0),
+                                 (os.POSIX_SPAWN_DUP2, stdout_write, 1),
+                                 (os.POSIX_SPAWN_DUP2, stderr_write, 2),
+                             ],
+                             setsid=True,
+                             setsigdef=_RESET_SIGNALS)
+    except BaseException:
+        for fd in (stdin_write, stdout_read, stderr_read):
+            if fd is not None: os.close(fd)
+        raise
+    finally:
+        os.close(stdin_read)
+        os.close(stdout_write)
+        os.close(stderr_write)
+    proc = SpawnedProcess(pid)
+    proc._watch()
+    if stdin_write is not None:
+        proc.stdin = await proc._connect_stdin(stdin_write)
+    if stdout_read is not None:
+        proc.stdout = await proc._connect(stdout_read)
+    if stderr_read is not None:
+        proc.stderr = await proc._connect(stderr_read)
+    return proc
+
+async def spawn(cmd: list[str],
+                cwd: Any,
+                env: dict[str, str] | None,
+                rlimits: list,
+                backend: SpawnBackend = SpawnBackend.SUBPROCESS,
+                fork_server: "ForkServer | None" = None,
+                stdin: StdinSource | None = None,
+                stdout_file: RedirectedFile | None = None,
+                stderr_file: RedirectedFile | None = None,
+                shell: str | None = None,
+                ) -> asyncio.subprocess.Process | SpawnedProcess:
+    """
+    Starts a step in a new session, with its output connected to pipes, or
+    to the files it is redirected to. A file `stdin` is connected directly,
+    other sources get a pipe, see `write_stdin`. A step with limits is run
+    through `limited_command` with `shell`, and started with posix_spawn
+    unless the fork server starts it, so that its CPU time is known when
+    it is reaped.
+    """
+    stdin_file = stdin_path(stdin, cwd)
+    stdin_pipe = stdin is not None and stdin_file is None
+    if rlimits:
+        cmd = limited_command(cmd, cwd, rlimits, shell, env)
+    if backend == SpawnBackend.FORK_SERVER and fork_server is not None:
+        return await fork_server.spawn(cmd, cwd, env, stdin_file, stdin_pipe, stdout_file, stderr_file)
+    if hasattr(os, "posix_spawn") and (rlimits or backend == SpawnBackend.POSIX_SPAWN):
+        if needs_chdir(cwd) and not os.path.isdir(cwd):
+            # as `subprocess` reports it, the shell would only exit with 126
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), cwd)
+        if not rlimits and needs_chdir(cwd):
+            cmd = chdir_command(cmd, cwd, env)
+        return await posix_spawn_exec(*cmd, env=env, stdin_file=stdin_file, stdin_pipe=stdin_pipe,
+                                      stdout_file=stdout_file, stderr_file=stderr_file)
+    with subprocess_stdin(stdin, cwd) as stdin_arg, \
+            subprocess_output(stdout_file) as stdout_arg, \
+            subprocess_output(stderr_file) as stderr_arg:
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=cwd,
+            env=env,
+            stdin=stdin_arg,
+            stdout=stdout_arg,
+            stderr=stderr_arg,
+            start_new_session=True,
+        )
+
+async def write_stdin(writer: asyncio.StreamWriter, source: StdinSource):
+    """
+    Writes bytes or the chunks of an async iterator to the stdin of a step,
+    waiting while the pipe is full. Stops when the step closes its stdin.
+    An error of the source is raised with the pipe left open, so that the
+    step does not see EOF and run on truncated input.
+    """
+    try:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            writer.write(source)
+            await writer.drain()
+        else:
+            async for chunk in source:
+                writer.write(chunk)
+                await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # the step exited or closed its stdin without reading everything
+        pass
+    writer.close()
@@ -0,0 +1,64 @@
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, TypeAlias
+
+from .iostream_reader import IOStreamReaderResult
+from .output_delivery import OutputDelivery
+from .types import CommandStep
+
+
+@dataclass
+class StdoutLineEvent:
+    text: str
+
+@dataclass
+class StderrLineEvent:
+    text: str
+
+@dataclass
+class ExitEvent:
+    result: IOStreamReaderResult
+
+StreamEvent: TypeAlias = StdoutLineEvent | StderrLineEvent | ExitEvent
+
+async def stream_step(run: Callable[..., Awaitable[IOStreamReaderResult]],
+                      step: CommandStep,
+                      max_pending_lines: int = 1024,
+                      ) -> AsyncIterator[StreamEvent]:
+    """
+    Runs `step` with `run` and yields its output lines as they are read, then
+    its exit. At most about `max_pending_lines` lines per stream are read ahead of
+    the consumer, then reading pauses. Closing the iterator early cancels the run,
+    which terminates the process tree.
+    """
+    # batches of events, the callbacks wait while it is full
+    events: asyncio.Queue[list[StreamEvent]] = asyncio.Queue(maxsize=4)
+
+    async def on_stdout(lines: list[str]):
+        await events.put([StdoutLineEvent(line) for line in lines])
+
+    async def on_stderr(lines: list[str]):
+        await events.put([StderrLineEvent(line) for line in lines])
+
+    # a zero batch interval delivers whatever is queued as one batch
+    delivery = OutputDelivery(batch_interval=0, max_queued_lines=max_pending_lines, flush_timeout=None)
+    task = asyncio.create_task(run(step, on_stdout, on_stderr, delivery=delivery))
+    get: asyncio.Future | None = None
+    try:
+        while True:
+            get = asyncio.ensure_future(events.get())
+            await asyncio.wait([get, task], return_when=asyncio.FIRST_COMPLETED)
+            if get.done():
+                for event in get.result(): yield event
+                continue
+            get.cancel()
+            # the queued lines are delivered before the run returns
+            while not events.empty():
+                for event in events.get_nowait(): yield event
+            yield ExitEvent(task.result())
+            return
+    finally:
+        if get is not None: get.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,62 @@
+import time
+from dataclasses import dataclass, fields
+from typing import Callable
+from .types import CommandStep
+
+
+@dataclass
+class StepTiming:
+    """
+    `time.monotonic()` timestamps of the phases of one step,
+    a phase which did not happen is None.
+    """
+    started: float
+    env_built: float | None = None
+    # admitted by the `AdmissionScheduler`, when the shell has one
+    admitted: float | None = None
+    # the command is resolved and the command line is built
+    resolved: float | None = None
+    spawned: float | None = None
+    first_stdout: float | None = None
+    first_stderr: float | None = None
+    exited: float | None = None
+    drained: float | None = None
+    # when the step was signaled past its soft deadline
+    soft_deadline: float | None = None
+    # when the step was killed, on timeout or cancellation
+    killed: float | None = None
+
+    @classmethod
+    def start(cls) -> "StepTiming":
+        return cls(started=time.monotonic())
+
+    def mark(self, phase: str):
+        setattr(self, phase, time.monotonic())
+
+    def offsets(self) -> dict[str, float]:
+        """Seconds from the start of the step to each phase which happened."""
+        return {
+            field.name: value - self.started
+            for field in fields(self)[1:]
+            if (value := getattr(self, field.name)) is not None
+        }
+
+TimingHook = Callable[[CommandStep, StepTiming], None]
+
+_timing_hook: TimingHook | None = None
+
+def set_timing_hook(hook: TimingHook | None):
+    """
+    Sets a hook which receives the timing of every step run by `AgentShell`,
+    None removes it. Exceptions raised by the hook are ignored.
+    """
+    global _timing_hook
+    _timing_hook = hook
+
+def emit_timing(step: CommandStep, timing: StepTiming | None):
+    hook = _timing_hook
+    if hook is None or timing is None: return
+    try:
+        hook(step, timing)
+    except Exception:
+        pass
@@ -1,2 +1,4 @@
 from .command_step import *
 from .exceptions import *
+from .resource_limits import *
+from .output_redirect import *
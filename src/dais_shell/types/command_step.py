@@ -1,17 +1,54 @@
 import os
 from abc import abstractmethod
 from dataclasses import dataclass
+from enum import Enum
 from pathlib import Path
+from typing import AsyncIterable, TypeAlias
 from .exceptions import ForbiddenShellTargetError
+from .output_redirect import OutputRedirect
+from .resource_limits import ResourceLimits
 
 
+# data written to the stdin of a step, or a file connected as its stdin,
+# a relative path is under the cwd of the step
+StdinSource: TypeAlias = bytes | os.PathLike | AsyncIterable[bytes]
+
+def validate_stdin(source: object):
+    """Raises `TypeError` for a stdin source which is none of `StdinSource`, such as a str."""
+    if source is None or isinstance(source, (bytes, bytearray, memoryview, os.PathLike)): return
+    if not hasattr(source, "__aiter__"):
+        raise TypeError(f"Unsupported stdin source: {type(source).__name__}, "
+                        "expected bytes, a path or an async iterator of bytes")
+
+class StepPriority(str, Enum):
+    # admitted first by an `AdmissionScheduler`, such as commands a user waits on
+    INTERACTIVE = "interactive"
+    NORMAL = "normal"
+    # builds and test runs, admitted when no other step waits
+    BACKGROUND = "background"
+
 @dataclass
 class CommandStep:
     command: str
     args: list[str]
     cwd: str | Path
     env: dict[str, str] | None = None
-    timeout: int | None = None
+    # the hard deadline, in seconds, the process tree is killed past it
+    timeout: float | None = None
+    # the process group is signaled to stop past it, see `TerminationPolicy.signal`
+    soft_timeout: float | None = None
+    # the process tree is killed when the step writes no output for this many seconds
+    idle_timeout: float | None = None
+    limits: ResourceLimits | None = None
+    priority: StepPriority = StepPriority.NORMAL
+    # stdin is /dev/null without it
+    stdin: StdinSource | None = None
+    # written straight to files instead of being read, see `OutputRedirect`
+    stdout_redirect: OutputRedirect | None = None
+    stderr_redirect: OutputRedirect | None = None
+
+    def __post_init__(self):
+        validate_stdin(self.stdin)
 
     @abstractmethod
     def to_wrapper_script(self) -> str: ...
@@ -24,4 +61,7 @@ class CommandStep:
 
 __all__ = [
     "CommandStep",
+    "StepPriority",
+    "StdinSource",
+    "validate_stdin",
 ]
@@ -6,12 +6,29 @@ class ShellRuntimeNotFoundError(ShellError):
         super().__init__(f"Shell runtime not found: {runtime}")
 
 class ForbiddenShellTargetError(ShellError):
-    def __init__(self, command: str):
+    def __init__(self, command: str, rule: str | None = None):
         self.command = command
-        super().__init__(f"Refusing to execute shell program as target: {command}")
+        # id of the `PolicyRule` which denied the command, None for the blacklist
+        self.rule = rule
+        if rule is None:
+            super().__init__(f"Refusing to execute shell program as target: {command}")
+        else:
+            super().__init__(f"Refusing to execute {command}, denied by policy rule: {rule}")
+
+class InvalidPlanError(ShellError):
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Invalid execution plan: {reason}")
+
+class InvalidPipelineError(ShellError):
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Invalid pipeline: {reason}")
 
 __all__ = [
     "ShellError",
     "ShellRuntimeNotFoundError",
     "ForbiddenShellTargetError",
+    "InvalidPlanError",
+    "InvalidPipelineError",
 ]
@@ -0,0 +1,22 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class OutputRedirect:
+    """
+    Connects a stream of a step straight to a file, which the process writes
+    without the data passing through Python. The result only retains the
+    last `tail_lines` lines, read back from the end of the file once the step
+    exited, and the callbacks do not receive the stream. The data is not
+    decoded either: the stderr of a PowerShell step is written to the file,
+    and retained, as the CLIXML records PowerShell emits.
+    """
+    # relative to the cwd of the step
+    path: str | os.PathLike
+    append: bool = False
+    tail_lines: int = 50
+
+__all__ = [
+    "OutputRedirect",
+]
@@ -0,0 +1,104 @@
+import signal
+from dataclasses import dataclass, fields
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where limits are not applied
+    resource = None
+
+
+@dataclass
+class ResourceLimits:
+    """
+    Limits applied to the process of a step before it executes the command,
+    and inherited by its descendants. None leaves the limit unchanged.
+    """
+    # address space, Linux does not enforce a limit on the resident set size
+    memory_bytes: int | None = None
+    cpu_seconds: int | None = None
+    # counted over all processes of the user, not enforced for root
+    max_processes: int | None = None
+    max_file_bytes: int | None = None
+    max_open_files: int | None = None
+
+    def merge(self, other: "ResourceLimits | None") -> "ResourceLimits":
+        """Returns the limits of `self` overridden by the limits set in `other`."""
+        if other is None: return self
+        return ResourceLimits(**{
+            field.name: value if (value := getattr(other, field.name)) is not None else getattr(self, field.name)
+            for field in fields(self)
+        })
+
+    def rlimits(self) -> list[tuple[str, int, int, int]]:
+        """
+        Returns `(name, resource, soft, hard)` for each limit which is set, clamped to the
+        hard limits of this process. The CPU hard limit is one second above the soft limit,
+        so that the process receives SIGXCPU before it is killed.
+        """
+        if resource is None: return []
+        limits = [
+            ("memory_bytes", resource.RLIMIT_AS, self.memory_bytes, self.memory_bytes),
+            ("cpu_seconds", resource.RLIMIT_CPU, self.cpu_seconds,
+                None if self.cpu_seconds is None else self.cpu_seconds + 1),
+            ("max_processes", resource.RLIMIT_NPROC, self.max_processes, self.max_processes),
+            ("max_file_bytes", resource.RLIMIT_FSIZE, self.max_file_bytes, self.max_file_bytes),
+            ("max_open_files", resource.RLIMIT_NOFILE, self.max_open_files, self.max_open_files),
+        ]
+        result = []
+        for name, kind, soft, hard in limits:
+            if soft is None or hard is None: continue
+            current_hard = resource.getrlimit(kind)[1]
+            if current_hard != resource.RLIM_INFINITY:
+                soft, hard = min(soft, current_hard), min(hard, current_hard)
+            result.append((name, kind, soft, hard))
+        return result
+
+    def exceeded(self, returncode: int, stderr: str, cpu_time: float | None = None) -> str | None:
+        """
+        Returns the name of the limit which most likely ended the process, or None.
+        SIGXCPU and SIGXFSZ are conclusive. SIGKILL is only taken for the CPU limit
+        when `cpu_time`, the CPU seconds used by the process, shows that it was
+        reached, another process may have killed it. The other limits are recognized
+        by the error the command reports when an allocation, a fork or an open fails.
+        """
+        if resource is None or returncode == 0: return None
+        if self.cpu_seconds is not None:
+            if returncode == -signal.SIGXCPU:
+                return "cpu_seconds"
+            if returncode == -signal.SIGKILL and cpu_time is not None and cpu_time >= self.cpu_seconds:
+                return "cpu_seconds"
+        if self.max_file_bytes is not None and returncode == -signal.SIGXFSZ:
+            return "max_file_bytes"
+        for name, markers in _FAILURE_MARKERS.items():
+            if getattr(self, name) is not None and any(marker in stderr for marker in markers):
+                return name
+        return None
+
+_FAILURE_MARKERS = {
+    "memory_bytes": ("MemoryError", "Cannot allocate memory", "out of memory", "std::bad_alloc"),
+    "max_processes": ("Resource temporarily unavailable",),
+    "max_open_files": ("Too many open files",),
+    "max_file_bytes": ("File too large",),
+}
+
+# ulimit option and unit of each `ResourceLimits` field
+ULIMIT_OPTIONS = {
+    "memory_bytes": ("-v", 1024),
+    "cpu_seconds": ("-t", 1),
+    "max_processes": ("-u", 1),
+    "max_file_bytes": ("-f", 1024),
+    "max_open_files": ("-n", 1),
+}
+
+def ulimit_args(rlimits: list[tuple[str, int, int, int]]) -> list[tuple[str, int, int]]:
+    """The `(option, soft, hard)` arguments of bash's `ulimit` for the limits."""
+    result = []
+    for name, _, soft, hard in rlimits:
+        option, unit = ULIMIT_OPTIONS[name]
+        result.append((option, soft // unit, hard // unit))
+    return result
+
+__all__ = [
+    "ResourceLimits",
+]
@@ -1 +1,3 @@
 from .env_expander import EnvExpander
+from .command_resolver import CommandResolver, CommandResolverInfo
+from .loop_thread import LoopThread
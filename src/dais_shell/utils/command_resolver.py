@@ -0,0 +1,79 @@
+import os
+import shutil
+import time
+from typing import NamedTuple
+
+
+class CommandResolverInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+
+class CommandResolver:
+    """
+    Caches `shutil.which` per command and effective PATH, including negative
+    results for shell builtins and missing commands. An entry stays valid while
+    the PATH directories it depends on keep their mtime, which changes whenever
+    an entry of the directory is added, removed or renamed. The mtime of a
+    directory is re-checked at most once per `check_interval` seconds.
+    """
+    def __init__(self, check_interval: float = 1.0):
+        self._check_interval = check_interval
+        # (command, PATH) -> (resolved path, mtimes of the directories searched)
+        self._entries: dict[tuple[str, str], tuple[str | None, tuple[tuple[str, int | None], ...]]] = {}
+        # directory -> (mtime, time of the check)
+        self._mtimes: dict[str, tuple[int | None, float]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def _mtime(self, directory: str, now: float) -> int | None:
+        checked = self._mtimes.get(directory)
+        if checked is not None and now - checked[1] < self._check_interval:
+            return checked[0]
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        self._mtimes[directory] = (mtime, now)
+        return mtime
+
+    def _is_fresh(self, depends_on: tuple[tuple[str, int | None], ...], now: float) -> bool:
+        return all(self._mtime(directory, now) == mtime for directory, mtime in depends_on)
+
+    def resolve(self, command: str, path: str | None = None) -> str | None:
+        """Same as `shutil.which(command, path=path)`, `path` defaults to the PATH of this process."""
+        if os.path.dirname(command):
+            # relative or absolute paths do not depend on PATH
+            return shutil.which(command, path=path)
+        if path is None:
+            path = os.environ.get("PATH", os.defpath)
+
+        now = time.monotonic()
+        key = (command, path)
+        entry = self._entries.get(key)
+        if entry is not None and self._is_fresh(entry[1], now):
+            self._hits += 1
+            return entry[0]
+
+        self._misses += 1
+        # the mtimes are taken before searching, so that a change during
+        # the search invalidates the entry instead of going unnoticed
+        directories = [directory for directory in path.split(os.pathsep) if directory]
+        depends_on = tuple((directory, self._mtime(directory, now)) for directory in directories)
+        resolved = shutil.which(command, path=path)
+        if resolved is not None:
+            # only the directories up to the match can shadow it
+            found_in = os.path.dirname(resolved)
+            if found_in in directories:
+                depends_on = depends_on[:directories.index(found_in) + 1]
+        self._entries[key] = (resolved, depends_on)
+        return resolved
+
+    def cache_info(self) -> CommandResolverInfo:
+        return CommandResolverInfo(self._hits, self._misses, len(self._entries))
+
+    def cache_clear(self):
+        self._entries.clear()
+        self._mtimes.clear()
+        self._hits = 0
+        self._misses = 0
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from typing import Coroutine, TypeVar
+
+T = TypeVar("T")
+
+
+class LoopThread:
+    """
+    An event loop running in a daemon thread, started on first use and kept
+    until `close()`. Coroutines are submitted from any other thread, so that
+    synchronous callers share one loop instead of creating one per call.
+    """
+    def __init__(self, name: str = "dais-shell-loop"):
+        self._name = name
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    @staticmethod
+    def _serve(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks: task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._serve, args=(self._loop,),
+                                                name=self._name, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro: Coroutine[object, object, T]) -> T:
+        """
+        Runs `coro` on the loop and blocks until it finished. When the wait is
+        interrupted, for example by KeyboardInterrupt, the coroutine is canceled.
+        """
+        if self._thread is threading.current_thread():
+            coro.close()
+            raise RuntimeError("LoopThread.run() cannot be called from the loop thread")
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self):
+        """Cancels the pending tasks and stops the thread, the next `run()` starts a new one."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or thread is None: return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not threading.current_thread():
+            thread.join()
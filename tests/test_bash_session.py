@@ -0,0 +1,177 @@
+import asyncio
+import os
+import platform
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ShellResultStatus, TerminationPolicy
+
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="Bash session is not available on Windows")
+
+
+def _build_step(command: str, args: list[str] | None = None, **kwargs) -> CommandStep:
+    return CommandStep(
+        command=command,
+        args=args or [],
+        env=kwargs.pop("env", {}),
+        cwd=kwargs.pop("cwd", "."),
+        timeout=kwargs.pop("timeout", None),
+    )
+
+
+def test_session_reuses_one_process():
+    shell = AgentShell(session=True)
+    step = _build_step("python", ["-c", "import os; print(os.getppid())"])
+
+    async def _run():
+        first = await shell.run(step)
+        second = await shell.run(step)
+        await shell.aclose()
+        return first, second
+
+    first, second = asyncio.run(_run())
+
+    assert first.returncode == 0
+    assert first.stdout == second.stdout
+    assert int(first.stdout) != os.getpid()
+
+
+def test_session_output_and_returncode():
+    shell = AgentShell(session=True)
+    result = shell.run_sync(_build_step("python", ["-c", "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"]))
+    shell.close()
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.returncode == 3
+    assert result.stdout == "out"
+    assert result.stderr == "err"
+
+
+def test_session_keeps_exit_codes_in_the_signal_range():
+    shell = AgentShell(session=True)
+    interrupted = shell.run_sync(_build_step("python", ["-c", "import sys; sys.exit(130)"]))
+    killed = shell.run_sync(_build_step("python", ["-c", "import sys; sys.exit(137)"]))
+    crash = shell.run_sync(_build_step("python", ["-c", "import os, signal; os.kill(os.getpid(), signal.SIGSEGV)"]))
+    shell.close()
+
+    assert interrupted.returncode == 130
+    assert killed.returncode == 137
+    # a crash is reported the way bash reports it
+    assert crash.status == ShellResultStatus.SUCCESS
+    assert crash.returncode == 128 + 11
+
+
+def test_session_output_without_trailing_newline():
+    shell = AgentShell(session=True)
+    result = shell.run_sync(_build_step("printf", ["no-newline"]))
+    shell.close()
+
+    assert result.returncode == 0
+    assert list(result.stdout_buf) == ["no-newline"]
+
+
+def test_session_env_overlay_does_not_leak():
+    shell = AgentShell(session=True, extra_env={"BASE_VAR": "base"})
+
+    async def _run():
+        first = await shell.run(_build_step("printenv", ["STEP_VAR"], env={"STEP_VAR": "step"}))
+        second = await shell.run(_build_step("printenv", ["STEP_VAR"]))
+        base = await shell.run(_build_step("printenv", ["BASE_VAR"]))
+        await shell.aclose()
+        return first, second, base
+
+    first, second, base = asyncio.run(_run())
+
+    assert first.stdout == "step"
+    assert second.returncode != 0
+    assert base.stdout == "base"
+
+
+def test_session_respects_cwd():
+    shell = AgentShell(session=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        result = shell.run_sync(_build_step("pwd", cwd=tmpdir))
+        other = shell.run_sync(_build_step("pwd"))
+    shell.close()
+
+    assert os.path.realpath(result.stdout) == os.path.realpath(tmpdir)
+    assert os.path.realpath(other.stdout) == os.path.realpath(".")
+
+
+def test_session_timeout_keeps_session_alive():
+    shell = AgentShell(session=True)
+
+    async def _run():
+        start_time = time.monotonic()
+        timed_out = await shell.run(_build_step("sleep", ["10"], timeout=1))
+        elapsed = time.monotonic() - start_time
+        after = await shell.run(_build_step("echo", ["alive"]))
+        await shell.aclose()
+        return timed_out, elapsed, after
+
+    timed_out, elapsed, after = asyncio.run(_run())
+
+    assert elapsed < 3
+    assert timed_out.status == ShellResultStatus.TIMEOUT
+    assert timed_out.returncode == -9
+    assert after.status == ShellResultStatus.SUCCESS
+    assert after.stdout == "alive"
+
+
+def test_session_serializes_concurrent_runs():
+    shell = AgentShell(session=True)
+
+    async def _run():
+        results = await asyncio.gather(*[
+            shell.run(_build_step("echo", [str(i)])) for i in range(10)
+        ])
+        await shell.aclose()
+        return results
+
+    results = asyncio.run(_run())
+
+    assert [result.stdout for result in results] == [str(i) for i in range(10)]
+
+
+def test_session_per_event_loop_keeps_running_step():
+    shell = AgentShell(session=True)
+    slow = _build_step("python", ["-c", "import os, time; time.sleep(1); print(os.getppid())"])
+    quick = _build_step("python", ["-c", "import os; print(os.getppid())"])
+
+    async def in_flight():
+        result = await shell.run(slow)
+        await shell.aclose()
+        return result
+
+    with ThreadPoolExecutor(1) as pool:
+        running = pool.submit(asyncio.run, in_flight())
+        time.sleep(0.3)
+        # runs on the loop thread of the shell, the slow step is on another loop
+        other = shell.run_sync(quick)
+        first = running.result()
+    shell.close()
+
+    assert first.status == ShellResultStatus.SUCCESS
+    assert first.returncode == 0
+    assert other.status == ShellResultStatus.SUCCESS
+    assert first.stdout != other.stdout
+
+
+def test_session_drain_after_kill_uses_termination_policy():
+    shell = AgentShell(session=True, termination=TerminationPolicy(kill_drain_timeout=0))
+    parent = _build_step("python", ["-c", "import os; print(os.getppid())"])
+
+    before = shell.run_sync(parent)
+    timed_out = shell.run_sync(_build_step("sleep", ["10"], timeout=0.2))
+    after = shell.run_sync(parent)
+    shell.close()
+
+    # the sentinels are not awaited, the step is killed with its session
+    assert timed_out.status == ShellResultStatus.TIMEOUT
+    assert timed_out.returncode == -9
+    assert after.status == ShellResultStatus.SUCCESS
+    assert after.stdout != before.stdout
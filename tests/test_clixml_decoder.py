@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from dais_shell.clixml_decoder import ClixmlDecoder
+from dais_shell.iostream_reader import IOStreamSink
+from dais_shell.output_buffer import OutputRetention
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "clixml")
+
+
+def _fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as file:
+        return file.read()
+
+
+def _decode(data: bytes, chunk_size: int) -> bytes:
+    decoder = ClixmlDecoder()
+    output = [decoder.feed(data[i:i + chunk_size]) for i in range(0, len(data), chunk_size)]
+    return b"".join(output) + decoder.flush()
+
+
+def _sink_lines(data: bytes, chunk_size: int) -> tuple[list[str], list[str]]:
+    lines = []
+    sink = IOStreamSink(OutputRetention(), lines.append, decoder=ClixmlDecoder())
+    for i in range(0, len(data), chunk_size):
+        sink.feed(data[i:i + chunk_size])
+    sink.close()
+    return lines, sink.buffer.lines
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_decodes_error_records(chunk_size: int):
+    lines, retained = _sink_lines(_fixture("get_item_not_found.clixml"), chunk_size)
+
+    assert lines == retained
+    assert lines == [
+        "Get-Item : Cannot find path 'C:\\nonexistent_path_that_does_not_exist' because it does not exist.",
+        "At line:10 char:1",
+        "+ & 'Get-Item' 'C:\\nonexistent_path_that_does_not_exist'",
+        "+ " + "~" * 65,
+        "    + CategoryInfo          : ObjectNotFound: (C:\\nonexistent_path_that_does_not_exist:String) "
+        "[Get-Item], ItemNotFoundException",
+        "    + FullyQualifiedErrorId : PathNotFound,Microsoft.PowerShell.Commands.GetItemCommand",
+        "",
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_strips_colors_and_keeps_unicode(chunk_size: int):
+    lines, _ = _sink_lines(_fixture("pwsh7_ansi_error.clixml"), chunk_size)
+
+    assert lines == ["Write-Error: disk <C:> is full", "WARNING: retrying in 5s", "VERBOSE: 日本語 output"]
+
+
+def test_records_are_decoded_as_they_complete():
+    decoder = ClixmlDecoder()
+
+    assert decoder.feed(b'#< CLIXML\r\n<Objs xmlns="http://schemas.microsoft.com/powershell/2004/04">') == b""
+    assert decoder.feed(b'<S S="Error">first_x000D__x000A_</S><S S="Error">sec') == b"first\r\n"
+    assert decoder.feed(b'ond_x000D__x000A_</S>') == b"second\r\n"
+    assert decoder.feed(b"</Objs>") == b""
+    assert decoder.flush() == b""
+
+
+@pytest.mark.parametrize("data", [
+    b"plain error output\n",
+    b"#!not clixml\n",
+    b"#<",
+    b"",
+])
+def test_passes_other_streams_through(data: bytes):
+    assert _decode(data, 1) == data
+    assert _decode(data, 1 << 20) == data
+
+
+def test_passes_rest_through_after_parse_error():
+    data = b'#< CLIXML\n<Objs><S S="Error">ok</S><S>broken</Objs>\nraw tail\n'
+
+    assert _decode(data, 1 << 20).endswith(b"raw tail\n")
+
+
+def test_truncated_document_keeps_complete_records():
+    data = b'#< CLIXML\n<Objs><S S="Error">kept</S><S S="Error">lost'
+
+    assert _decode(data, 4) == b""
+    assert ClixmlDecoder().feed(data.replace(b"<Objs>", b'<Objs xmlns="http://schemas.microsoft.com/powershell/2004/04">')) == b"kept"
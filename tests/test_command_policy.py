@@ -0,0 +1,122 @@
+import shutil
+import time
+
+import pytest
+
+from dais_shell import AgentShell, CommandPolicy, CommandStep, ForbiddenShellTargetError, PolicyAction, PolicyRule
+
+
+def _step(command: str, args: list[str] | None = None, env: dict[str, str] | None = None) -> CommandStep:
+    return CommandStep(command=command, args=args or [], env=env or {}, cwd=".")
+
+
+def _many_rules(count: int) -> list[PolicyRule]:
+    rules = []
+    for i in range(count):
+        rules.append(PolicyRule(f"name-{i}", command=f"tool{i}"))
+        rules.append(PolicyRule(f"path-{i}", path_glob=f"/opt/vendor{i}/bin/*"))
+        rules.append(PolicyRule(f"args-{i}", command=f"cli{i}", args_pattern=rf"--danger-{i}\b"))
+    return rules
+
+
+POLICY = CommandPolicy([
+    PolicyRule("no-netcat", command="nc"),
+    PolicyRule("no-rm-root", command="rm", args_pattern=r"^-(rf|fr)\s+/(\s|$)"),
+    PolicyRule("no-force-push", command="git", args_pattern=r"\bpush\b.*(--force\b|-f\b)"),
+    PolicyRule("no-tmp-binaries", path_glob="/tmp/*"),
+    PolicyRule("no-python-path", path_glob="*/python3*"),
+    PolicyRule("allow-python-here", path_glob="*/python3*", args_pattern=r"-c print\(\w*\)", action=PolicyAction.ALLOW),
+])
+
+
+@pytest.mark.parametrize(("step", "rule"), [
+    (_step("nc", ["-l", "80"]), "no-netcat"),
+    (_step("/usr/bin/NC"), "no-netcat"),
+    (_step("rm", ["-rf", "/"]), "no-rm-root"),
+    (_step("rm", ["-fr", "$ROOT"], env={"ROOT": "/"}), "no-rm-root"),
+    (_step("git", ["push", "origin", "main", "--force"]), "no-force-push"),
+])
+def test_denied_steps_report_rule(step: CommandStep, rule: str):
+    matched = POLICY.match(step)
+
+    assert matched is not None and matched.id == rule
+
+
+@pytest.mark.parametrize("step", [
+    _step("rm", ["-rf", "/tmp/build"]),
+    _step("git", ["push", "origin", "main"]),
+    _step("ls", ["-la"]),
+])
+def test_allowed_steps(step: CommandStep):
+    assert POLICY.match(step) is None
+
+
+def test_resolved_path_is_checked():
+    assert POLICY.match(_step("tool"), "/tmp/tool").id == "no-tmp-binaries"
+    assert POLICY.match(_step("tool"), "/usr/local/bin/tool") is None
+
+
+def test_allow_rule_overrides_deny():
+    python = "/usr/bin/python3"
+
+    assert POLICY.match(_step("python3", ["-c", "import os"]), python).id == "no-python-path"
+    assert POLICY.match(_step("python3", ["-c", "print(1)"]), python) is None
+
+
+def test_allow_rule_does_not_cover_extra_arguments():
+    policy = CommandPolicy([
+        PolicyRule("no-rm-rf", command="rm", args_pattern=r"-rf\b"),
+        PolicyRule("allow-build", command="rm", args_pattern=r"-rf \./build", action=PolicyAction.ALLOW),
+    ])
+
+    assert policy.match(_step("rm", ["-rf", "./build"])) is None
+    assert policy.match(_step("rm", ["-rf", "./build", "/"])).id == "no-rm-rf"
+    assert policy.match(_step("rm", ["-rf", "/"])).id == "no-rm-rf"
+
+
+def test_patterns_with_global_flags_are_combined():
+    policy = CommandPolicy([
+        PolicyRule("no-force-push", command="git", args_pattern=r"(?i)push.*--force"),
+        PolicyRule("no-reset", command="git", args_pattern=r"(?x) reset \s+ --hard  # drops the work"),
+        PolicyRule("no-clean", command="git", args_pattern=r"clean\b"),
+    ])
+
+    assert policy.match(_step("git", ["PUSH", "origin", "--FORCE"])).id == "no-force-push"
+    assert policy.match(_step("git", ["reset", "--hard"])).id == "no-reset"
+    assert policy.match(_step("git", ["CLEAN"])) is None
+    assert policy.match(_step("git", ["clean", "-fd"])).id == "no-clean"
+
+
+def test_shell_raises_with_rule():
+    shell = AgentShell(policy=CommandPolicy([PolicyRule("no-python", path_glob="*/python*")]))
+    assert shutil.which("python") is not None
+
+    with pytest.raises(ForbiddenShellTargetError) as exc_info:
+        shell.run_sync(_step("python", ["-c", "pass"]))
+
+    assert exc_info.value.rule == "no-python"
+    assert shell.run_sync(_step("true")).returncode == 0
+
+
+def test_rule_without_condition_is_rejected():
+    with pytest.raises(ValueError):
+        CommandPolicy([PolicyRule("everything")])
+
+
+def test_check_time_does_not_grow_with_rules():
+    def check_time(policy: CommandPolicy) -> float:
+        step = _step("cli7", ["--danger-none", "--verbose"])
+        start = time.perf_counter()
+        for _ in range(500):
+            assert policy.match(step, "/usr/bin/cli7") is None
+        return time.perf_counter() - start
+
+    small = min(check_time(CommandPolicy(_many_rules(100))) for _ in range(3))
+    large_policy = CommandPolicy(_many_rules(10000))
+    large = min(check_time(large_policy) for _ in range(3))
+
+    assert large_policy.match(_step("tool9999")).id == "name-9999"
+    assert large_policy.match(_step("x"), "/opt/vendor5000/bin/x").id == "path-5000"
+    assert large_policy.match(_step("cli9950", ["--danger-9950"])).id == "args-9950"
+    # 100 times the rules, the check may only cost a few times more
+    assert large < small * 10
@@ -0,0 +1,71 @@
+import os
+import shutil
+
+from dais_shell import AgentShell, CommandStep
+from dais_shell.utils import CommandResolver
+
+
+def _make_executable(directory, name: str) -> str:
+    path = directory / name
+    path.write_text("#!/bin/sh\necho ok\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_resolve_caches_hits_and_misses(tmp_path):
+    tool = _make_executable(tmp_path, "tool")
+    resolver = CommandResolver()
+
+    assert resolver.resolve("tool", str(tmp_path)) == tool
+    assert resolver.resolve("tool", str(tmp_path)) == tool
+    assert resolver.resolve("missing", str(tmp_path)) is None
+    assert resolver.resolve("missing", str(tmp_path)) is None
+
+    assert resolver.cache_info() == (2, 2, 2)
+
+
+def test_resolve_invalidates_when_path_directory_changes(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    path = os.pathsep.join([str(first), str(second)])
+    resolver = CommandResolver(check_interval=0)
+
+    assert resolver.resolve("tool", path) is None
+    in_second = _make_executable(second, "tool")
+    assert resolver.resolve("tool", path) == in_second
+    # a new entry earlier in PATH shadows the cached one
+    in_first = _make_executable(first, "tool")
+    assert resolver.resolve("tool", path) == in_first
+    os.remove(in_first)
+    assert resolver.resolve("tool", path) == in_second
+
+
+def test_resolve_throttles_mtime_checks(tmp_path):
+    resolver = CommandResolver(check_interval=3600)
+
+    assert resolver.resolve("tool", str(tmp_path)) is None
+    _make_executable(tmp_path, "tool")
+    assert resolver.resolve("tool", str(tmp_path)) is None
+
+    resolver.cache_clear()
+    assert resolver.resolve("tool", str(tmp_path)) == str(tmp_path / "tool")
+
+
+def test_resolve_bypasses_cache_for_paths(tmp_path):
+    tool = _make_executable(tmp_path, "tool")
+    resolver = CommandResolver()
+
+    assert resolver.resolve(tool) == tool
+    assert resolver.cache_info().size == 0
+
+
+def test_shell_resolves_command_with_step_path(tmp_path):
+    _make_executable(tmp_path, "tool")
+    shell = AgentShell()
+    path = os.pathsep.join([str(tmp_path), os.path.dirname(shutil.which("sh"))])
+    step = CommandStep(command="tool", args=[], env={"PATH": path}, cwd=".")
+
+    assert shell.run_sync(step).stdout == "ok"
+    assert shell.run_sync(step).stdout == "ok"
+    assert shell.command_resolver.cache_info().hits >= 1
@@ -103,3 +103,62 @@ def test_essential_vars_include_platform_specific_markers():
         assert "HOME" in ESSENTIAL_VARS
         assert "DYLD_LIBRARY_PATH" not in ESSENTIAL_VARS
         assert "SYSTEMROOT" not in ESSENTIAL_VARS
+
+
+def test_build_caches_filtered_base_environment(monkeypatch):
+    _patch_environ(monkeypatch, {"PATH": "base_path"})
+    EnvBuilder.invalidate_cache()
+    calls = 0
+    original = EnvBuilder._filter_environ
+
+    def _counting_filter(self):
+        nonlocal calls
+        calls += 1
+        return original(self)
+
+    monkeypatch.setattr(EnvBuilder, "_filter_environ", _counting_filter)
+    builder = EnvBuilder(extra_paths=["extra"])
+
+    for i in range(10):
+        assert builder.with_extra({"STEP": str(i)}).build()["STEP"] == str(i)
+
+    assert calls == 1
+
+
+def test_build_result_does_not_share_cached_base(monkeypatch):
+    _patch_environ(monkeypatch, {"PATH": "base_path"})
+
+    first = EnvBuilder().build()
+    first["PATH"] = "mutated"
+
+    assert EnvBuilder().build()["PATH"] == "base_path"
+
+
+def test_cache_is_invalidated_when_environ_changes(monkeypatch):
+    _patch_environ(monkeypatch, {"PATH": "base_path"})
+    builder = EnvBuilder()
+    assert builder.build()["PATH"] == "base_path"
+
+    env_builder_module.os.environ["PATH"] = "new_path"
+    env_builder_module.os.environ["TMP"] = "temp_path"
+
+    final_env = builder.build()
+    assert final_env["PATH"] == "new_path"
+    assert final_env["TMP"] == "temp_path"
+
+
+def test_cache_is_per_blacklist(monkeypatch):
+    _patch_environ(monkeypatch, {"PATH": "base_path", "TMP": "temp_path"})
+
+    assert "TMP" in EnvBuilder().build()
+    assert "TMP" not in EnvBuilder(blacklist={"TMP"}).build()
+    assert "TMP" in EnvBuilder().build()
+
+
+def test_cache_tracks_real_os_environ(monkeypatch):
+    EnvBuilder.invalidate_cache()
+    monkeypatch.setenv("LC_CTYPE", "C.UTF-8")
+    assert EnvBuilder().build()["LC_CTYPE"] == "C.UTF-8"
+
+    monkeypatch.setenv("LC_CTYPE", "en_US.UTF-8")
+    assert EnvBuilder().build()["LC_CTYPE"] == "en_US.UTF-8"
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import platform
+import signal
+import sys
+import time
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ResourceLimits, ShellResultStatus, SpawnBackend
+from dais_shell.fork_server import ForkServer
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="the fork server needs Unix sockets")
+
+
+def _step(code: str, cwd: str = ".", **kwargs) -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env=kwargs.pop("env", {}), cwd=cwd, **kwargs)
+
+
+@pytest.fixture
+def shell():
+    shell = AgentShell(spawn_backend=SpawnBackend.FORK_SERVER)
+    yield shell
+    shell.close()
+
+
+def test_steps_are_spawned_by_helper(shell: AgentShell, tmp_path):
+    code = "import os, sys; print(os.getppid(), os.getcwd(), os.environ['DAIS_VALUE']); print('err', file=sys.stderr); sys.exit(5)"
+
+    result = shell.run_sync(_step(code, cwd=str(tmp_path), env={"DAIS_VALUE": "x"}))
+
+    parent, cwd, value = result.stdout.split()
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.returncode == 5
+    assert int(parent) != os.getpid()
+    assert (cwd, value, result.stderr) == (os.path.realpath(tmp_path), "x", "err")
+
+
+def test_limits_are_applied(shell: AgentShell):
+    code = "import resource; print(resource.getrlimit(resource.RLIMIT_NOFILE)[0])"
+
+    result = shell.run_sync(_step(code, limits=ResourceLimits(max_open_files=64)))
+
+    assert result.stdout == "64"
+    assert result.cpu_time is not None
+
+
+def test_concurrent_steps(shell: AgentShell):
+    async def main():
+        return await asyncio.gather(*(shell.run(_step(f"print({i})")) for i in range(20)))
+
+    results = asyncio.run(main())
+
+    assert [result.stdout for result in results] == [str(i) for i in range(20)]
+
+
+def test_timeout_kills_process_group(shell: AgentShell):
+    script = "import subprocess, time; subprocess.Popen(['sleep', '60']); time.sleep(60)"
+    start = time.monotonic()
+
+    result = shell.run_sync(_step(script, timeout=1))
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert time.monotonic() - start < 5
+
+
+def test_missing_executable_raises():
+    server = ForkServer()
+
+    async def main():
+        await server.spawn(["/nonexistent/dais-binary"], None, {})
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(main())
+    server.close()
+
+
+def test_helper_exit_kills_children_and_restarts():
+    server = ForkServer()
+
+    async def main():
+        proc = await server.spawn([sys.executable, "-c", "import time; time.sleep(60)"], None, {})
+        assert server._helper is not None
+        os.kill(server._helper.pid, signal.SIGKILL)
+        returncode = await asyncio.wait_for(proc.wait(), 5)
+        again = await server.spawn([sys.executable, "-c", "pass"], None, {})
+        return returncode, await asyncio.wait_for(again.wait(), 5)
+
+    assert asyncio.run(main()) == (-signal.SIGKILL, 0)
+    server.close()
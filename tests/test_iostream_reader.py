@@ -0,0 +1,152 @@
+import asyncio
+
+from dais_shell import AgentShell, CommandStep, OutputRetention
+from dais_shell.iostream_reader import IOStreamBuffer, IOStreamReader, IOStreamSink, LineSplitter
+
+
+def _split_all(chunks: list[bytes], max_line_bytes: int | None = None) -> list[bytes]:
+    splitter = LineSplitter(max_line_bytes)
+    lines = []
+    for chunk in chunks:
+        lines.extend(splitter.feed(chunk))
+    lines.extend(splitter.flush())
+    return lines
+
+
+def test_line_splitter_joins_lines_across_chunks():
+    assert _split_all([b"hel", b"lo\nwor", b"ld\n", b"tail"]) == [b"hello", b"world", b"tail"]
+
+
+def test_line_splitter_strips_crlf_across_chunks():
+    assert _split_all([b"first\r", b"\nsecond\r\n"]) == [b"first", b"second"]
+
+
+def test_line_splitter_keeps_empty_lines():
+    assert _split_all([b"\n\na\n"]) == [b"", b"", b"a"]
+
+
+def test_buffer_decodes_multibyte_characters_split_between_chunks():
+    encoded = "你好世界\n🎉\n".encode("utf-8")
+    chunks = [encoded[i:i + 1] for i in range(len(encoded))]
+    buf = IOStreamBuffer()
+    buf.extend(_split_all(chunks))
+
+    assert list(buf) == ["你好世界", "🎉"]
+
+
+def test_buffer_keeps_last_lines_and_caches_text():
+    buf = IOStreamBuffer(OutputRetention(head_bytes=0, max_lines=2))
+    buf.extend([b"1", b"2", b"3"])
+
+    assert buf.text == "... 1 lines (2 bytes) omitted ...\n2\n3"
+    assert buf.text is buf.text
+    buf.append(b"4")
+    assert buf.lines[1:] == ["3", "4"]
+    assert buf.dropped_lines == 2
+
+
+def test_consumer_delivers_complete_lines_to_callback():
+    received = []
+    sink = IOStreamSink(OutputRetention(), received.append)
+
+    async def _run():
+        stream = asyncio.StreamReader()
+        for chunk in [b"a", b"bc\nd", "é\n".encode("utf-8")[:1], "é\n".encode("utf-8")[1:], b"last"]:
+            stream.feed_data(chunk)
+        stream.feed_eof()
+        await IOStreamReader._consumer(stream, sink)
+
+    asyncio.run(_run())
+
+    assert received == ["abc", "dé", "last"]
+    assert sink.buffer.text == "abc\ndé\nlast"
+
+
+def test_high_volume_output_is_complete():
+    shell = AgentShell(retention=OutputRetention(tail_bytes=64 * 1024 * 1024))
+    step = CommandStep(
+        command="python",
+        args=["-c", "import sys; sys.stdout.write(''.join(f'{i}\\n' for i in range(200000)))"],
+        env={},
+        cwd=".",
+    )
+    count = 0
+    def _count(_: str):
+        nonlocal count
+        count += 1
+
+    result = shell.run_sync(step, on_stdout=_count)
+
+    assert result.returncode == 0
+    assert count == 200000
+    assert len(result.stdout_buf) == 200000
+    assert result.stdout_buf.lines[-1] == "199999"
+
+
+def test_buffer_keeps_head_and_tail_within_budget():
+    buf = IOStreamBuffer(OutputRetention(head_bytes=10, tail_bytes=10))
+    for i in range(100):
+        buf.extend([b"line%02d" % i])
+
+    assert buf.lines == [
+        "line00",
+        "... 98 lines (686 bytes) omitted ...",
+        "line99",
+    ]
+    assert buf.dropped_lines == 98
+    assert buf.dropped_bytes == 98 * len(b"lineNN\n")
+
+
+def test_buffer_drop_counts_are_exact_with_large_batches():
+    buf = IOStreamBuffer(OutputRetention(head_bytes=0, tail_bytes=1000))
+    total_lines = 0
+    for batch in range(50):
+        lines = [b"x" * (batch % 7) for _ in range(37)]
+        total_lines += len(lines)
+        buf.extend(lines)
+
+    retained = len(buf) - 1
+    assert buf.dropped_lines + retained == total_lines
+    assert sum(len(line) + 1 for line in buf.lines[1:]) <= 1000
+
+
+def test_line_splitter_splits_overlong_lines():
+    lines = _split_all([b"a" * 25 + b"\nshort\n"], max_line_bytes=10)
+
+    assert lines == [b"a" * 10, b"a" * 10, b"a" * 5, b"short"]
+
+
+def test_line_splitter_bounds_unterminated_line():
+    splitter = LineSplitter(max_line_bytes=100)
+    emitted = []
+    for _ in range(1000):
+        emitted.extend(splitter.feed(b"x" * 64))
+
+    assert all(len(line) == 100 for line in emitted)
+    assert sum(map(len, emitted)) + sum(map(len, splitter.flush())) == 64000
+
+
+def test_line_splitter_does_not_cut_multibyte_characters():
+    text = "你好世界" * 10
+    lines = _split_all([text.encode("utf-8")], max_line_bytes=10)
+
+    assert all(len(line) <= 10 for line in lines)
+    assert "".join(line.decode("utf-8") for line in lines) == text
+
+
+def test_huge_single_line_output_is_bounded():
+    retention = OutputRetention(head_bytes=1024, tail_bytes=1024, max_line_bytes=256)
+    shell = AgentShell(retention=retention)
+    step = CommandStep(
+        command="python",
+        args=["-c", "import sys; sys.stdout.write('x' * (32 * 1024 * 1024))"],
+        env={},
+        cwd=".",
+    )
+
+    result = shell.run_sync(step)
+
+    assert result.returncode == 0
+    assert len(result.stdout) < 4096
+    retained = sum(len(line) for line in result.stdout_buf.lines if line.startswith("x"))
+    assert retained + result.stdout_buf.dropped_bytes - result.stdout_buf.dropped_lines == 32 * 1024 * 1024
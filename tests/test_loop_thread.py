@@ -0,0 +1,93 @@
+import asyncio
+import platform
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ShellResultStatus
+from dais_shell.utils import LoopThread
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="uses python steps with bash")
+
+
+def _python_step(code: str) -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=".")
+
+
+def _loop_threads() -> list[threading.Thread]:
+    return [thread for thread in threading.enumerate() if thread.name == "dais-shell-loop"]
+
+
+def test_concurrent_callers_share_one_loop():
+    shell = AgentShell()
+    before = len(_loop_threads())
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: shell.run_sync(_python_step(f"print({i})")), range(32)))
+
+    assert [result.stdout for result in results] == [str(i) for i in range(32)]
+    assert len(_loop_threads()) == before + 1
+    shell.close()
+    assert len(_loop_threads()) == before
+
+
+def test_run_sync_inside_running_loop():
+    async def main():
+        return AgentShell().run_sync(_python_step("print('nested')"))
+
+    result = asyncio.run(main())
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.stdout == "nested"
+
+
+def test_callbacks_run_on_loop_thread():
+    shell = AgentShell()
+    threads = []
+
+    shell.run_sync(_python_step("print('x')"), on_stdout=lambda _: threads.append(threading.current_thread().name))
+    shell.close()
+
+    assert threads == ["dais-shell-loop"]
+
+
+def test_run_from_loop_thread_is_rejected():
+    loop_thread = LoopThread()
+
+    async def reenter():
+        async def noop(): pass
+        loop_thread.run(noop())
+
+    with pytest.raises(RuntimeError):
+        loop_thread.run(reenter())
+    loop_thread.close()
+
+
+def test_close_restarts_on_next_run():
+    loop_thread = LoopThread()
+
+    async def current() -> asyncio.AbstractEventLoop:
+        return asyncio.get_running_loop()
+
+    first = loop_thread.run(current())
+    assert loop_thread.run(current()) is first
+    loop_thread.close()
+
+    assert not loop_thread.running
+    assert first.is_closed()
+    assert not loop_thread.run(current()).is_closed()
+    loop_thread.close()
+
+
+def test_session_persists_across_run_sync_calls():
+    shell = AgentShell(session=True)
+    step = CommandStep(command="python", args=["-c", "import os; print(os.getppid())"], env={}, cwd=".")
+
+    first = shell.run_sync(step)
+    second = shell.run_sync(step)
+    shell.close()
+
+    assert first.returncode == 0
+    assert first.stdout == second.stdout
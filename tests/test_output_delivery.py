@@ -0,0 +1,139 @@
+import asyncio
+import sys
+import time
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, OutputDelivery, OverflowPolicy, ShellResultStatus, TerminationPolicy
+
+
+def _print_lines(count: int, delay: float = 0) -> CommandStep:
+    code = f"import time\nfor i in range({count}):\n    print(i, flush=True)\n    time.sleep({delay})"
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=".", timeout=30)
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["spawn", "session"])
+def test_async_callback_receives_every_line_in_order(session: bool):
+    if session and sys.platform == "win32":
+        pytest.skip("sessions are bash only")
+    received = []
+
+    async def on_stdout(line: str):
+        await asyncio.sleep(0)
+        received.append(line)
+
+    shell = AgentShell(session=session)
+    result = shell.run_sync(_print_lines(1000), on_stdout=on_stdout)
+    shell.close()
+
+    assert received == [str(i) for i in range(1000)]
+    assert result.stdout_delivery.delivered_lines == 1000
+    assert result.stdout_delivery.dropped_lines == 0
+    # no callback, nothing to report
+    assert result.stderr_delivery is None
+
+
+def test_batched_by_count():
+    batches = []
+    shell = AgentShell(delivery=OutputDelivery(batch_lines=100))
+
+    shell.run_sync(_print_lines(1000), on_stdout=batches.append)
+
+    assert all(len(batch) <= 100 for batch in batches)
+    assert [line for batch in batches for line in batch] == [str(i) for i in range(1000)]
+
+
+def test_batched_by_time_window():
+    batches = []
+    shell = AgentShell(delivery=OutputDelivery(batch_interval=0.05))
+
+    shell.run_sync(_print_lines(4, delay=0.2), on_stdout=batches.append)
+
+    assert batches == [["0"], ["1"], ["2"], ["3"]]
+
+
+def test_slow_callback_does_not_stall_reading_when_dropping():
+    received = []
+
+    async def on_stdout(line: str):
+        await asyncio.sleep(0.001)
+        received.append(line)
+
+    shell = AgentShell(delivery=OutputDelivery(max_queued_lines=100, overflow=OverflowPolicy.DROP_OLDEST))
+    result = shell.run_sync(_print_lines(20000), on_stdout=on_stdout)
+
+    stats = result.stdout_delivery
+    # the queue is flushed right after the process exits
+    assert result.timing.drained - result.timing.exited < 1
+    assert stats.dropped_lines > 0
+    assert stats.delivered_lines + stats.dropped_lines == 20000
+    assert received[-1] == "19999"
+
+
+def test_coalesce_reports_skipped_lines():
+    received = []
+
+    async def on_stdout(line: str):
+        await asyncio.sleep(0.001)
+        received.append(line)
+
+    shell = AgentShell(delivery=OutputDelivery(max_queued_lines=100, overflow=OverflowPolicy.COALESCE))
+    result = shell.run_sync(_print_lines(20000), on_stdout=on_stdout)
+
+    markers = [line for line in received if line.endswith("lines skipped ...")]
+    assert markers
+    skipped = sum(int(line.split()[1]) for line in markers)
+    assert skipped == result.stdout_delivery.dropped_lines
+    assert len(received) - len(markers) + skipped == 20000
+
+
+def test_block_delivers_everything_and_reports_lag():
+    received = []
+
+    def on_stdout(line: str):
+        time.sleep(0.0001)
+        received.append(line)
+
+    shell = AgentShell(delivery=OutputDelivery(max_queued_lines=10))
+    result = shell.run_sync(_print_lines(2000), on_stdout=on_stdout)
+
+    assert received == [str(i) for i in range(2000)]
+    assert result.stdout_delivery.dropped_lines == 0
+    assert result.stdout_delivery.max_lag > 0
+    assert result.stdout_delivery.mean_lag <= result.stdout_delivery.max_lag
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["spawn", "session"])
+def test_block_keeps_reading_past_the_drain_timeout(session: bool):
+    if session and sys.platform == "win32":
+        pytest.skip("sessions are bash only")
+    received = []
+
+    async def on_stderr(line: str):
+        await asyncio.sleep(0.0005)
+        received.append(line)
+
+    # the pipes still hold seconds of output for the callback when the step exits
+    code = "import sys\nfor i in range(6000):\n    print(str(i).rjust(100), file=sys.stderr)"
+    step = CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=".", timeout=30)
+    shell = AgentShell(session=session, delivery=OutputDelivery(max_queued_lines=10),
+                       termination=TerminationPolicy(drain_timeout=0.1))
+    result = shell.run_sync(step, on_stderr=on_stderr)
+    shell.close()
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.returncode == 0
+    assert [line.strip() for line in received] == [str(i) for i in range(6000)]
+    assert len(result.stderr_buf) == 6000
+    assert result.stderr_delivery.dropped_lines == 0
+
+
+def test_failing_callback_is_reported():
+    async def on_stdout(line: str):
+        raise ValueError(line)
+
+    result = AgentShell().run_sync(_print_lines(10), on_stdout=on_stdout)
+
+    assert result.returncode == 0
+    assert result.stdout == "\n".join(str(i) for i in range(10))
+    assert isinstance(result.stdout_delivery.error, ValueError)
@@ -0,0 +1,86 @@
+import sys
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, OutputNormalization, OutputRetention
+from dais_shell.output_buffer import LineSplitter
+from dais_shell.output_normalizer import OutputNormalizer
+
+
+def _fold_all(chunks: list[bytes]) -> list[bytes]:
+    splitter = LineSplitter(fold_carriage_returns=True)
+    lines = []
+    for chunk in chunks:
+        lines.extend(splitter.feed(chunk))
+    lines.extend(splitter.flush())
+    return lines
+
+
+def _normalize(lines: list[bytes], **options) -> list[bytes]:
+    normalizer = OutputNormalizer(OutputNormalization(**options))
+    return normalizer.process(lines) + normalizer.flush()
+
+
+def test_fold_keeps_last_frame():
+    assert _fold_all([b"10%\r50%\r100%\ndone\n"]) == [b"100%", b"done"]
+
+
+def test_fold_across_chunks_keeps_crlf():
+    assert _fold_all([b"10%\r", b"50%\r", b"100%\r", b"\nnext\r\n"]) == [b"100%", b"next"]
+
+
+def test_fold_does_not_hold_overwritten_frames():
+    splitter = LineSplitter(fold_carriage_returns=True)
+    for i in range(10000):
+        splitter.feed(b"frame %d\r" % i)
+
+    assert splitter._pending_size < 32
+    assert splitter.flush() == [b"frame 9999"]
+
+
+@pytest.mark.parametrize(("line", "expected"), [
+    (b"\x1b[1;31merror\x1b[0m: failed", b"error: failed"),
+    (b"\x1b]0;title\x07prompt", b"prompt"),
+    (b"\x1b[2Kclear\x1b[?25l", b"clear"),
+])
+def test_strip_ansi(line: bytes, expected: bytes):
+    assert _normalize([line], collapse_repeats=False) == [expected]
+
+
+def test_collapse_identical_runs():
+    lines = [b"a", b"retry", b"retry", b"retry", b"b", b"b"]
+
+    assert _normalize(lines) == [b"a", b"retry [repeated 3 times]", b"b [repeated 2 times]"]
+
+
+def test_collapse_runs_across_batches():
+    normalizer = OutputNormalizer(OutputNormalization())
+
+    assert normalizer.process([b"x", b"x"]) == []
+    assert normalizer.process([b"x", b"y"]) == [b"x [repeated 3 times]"]
+    assert normalizer.flush() == [b"y"]
+
+
+def test_collapse_similar_lines_keeps_last():
+    lines = [b"Downloading 1/300", b"Downloading 2/300", b"Downloading 300/300", b"done"]
+
+    assert _normalize(lines) == lines
+    assert _normalize(lines, collapse_similar=True) == [b"Downloading 300/300 [repeated 3 times]", b"done"]
+
+
+def test_shell_normalizes_progress_output():
+    code = (
+        "import sys\n"
+        "for i in range(1000): sys.stdout.write(f'\\r\\x1b[32m{i / 10:.1f}%\\x1b[0m')\n"
+        "print()\n"
+        "for _ in range(500): print('waiting for lock')\n"
+        "print('done')\n"
+    )
+    retention = OutputRetention(normalization=OutputNormalization())
+    step = CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=".")
+    lines = []
+
+    result = AgentShell(retention=retention).run_sync(step, on_stdout=lines.append)
+
+    assert result.stdout == "99.9%\nwaiting for lock [repeated 500 times]\ndone"
+    assert lines == result.stdout_buf.lines
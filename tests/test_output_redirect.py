@@ -0,0 +1,93 @@
+import asyncio
+import platform
+import sys
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, OutputRedirect, Pipeline, ShellResultStatus, SpawnBackend
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="uses POSIX commands")
+
+PRINT_LINES = "import sys\nfor i in range(100000): print(i)\nprint('err', file=sys.stderr)"
+
+
+def _step(code: str, cwd: str, **kwargs) -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=cwd, **kwargs)
+
+
+@pytest.fixture(params=["subprocess", "posix_spawn", "fork_server", "session"])
+def shell(request):
+    if request.param == "session":
+        shell = AgentShell(session=True)
+    else:
+        shell = AgentShell(spawn_backend=SpawnBackend(request.param))
+    yield shell
+    shell.close()
+
+
+def test_stdout_to_file_keeps_tail(shell: AgentShell, tmp_path):
+    lines = []
+    step = _step(PRINT_LINES, str(tmp_path), stdout_redirect=OutputRedirect("out.log", tail_lines=3))
+
+    result = shell.run_sync(step, on_stdout=lines.append)
+
+    content = (tmp_path / "out.log").read_text()
+    assert result.status == ShellResultStatus.SUCCESS
+    assert content.split() == [str(i) for i in range(100000)]
+    assert result.stdout.split() == ["99997", "99998", "99999"]
+    assert result.stdout_redirected.size == len(content)
+    assert result.stdout_redirected.path == str(tmp_path / "out.log")
+    assert result.stderr == "err"
+    assert result.stderr_redirected is None
+    assert lines == []
+
+
+def test_append_counts_only_new_output(shell: AgentShell, tmp_path):
+    (tmp_path / "err.log").write_text("old\n")
+    step = _step("import sys; print('new', file=sys.stderr)", str(tmp_path),
+                 stderr_redirect=OutputRedirect("err.log", append=True))
+
+    result = shell.run_sync(step)
+
+    assert (tmp_path / "err.log").read_text() == "old\nnew\n"
+    assert result.stderr == "new"
+    assert result.stderr_redirected.size == 4
+
+
+def test_tail_of_output_without_newline(tmp_path):
+    shell = AgentShell()
+    step = _step("import sys; sys.stdout.write('a\\nb\\nc')", str(tmp_path),
+                 stdout_redirect=OutputRedirect("out.log", tail_lines=2))
+
+    result = shell.run_sync(step)
+    shell.close()
+
+    assert result.stdout_buf.lines == ["b", "c"]
+    assert result.stdout_redirected.size == 5
+
+
+def test_idle_timeout_sees_file_writes(tmp_path):
+    shell = AgentShell()
+    code = "import time\nfor i in range(6):\n    print(i, flush=True)\n    time.sleep(0.1)"
+    step = _step(code, str(tmp_path), stdout_redirect=OutputRedirect("out.log"), idle_timeout=0.4)
+
+    result = shell.run_sync(step)
+    shell.close()
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.stdout.split() == [str(i) for i in range(6)]
+
+
+def test_pipeline_stdout_to_file(tmp_path):
+    shell = AgentShell()
+    pipeline = Pipeline([
+        _step("for i in range(1000): print(i)", str(tmp_path)),
+        CommandStep(command="tail", args=["-n", "5"], env={}, cwd=str(tmp_path),
+                    stdout_redirect=OutputRedirect("tail.log", tail_lines=1)),
+    ])
+
+    result = asyncio.run(shell.run_pipeline(pipeline))
+
+    assert (tmp_path / "tail.log").read_text().split() == ["995", "996", "997", "998", "999"]
+    assert result.stdout == "999"
+    assert result.stage_returncodes == [0, 0]
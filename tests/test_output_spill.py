@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, OutputRetention
+from dais_shell.output_spill import SpillFile
+
+
+def _write_lines(spill: SpillFile, count: int, chunk_lines: int = 7):
+    data = b"".join(b"line %d\n" % i for i in range(count))
+    # uneven chunks, so that lines are split across writes
+    step = len(b"line 0\n") * chunk_lines + 3
+    for offset in range(0, len(data), step):
+        spill.write(data[offset:offset + step])
+    spill.finish()
+
+
+def test_spill_pages_lines_across_checkpoints(monkeypatch):
+    monkeypatch.setattr(SpillFile, "CHECKPOINT_BYTES", 64)
+    with SpillFile() as spill:
+        _write_lines(spill, 1000)
+
+        assert spill.line_count == 1000
+        assert len(spill._checkpoints) > 10
+        assert spill.page(0, 2) == ["line 0", "line 1"]
+        assert spill.page(500, 3) == ["line 500", "line 501", "line 502"]
+        assert spill.page(998, 10) == ["line 998", "line 999"]
+        assert spill.page(1000, 10) == []
+
+
+def test_spill_pages_unterminated_last_line_and_crlf():
+    with SpillFile() as spill:
+        spill.write(b"first\r\nsecond\nlast")
+        spill.finish()
+
+        assert spill.line_count == 3
+        assert spill.page(0, 3) == ["first", "second", "last"]
+
+
+def test_spill_close_removes_file():
+    spill = SpillFile()
+    _write_lines(spill, 10)
+    assert spill.page(0, 1) == ["line 0"]
+    assert os.path.exists(spill.path)
+
+    spill.close()
+
+    assert not os.path.exists(spill.path)
+    with pytest.raises(ValueError):
+        spill.page(0, 1)
+
+
+def test_shell_result_pages_full_output_beyond_retention(tmp_path):
+    retention = OutputRetention(head_bytes=64, tail_bytes=64, spill_to_disk=True, spill_dir=str(tmp_path))
+    shell = AgentShell(retention=retention)
+    step = CommandStep(
+        command="python",
+        args=["-c", "for i in range(100000): print(f'row {i}')"],
+        env={},
+        cwd=".",
+    )
+
+    with shell.run_sync(step) as result:
+        assert result.returncode == 0
+        assert result.stdout_buf.dropped_lines > 0
+        assert result.stdout_spill is not None
+        assert result.stdout_spill.line_count == 100000
+        assert result.stdout_page(50000, 2) == ["row 50000", "row 50001"]
+        assert result.stderr_page(0, 10) == []
+        assert len(os.listdir(tmp_path)) == 2
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_shell_result_pages_retained_lines_without_spill():
+    shell = AgentShell()
+    step = CommandStep(command="python", args=["-c", "print('a'); print('b')"], env={}, cwd=".")
+
+    result = shell.run_sync(step)
+
+    assert result.stdout_spill is None
+    assert result.stdout_page(1, 5) == ["b"]
@@ -0,0 +1,127 @@
+import asyncio
+import platform
+import signal
+import sys
+import time
+
+import pytest
+
+from dais_shell import (
+    AgentShell,
+    CommandStep,
+    ForbiddenShellTargetError,
+    InvalidPipelineError,
+    Pipeline,
+    ResourceLimits,
+    ShellResultStatus,
+)
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="pipelines are POSIX only")
+
+
+def _python(code: str, **kwargs) -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=".", **kwargs)
+
+
+def _step(command: str, *args: str, **kwargs) -> CommandStep:
+    return CommandStep(command=command, args=list(args), env={}, cwd=".", **kwargs)
+
+
+def _run(shell: AgentShell, pipeline: Pipeline):
+    return asyncio.run(shell.run_pipeline(pipeline))
+
+
+@pytest.fixture
+def shell():
+    shell = AgentShell()
+    yield shell
+    shell.close()
+
+
+def test_stages_are_connected(shell: AgentShell):
+    pipeline = Pipeline([
+        _python("for i in range(1000): print(i)"),
+        _step("grep", "7"),
+        _step("wc", "-l"),
+    ])
+
+    result = _run(shell, pipeline)
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.stdout.strip() == str(sum("7" in str(i) for i in range(1000)))
+    assert result.stage_returncodes == [0, 0, 0]
+
+
+def test_large_stream_between_stages(shell: AgentShell):
+    result = _run(shell, Pipeline([_step("head", "-c", "50000000", "/dev/zero"), _step("wc", "-c")]))
+
+    assert result.stdout.strip() == "50000000"
+
+
+def test_each_stage_reports_its_exit_code(shell: AgentShell):
+    pipeline = Pipeline([
+        _python("import sys; print('a'); print('first', file=sys.stderr); sys.exit(3)"),
+        _python("import sys; sys.stdout.write(sys.stdin.read()); print('second', file=sys.stderr)"),
+    ])
+
+    result = _run(shell, pipeline)
+
+    assert result.returncode == 0
+    assert result.stage_returncodes == [3, 0]
+    assert result.stdout == "a"
+    assert sorted(result.stderr.split()) == ["first", "second"]
+
+
+def test_stage_limits_are_checked(shell: AgentShell):
+    pipeline = Pipeline([
+        _python("while True: pass", limits=ResourceLimits(cpu_seconds=1)),
+        _step("cat"),
+    ], timeout=30)
+
+    result = _run(shell, pipeline)
+
+    assert result.status == ShellResultStatus.LIMIT_EXCEEDED
+    assert result.exceeded_limit == "cpu_seconds"
+    assert result.stage_returncodes == [-signal.SIGXCPU, 0]
+    assert result.returncode == 0
+
+
+def test_stdin_of_first_stage(shell: AgentShell):
+    result = _run(shell, Pipeline([_step("cat", stdin=b"b\na\n"), _step("sort")]))
+
+    assert result.stdout.split() == ["a", "b"]
+
+
+def test_timeout_kills_every_stage(shell: AgentShell):
+    pipeline = Pipeline([_step("sleep", "30"), _step("sleep", "30")], timeout=0.3)
+    start = time.monotonic()
+
+    result = _run(shell, pipeline)
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert time.monotonic() - start < 3
+    assert all(code is not None and code < 0 for code in result.stage_returncodes)
+
+
+def test_stages_are_checked(shell: AgentShell):
+    with pytest.raises(ForbiddenShellTargetError):
+        _run(shell, Pipeline([_step("echo", "x"), _step("bash", "-c", "cat")]))
+
+
+def test_invalid_pipelines():
+    with pytest.raises(InvalidPipelineError):
+        Pipeline([])
+    with pytest.raises(InvalidPipelineError):
+        Pipeline([_step("echo"), _step("cat", stdin=b"x")])
+
+
+def test_session_runtime_spawns_pipelines():
+    shell = AgentShell(session=True)
+
+    async def main():
+        return await shell.run_pipeline(Pipeline([_step("echo", "one"), _step("tr", "a-z", "A-Z")]))
+
+    result = asyncio.run(main())
+    shell.close()
+
+    assert result.stdout == "ONE"
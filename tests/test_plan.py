@@ -0,0 +1,135 @@
+import asyncio
+import platform
+import time
+
+import pytest
+
+from dais_shell import (
+    AgentShell,
+    CommandStep,
+    InvalidPlanError,
+    PlanPolicy,
+    PlanStep,
+    ShellResultStatus,
+)
+
+
+def _python_step(code: str) -> CommandStep:
+    return CommandStep(command="python", args=["-c", code], env={}, cwd=".", timeout=None)
+
+
+def _sleep_step(seconds: float) -> CommandStep:
+    return _python_step(f"import time; time.sleep({seconds})")
+
+
+def _run_plan(steps: list[PlanStep], **kwargs):
+    shell = AgentShell()
+    return asyncio.run(shell.run_plan(steps, **kwargs))
+
+
+def test_independent_steps_run_concurrently():
+    steps = [
+        PlanStep("a", _sleep_step(1)),
+        PlanStep("b", _sleep_step(1)),
+        PlanStep("c", _sleep_step(1)),
+    ]
+
+    start_time = time.monotonic()
+    result = _run_plan(steps)
+    elapsed = time.monotonic() - start_time
+
+    assert result.success
+    assert elapsed < 2.5
+    assert result.wall_time < 2.5
+
+
+def test_max_concurrency_limits_parallelism():
+    steps = [PlanStep(str(i), _sleep_step(0.5)) for i in range(3)]
+
+    result = _run_plan(steps, max_concurrency=1)
+
+    assert result.success
+    assert result.wall_time >= 1.5
+
+
+def test_dependencies_run_in_order():
+    steps = [
+        PlanStep("package", _python_step("print('package')"), depends_on=["lint", "test"]),
+        PlanStep("lint", _python_step("print('lint')"), depends_on=["install"]),
+        PlanStep("test", _sleep_step(0.5), depends_on=["install"]),
+        PlanStep("install", _python_step("print('install')")),
+    ]
+
+    result = _run_plan(steps)
+
+    assert result.success
+    assert list(result.results) == ["package", "lint", "test", "install"]
+    assert result.results["package"].stdout == "package"
+    assert result.critical_path == ["install", "test", "package"]
+    assert result.critical_path_time <= result.wall_time
+
+
+def test_fail_fast_cancels_running_siblings():
+    steps = [
+        PlanStep("fail", _python_step("import sys; sys.exit(1)")),
+        PlanStep("slow", _sleep_step(10)),
+        PlanStep("after", _python_step("print('after')"), depends_on=["fail"]),
+    ]
+
+    start_time = time.monotonic()
+    result = _run_plan(steps)
+    elapsed = time.monotonic() - start_time
+
+    assert elapsed < 5
+    assert not result.success
+    assert result.results["fail"].returncode == 1
+    assert result.results["slow"].status == ShellResultStatus.CANCELED
+    assert result.results["after"].status == ShellResultStatus.SKIPPED
+    assert result.skipped == ["after"]
+
+
+def test_continue_on_error_skips_only_dependents():
+    steps = [
+        PlanStep("fail", _python_step("import sys; sys.exit(1)")),
+        PlanStep("dependent", _python_step("print('dependent')"), depends_on=["fail"]),
+        PlanStep("transitive", _python_step("print('transitive')"), depends_on=["dependent"]),
+        PlanStep("independent", _sleep_step(0.5)),
+    ]
+
+    result = _run_plan(steps, policy=PlanPolicy.CONTINUE_ON_ERROR)
+
+    assert result.results["independent"].status == ShellResultStatus.SUCCESS
+    assert result.results["independent"].returncode == 0
+    assert result.skipped == ["dependent", "transitive"]
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        [PlanStep("a", _sleep_step(0), depends_on=["b"]), PlanStep("b", _sleep_step(0), depends_on=["a"])],
+        [PlanStep("a", _sleep_step(0), depends_on=["missing"])],
+        [PlanStep("a", _sleep_step(0)), PlanStep("a", _sleep_step(0))],
+    ],
+)
+def test_invalid_plan_raises(steps: list[PlanStep]):
+    with pytest.raises(InvalidPlanError):
+        _run_plan(steps)
+
+
+def test_cancelled_plan_terminates_steps():
+    if platform.system() == "Windows":
+        pytest.skip("Uses POSIX sleep")
+    shell = AgentShell()
+    steps = [PlanStep("slow", CommandStep(command="sleep", args=["10"], env={}, cwd=".", timeout=None))]
+
+    async def _run():
+        task = asyncio.create_task(shell.run_plan(steps))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        await task
+
+    start_time = time.monotonic()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(_run())
+
+    assert time.monotonic() - start_time < 5
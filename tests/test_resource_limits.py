@@ -0,0 +1,101 @@
+import signal
+import sys
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ResourceLimits, ShellResultStatus
+from dais_shell.runtimes.BashRuntime import BashCommandStep
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="resource limits are POSIX only")
+
+
+def _python_step(code: str, limits: ResourceLimits | None = None, cwd: str = ".") -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=cwd, timeout=30, limits=limits)
+
+
+@pytest.fixture(params=[False, True], ids=["spawn", "session"])
+def shell(request):
+    shell = AgentShell(session=request.param)
+    yield shell
+    shell.close()
+
+
+def test_cpu_limit(shell):
+    result = shell.run_sync(_python_step("while True: pass", ResourceLimits(cpu_seconds=1)))
+
+    assert result.status == ShellResultStatus.LIMIT_EXCEEDED
+    assert result.exceeded_limit == "cpu_seconds"
+    assert result.returncode == -signal.SIGXCPU
+
+
+def test_cpu_limit_when_sigxcpu_is_ignored(shell):
+    code = "import signal; signal.signal(signal.SIGXCPU, signal.SIG_IGN)\nwhile True: pass"
+    result = shell.run_sync(_python_step(code, ResourceLimits(cpu_seconds=1)))
+
+    assert result.status == ShellResultStatus.LIMIT_EXCEEDED
+    assert result.exceeded_limit == "cpu_seconds"
+    assert result.returncode == -signal.SIGKILL
+    assert result.cpu_time >= 1
+
+
+def test_exit_code_is_not_taken_for_a_limit(shell):
+    result = shell.run_sync(_python_step("import sys; sys.exit(137)", ResourceLimits(cpu_seconds=100)))
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.exceeded_limit is None
+    assert result.cpu_time < 100
+
+
+def test_file_size_limit(shell, tmp_path):
+    code = "open('out.bin', 'wb').write(b'x' * 1024 * 1024)"
+    result = shell.run_sync(_python_step(code, ResourceLimits(max_file_bytes=64 * 1024), cwd=str(tmp_path)))
+
+    assert result.status == ShellResultStatus.LIMIT_EXCEEDED
+    assert result.exceeded_limit == "max_file_bytes"
+    assert (tmp_path / "out.bin").stat().st_size <= 64 * 1024
+
+
+def test_memory_limit(shell):
+    code = "data = bytearray(1024 * 1024 * 1024)"
+    result = shell.run_sync(_python_step(code, ResourceLimits(memory_bytes=256 * 1024 * 1024)))
+
+    assert result.status == ShellResultStatus.LIMIT_EXCEEDED
+    assert result.exceeded_limit == "memory_bytes"
+
+
+def test_open_files_limit(shell, tmp_path):
+    code = "files = [open(f'f{i}', 'w') for i in range(100)]"
+    result = shell.run_sync(_python_step(code, ResourceLimits(max_open_files=32), cwd=str(tmp_path)))
+
+    assert result.status == ShellResultStatus.LIMIT_EXCEEDED
+    assert result.exceeded_limit == "max_open_files"
+
+
+def test_limits_within_bounds_succeed(shell):
+    result = shell.run_sync(_python_step("print('ok')", ResourceLimits(cpu_seconds=10, max_open_files=64)))
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.exceeded_limit is None
+    assert result.stdout == "ok"
+
+
+def test_shell_limits_are_overridden_by_step_limits():
+    shell = AgentShell(limits=ResourceLimits(cpu_seconds=1, max_open_files=32))
+    code = "import resource; print(resource.getrlimit(resource.RLIMIT_CPU)[0], resource.getrlimit(resource.RLIMIT_NOFILE)[0])"
+
+    result = shell.run_sync(_python_step(code, ResourceLimits(max_open_files=48)))
+
+    assert result.stdout == "1 48"
+
+
+def test_step_conversion_keeps_limits():
+    limits = ResourceLimits(cpu_seconds=5)
+    step = BashCommandStep.from_command_step(_python_step("pass", limits))
+
+    assert step.limits is limits
+
+
+def test_merge():
+    merged = ResourceLimits(cpu_seconds=1, max_processes=10).merge(ResourceLimits(cpu_seconds=2))
+
+    assert merged == ResourceLimits(cpu_seconds=2, max_processes=10)
@@ -0,0 +1,206 @@
+import os
+import platform
+import shutil
+import subprocess
+import threading
+
+import pytest
+
+from dais_shell import (
+    AdmissionPolicy,
+    AgentShell,
+    CacheRule,
+    CommandStep,
+    OutputDelivery,
+    ResultCache,
+    ShellResultStatus,
+)
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="uses POSIX commands")
+
+
+def _step(command: str, args: list[str], cwd: str = ".", env: dict[str, str] | None = None) -> CommandStep:
+    return CommandStep(command=command, args=args, env=env or {}, cwd=cwd)
+
+
+def test_repeated_read_is_cached(tmp_path):
+    (tmp_path / "pyproject.toml").write_text("[project]\nname = 'demo'\n")
+    shell = AgentShell(cache=ResultCache())
+    step = _step("cat", ["pyproject.toml"], cwd=str(tmp_path))
+    lines = []
+
+    first = shell.run_sync(step)
+    second = shell.run_sync(step, on_stdout=lines.append)
+
+    assert not first.cached
+    assert second.cached
+    assert second.status == ShellResultStatus.SUCCESS
+    assert second.stdout == first.stdout
+    assert lines == ["[project]", "name = 'demo'"]
+    assert shell.result_cache.cache_info()[:3] == (1, 1, 1)
+
+
+def test_dependency_change_invalidates(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("old\n")
+    shell = AgentShell(cache=ResultCache())
+    step = _step("cat", ["data.txt"], cwd=str(tmp_path))
+
+    assert shell.run_sync(step).stdout == "old"
+    path.write_text("new\n")
+    os.utime(path, ns=(0, 10 ** 9))
+    result = shell.run_sync(step)
+
+    assert not result.cached
+    assert result.stdout == "new"
+
+
+def test_new_entry_invalidates_listing(tmp_path):
+    shell = AgentShell(cache=ResultCache())
+    step = _step("ls", [], cwd=str(tmp_path))
+    shell.run_sync(step)
+    os.utime(tmp_path, ns=(0, 10 ** 9))
+
+    (tmp_path / "added").write_text("")
+
+    assert shell.run_sync(step).stdout == "added"
+
+
+def test_expired_entries_are_not_used(tmp_path):
+    shell = AgentShell(cache=ResultCache(ttl=0))
+    step = _step("pwd", [], cwd=str(tmp_path))
+
+    shell.run_sync(step)
+
+    assert not shell.run_sync(step).cached
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    for name in "abc":
+        (tmp_path / name).write_text(name)
+    cache = ResultCache(max_entries=2)
+    shell = AgentShell(cache=cache)
+    steps = {name: _step("cat", [name], cwd=str(tmp_path)) for name in "abc"}
+
+    shell.run_sync(steps["a"])
+    shell.run_sync(steps["b"])
+    shell.run_sync(steps["a"])
+    shell.run_sync(steps["c"])
+
+    assert shell.run_sync(steps["a"]).cached
+    assert not shell.run_sync(steps["b"]).cached
+    assert cache.cache_info().size == 2
+
+
+def test_failures_are_not_cached(tmp_path):
+    shell = AgentShell(cache=ResultCache())
+    step = _step("cat", ["missing"], cwd=str(tmp_path))
+
+    shell.run_sync(step)
+
+    assert not shell.run_sync(step).cached
+
+
+def test_only_declared_commands_are_cacheable(tmp_path):
+    cache = ResultCache(rules=[CacheRule("git", {"status"}, [".git/index"])])
+
+    assert cache.lookup(_step("git", ["status"], cwd=str(tmp_path))) is not None
+    assert cache.lookup(_step("git", ["commit", "-m", "x"], cwd=str(tmp_path))) is None
+    assert cache.lookup(_step("ls", [], cwd=str(tmp_path))) is None
+
+
+def test_key_includes_expanded_args_and_env(tmp_path):
+    cache = ResultCache()
+
+    first = cache.lookup(_step("cat", ["$NAME"], cwd=str(tmp_path), env={"NAME": "a"}))
+    second = cache.lookup(_step("cat", ["$NAME"], cwd=str(tmp_path), env={"NAME": "b"}))
+
+    assert first is not None and second is not None
+    assert first.key != second.key
+    assert first.stamps[0][0] == str(tmp_path / "a")
+
+
+def test_changing_a_result_does_not_change_the_entry(tmp_path):
+    (tmp_path / "data.txt").write_text("one\ntwo\n")
+    shell = AgentShell(cache=ResultCache())
+    step = _step("cat", ["data.txt"], cwd=str(tmp_path))
+
+    shell.run_sync(step).stdout_buf.clear()
+    second = shell.run_sync(step)
+    second.stdout_buf.clear()
+    third = shell.run_sync(step)
+
+    assert second.cached and third.cached
+    assert third.stdout_buf.lines == ["one", "two"]
+
+
+def test_working_tree_git_commands_are_not_cached_by_default(tmp_path):
+    cache = ResultCache()
+
+    assert cache.lookup(_step("git", ["status"], cwd=str(tmp_path))) is None
+    assert cache.lookup(_step("git", ["diff"], cwd=str(tmp_path))) is None
+    assert cache.lookup(_step("git", ["log"], cwd=str(tmp_path))) is not None
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_git_result_is_invalidated_from_a_subdirectory(tmp_path):
+    def commit(message: str):
+        subprocess.run(["git", "-c", "user.name=dais", "-c", "user.email=dais@example.com",
+                        "commit", "-q", "--allow-empty", "-m", message], cwd=tmp_path, check=True)
+
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    commit("first")
+    (tmp_path / "src").mkdir()
+    shell = AgentShell(cache=ResultCache())
+    step = _step("git", ["log", "--format=%s"], cwd=str(tmp_path / "src"))
+
+    assert shell.run_sync(step).stdout == "first"
+    assert shell.run_sync(step).cached
+    commit("second")
+    result = shell.run_sync(step)
+
+    assert not result.cached
+    assert result.stdout == "second\nfirst"
+
+
+def test_pip_is_not_cached_by_default(tmp_path):
+    assert ResultCache().lookup(_step("pip", ["list"], cwd=str(tmp_path))) is None
+
+
+def test_cached_result_has_no_delivery_or_queue_wait(tmp_path):
+    (tmp_path / "data.txt").write_text("line\n")
+    shell = AgentShell(cache=ResultCache(), delivery=OutputDelivery(),
+                       admission=AdmissionPolicy(max_concurrent=1))
+    step = _step("cat", ["data.txt"], cwd=str(tmp_path))
+
+    first = shell.run_sync(step, on_stdout=lambda line: None)
+    second = shell.run_sync(step, on_stdout=lambda line: None)
+
+    assert first.queue_wait is not None
+    assert first.stdout_delivery is not None
+    assert second.cached
+    assert second.queue_wait is None
+    assert second.stdout_delivery is None
+    assert second.stderr_delivery is None
+
+
+def test_lookups_from_many_threads(tmp_path):
+    (tmp_path / "data.txt").write_text("line\n")
+    cache = ResultCache(max_entries=2)
+    shell = AgentShell(cache=cache)
+    steps = [_step("cat", ["data.txt"], cwd=str(tmp_path), env={"N": str(i)}) for i in range(8)]
+    errors = []
+
+    def run():
+        try:
+            for step in steps * 5:
+                assert shell.run_sync(step).stdout == "line"
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    assert errors == []
+    assert cache.cache_info().size <= 2
@@ -0,0 +1,98 @@
+import asyncio
+import platform
+
+import pytest
+
+from dais_shell import AdmissionPolicy, AgentShell, CommandStep, ShellResultStatus, StepPriority
+from dais_shell.scheduler import AdmissionScheduler
+
+
+async def _admit_all(scheduler: AdmissionScheduler, requests: list[tuple[StepPriority, str]]) -> list[int]:
+    """Queues the requests behind one running step, returns the order they are admitted in."""
+    order = []
+
+    async def request(index: int, priority: StepPriority, workspace: str):
+        await scheduler.acquire(priority, workspace)
+        order.append(index)
+        scheduler.release()
+
+    await scheduler.acquire(StepPriority.NORMAL, "holder")
+    tasks = [asyncio.create_task(request(i, *args)) for i, args in enumerate(requests)]
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_interactive_before_background():
+    scheduler = AdmissionScheduler(AdmissionPolicy(max_concurrent=1))
+    order = asyncio.run(_admit_all(scheduler, [
+        (StepPriority.BACKGROUND, "a"),
+        (StepPriority.NORMAL, "a"),
+        (StepPriority.INTERACTIVE, "a"),
+    ]))
+    assert order == [2, 1, 0]
+
+
+def test_workspaces_take_turns():
+    scheduler = AdmissionScheduler(AdmissionPolicy(max_concurrent=1))
+    order = asyncio.run(_admit_all(scheduler, [
+        (StepPriority.NORMAL, "a"),
+        (StepPriority.NORMAL, "a"),
+        (StepPriority.NORMAL, "a"),
+        (StepPriority.NORMAL, "b"),
+        (StepPriority.NORMAL, "b"),
+    ]))
+    assert order == [0, 3, 1, 4, 2]
+
+
+def test_canceled_waiter_does_not_hold_a_slot():
+    async def main():
+        scheduler = AdmissionScheduler(AdmissionPolicy(max_concurrent=1))
+        await scheduler.acquire(StepPriority.NORMAL, "a")
+        waiting = asyncio.create_task(scheduler.acquire(StepPriority.NORMAL, "a"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        scheduler.release()
+        assert (scheduler.running, scheduler.queued) == (0, 0)
+        assert await scheduler.acquire(StepPriority.NORMAL, "a") == 0.0
+
+    asyncio.run(main())
+
+
+def test_throttled_by_cpu(monkeypatch):
+    usage = [100.0]
+    monkeypatch.setattr("dais_shell.scheduler.psutil.cpu_percent", lambda interval=None: usage[0])
+
+    async def main():
+        scheduler = AdmissionScheduler(AdmissionPolicy(max_concurrent=4, max_cpu_percent=80, load_check_interval=0.01))
+        # the first step is always admitted
+        assert await scheduler.acquire(StepPriority.NORMAL, "a") == 0.0
+        waiting = asyncio.create_task(scheduler.acquire(StepPriority.NORMAL, "a"))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        usage[0] = 10.0
+        assert await asyncio.wait_for(waiting, 1) > 0
+        assert scheduler.running == 2
+
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="uses POSIX commands")
+def test_shell_bounds_concurrent_steps(tmp_path):
+    shell = AgentShell(admission=AdmissionPolicy(max_concurrent=2))
+    step = CommandStep(command="sleep", args=["0.3"], cwd=str(tmp_path), env={})
+
+    async def main():
+        return await asyncio.gather(*(shell.run(step) for _ in range(4)))
+
+    results = asyncio.run(main())
+    shell.close()
+
+    assert all(result.status == ShellResultStatus.SUCCESS for result in results)
+    waits = sorted(result.queue_wait for result in results)
+    assert waits[:2] == [0.0, 0.0]
+    assert all(wait > 0.2 for wait in waits[2:])
+    assert all(result.timing.admitted is not None for result in results)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ResourceLimits, ShellResultStatus, SpawnBackend
+from dais_shell.spawn import SpawnedProcess, needs_chdir, spawn
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "posix_spawn"), reason="posix_spawn is not available")
+
+
+def _step(command: str, args: list[str], cwd: str | None = None, **kwargs) -> CommandStep:
+    return CommandStep(command=command, args=args, env=kwargs.pop("env", {}), cwd=cwd or os.getcwd(), **kwargs)
+
+
+def _shell() -> AgentShell:
+    return AgentShell(spawn_backend=SpawnBackend.POSIX_SPAWN)
+
+
+def test_spawn_uses_posix_spawn_in_any_directory(tmp_path):
+    code = "import os; print(os.getcwd())"
+
+    async def run(cwd: str):
+        proc = await spawn([sys.executable, "-c", code], cwd, {}, [], SpawnBackend.POSIX_SPAWN)
+        output = await proc.stdout.read()
+        await proc.wait()
+        return type(proc), output.decode().strip()
+
+    assert asyncio.run(run(os.getcwd())) == (SpawnedProcess, os.getcwd())
+    assert asyncio.run(run(str(tmp_path))) == (SpawnedProcess, os.path.realpath(tmp_path))
+    assert not needs_chdir(".")
+    assert needs_chdir(str(tmp_path))
+
+
+def test_environment_is_kept_in_another_directory(tmp_path):
+    code = "import os; print(*(os.environ.get(name) for name in ('PWD', 'OLDPWD', 'SHLVL', 'DAIS_VALUE')))"
+
+    async def run(env: dict[str, str]):
+        proc = await spawn([sys.executable, "-c", code], str(tmp_path), env, [], SpawnBackend.POSIX_SPAWN)
+        output = await proc.stdout.read()
+        await proc.wait()
+        return output.decode().split()
+
+    assert asyncio.run(run({"DAIS_VALUE": "x"})) == ["None", "None", "None", "x"]
+    assert asyncio.run(run({"DAIS_VALUE": "x", "PWD": "/", "SHLVL": "1"})) == [os.path.abspath(tmp_path), "None", "1", "x"]
+
+
+def test_missing_directory_raises(tmp_path):
+    async def run():
+        await spawn([sys.executable, "-c", "pass"], str(tmp_path / "missing"), {}, [], SpawnBackend.POSIX_SPAWN)
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run())
+
+
+def test_limited_step_is_posix_spawned_elsewhere(tmp_path):
+    code = "import os, resource; print(os.getcwd(), resource.getrlimit(resource.RLIMIT_NOFILE)[0])"
+
+    async def main():
+        proc = await spawn([sys.executable, "-c", code], str(tmp_path), {}, ResourceLimits(max_open_files=48).rlimits())
+        output = await proc.stdout.read()
+        return proc, await proc.wait(), output
+
+    proc, returncode, output = asyncio.run(main())
+
+    assert isinstance(proc, SpawnedProcess)
+    assert (returncode, output.decode().split()) == (0, [os.path.realpath(tmp_path), "48"])
+    assert proc.cpu_time is not None and proc.cpu_time > 0
+
+
+def test_output_and_returncode():
+    code = "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"
+
+    result = _shell().run_sync(_step(sys.executable, ["-c", code]))
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert (result.returncode, result.stdout, result.stderr) == (3, "out", "err")
+    assert result.timing.spawned is not None
+
+
+def test_env_and_cwd(tmp_path):
+    code = "import os; print(os.environ['DAIS_VALUE'], os.getcwd())"
+
+    result = _shell().run_sync(_step(sys.executable, ["-c", code], cwd=str(tmp_path), env={"DAIS_VALUE": "x"}))
+
+    assert result.stdout == f"x {os.path.realpath(tmp_path)}"
+
+
+def test_signal_defaults_are_restored():
+    # Python ignores SIGPIPE, bash lists the signals it inherited as ignored
+    async def traps():
+        proc = await spawn([shutil.which("bash"), "-c", "trap -p PIPE XFSZ"], None, {}, [], SpawnBackend.POSIX_SPAWN)
+        output = await proc.stdout.read()
+        return await proc.wait(), output
+
+    assert asyncio.run(traps()) == (0, b"")
+
+
+def test_signal_exit_is_negative():
+    result = _shell().run_sync(_step(sys.executable, ["-c", "import os, signal; os.kill(os.getpid(), signal.SIGTERM)"]))
+
+    assert result.returncode == -15
+
+
+def test_timeout_kills_process_group():
+    script = "import subprocess, time; subprocess.Popen(['sleep', '60']); time.sleep(60)"
+    start = time.monotonic()
+
+    result = _shell().run_sync(_step(sys.executable, ["-c", script], timeout=1))
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert time.monotonic() - start < 5
+
+
+def test_missing_executable_raises():
+    async def run():
+        await spawn(["/nonexistent/dais-binary"], None, {}, [], SpawnBackend.POSIX_SPAWN)
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run())
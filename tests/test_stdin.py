@@ -0,0 +1,109 @@
+import platform
+import sys
+from pathlib import Path
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ResultCache, ShellResultStatus, SpawnBackend
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="uses POSIX commands")
+
+COUNT_BYTES = "import sys; print(len(sys.stdin.buffer.read()))"
+
+
+def _step(code: str, stdin, cwd: str = ".") -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=cwd, stdin=stdin)
+
+
+@pytest.fixture(params=["subprocess", "posix_spawn", "fork_server", "session"])
+def shell(request):
+    if request.param == "session":
+        shell = AgentShell(session=True)
+    else:
+        shell = AgentShell(spawn_backend=SpawnBackend(request.param))
+    yield shell
+    shell.close()
+
+
+def test_bytes(shell: AgentShell):
+    result = shell.run_sync(_step("import sys; sys.stdout.write(sys.stdin.read().upper())", b"one\ntwo\n"))
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.stdout.split() == ["ONE", "TWO"]
+
+
+def test_async_iterator(shell: AgentShell):
+    async def chunks():
+        for _ in range(128):
+            yield b"x" * 65536
+
+    result = shell.run_sync(_step(COUNT_BYTES, chunks()))
+
+    assert result.stdout == str(128 * 65536)
+
+
+def test_iterator_waits_for_reader(shell: AgentShell):
+    produced = []
+
+    async def chunks():
+        for i in range(1000):
+            produced.append(i)
+            yield b"x" * 65536
+
+    # reads 1 MiB then exits, the rest of the source is never written
+    result = shell.run_sync(_step("import sys; print(len(sys.stdin.buffer.read(1 << 20)))", chunks()))
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.stdout == str(1 << 20)
+    assert len(produced) < 100
+
+
+def test_file_is_connected_directly(shell: AgentShell, tmp_path):
+    (tmp_path / "input.txt").write_bytes(b"a" * 5000)
+    code = "import os, stat; print(stat.S_ISREG(os.fstat(0).st_mode), len(os.read(0, 10000)))"
+
+    result = shell.run_sync(_step(code, Path("input.txt"), cwd=str(tmp_path)))
+
+    assert result.stdout == "True 5000"
+
+
+def test_missing_file_raises(shell: AgentShell, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        shell.run_sync(_step(COUNT_BYTES, Path("missing.txt"), cwd=str(tmp_path)))
+
+
+def test_default_stdin_is_empty(shell: AgentShell):
+    assert shell.run_sync(_step(COUNT_BYTES, None)).stdout == "0"
+
+
+def test_source_is_not_cached(tmp_path):
+    shell = AgentShell(cache=ResultCache())
+    step = CommandStep(command="cat", args=[], env={}, cwd=str(tmp_path), stdin=b"first")
+
+    assert shell.run_sync(step).stdout == "first"
+    step.stdin = b"second"
+    assert shell.run_sync(step).stdout == "second"
+    assert shell.result_cache.cache_info().size == 0
+
+
+def test_failing_source_is_an_error(shell: AgentShell):
+    async def chunks():
+        yield b"one\n"
+        raise ValueError("source failed")
+
+    result = shell.run_sync(_step("import sys; print(len(sys.stdin.readlines()))", chunks()))
+
+    assert result.status == ShellResultStatus.ERROR
+    assert isinstance(result.error, ValueError)
+    assert result.stdout == ""
+
+
+def test_unsupported_source_is_rejected():
+    with pytest.raises(TypeError):
+        _step(COUNT_BYTES, "some text")
+    step = _step(COUNT_BYTES, None)
+    step.stdin = "some text"
+    shell = AgentShell()
+    with pytest.raises(TypeError):
+        shell.run_sync(step)
+    shell.close()
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+import time
+from contextlib import aclosing
+
+import psutil
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ExitEvent, StderrLineEvent, StdoutLineEvent
+
+
+def _python_step(code: str, cwd: str = ".") -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=cwd, timeout=60)
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["spawn", "session"])
+def test_stream_yields_lines_then_exit(session: bool):
+    if session and sys.platform == "win32":
+        pytest.skip("sessions are bash only")
+    code = "import sys\nfor i in range(3): print(i)\nprint('warn', file=sys.stderr)\nsys.exit(2)"
+
+    async def collect():
+        shell = AgentShell(session=session)
+        events = [event async for event in shell.stream(_python_step(code))]
+        await shell.aclose()
+        return events
+
+    events = asyncio.run(collect())
+
+    stdout = [event.text for event in events if isinstance(event, StdoutLineEvent)]
+    stderr = [event.text for event in events if isinstance(event, StderrLineEvent)]
+    assert stdout == ["0", "1", "2"]
+    assert stderr == ["warn"]
+    assert isinstance(events[-1], ExitEvent)
+    assert events[-1].result.returncode == 2
+    assert events[-1].result.stdout == "0\n1\n2"
+
+
+def test_stream_reads_no_faster_than_consumer(tmp_path):
+    code = (
+        "import sys\n"
+        "sys.stdout.writelines(f'{i}\\n' for i in range(2_000_000))\n"
+        "sys.stdout.flush()\n"
+        "open('done', 'w').close()\n"
+    )
+
+    async def consume():
+        stream = AgentShell().stream(_python_step(code, cwd=str(tmp_path)))
+        async with aclosing(stream):
+            first = [await anext(stream) for _ in range(10)]
+            await asyncio.sleep(1)
+            finished = (tmp_path / "done").exists()
+        return first, finished
+
+    first, finished = asyncio.run(consume())
+
+    assert [event.text for event in first] == [str(i) for i in range(10)]
+    # the child is blocked on the full pipe while nobody pulls
+    assert not finished
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses sleep")
+def test_closing_stream_early_terminates_process_tree():
+    code = (
+        "import subprocess, time\n"
+        "child = subprocess.Popen(['sleep', '60'])\n"
+        "print(child.pid, flush=True)\n"
+        "time.sleep(60)\n"
+    )
+
+    async def consume():
+        stream = AgentShell().stream(_python_step(code))
+        async with aclosing(stream):
+            event = await anext(stream)
+        return int(event.text), time.monotonic()
+
+    start = time.monotonic()
+    child, closed = asyncio.run(consume())
+
+    assert closed - start < 5
+    deadline = time.monotonic() + 1
+    while time.monotonic() < deadline:
+        try:
+            if psutil.Process(child).status() == psutil.STATUS_ZOMBIE: break
+        except psutil.NoSuchProcess:
+            break
+        time.sleep(0.01)
+    else:
+        os.kill(child, 9)
+        pytest.fail("the child outlived the closed stream")
@@ -0,0 +1,182 @@
+import os
+import signal
+import sys
+import time
+
+import psutil
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ShellResultStatus, TerminationPolicy
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="process groups are POSIX only")
+
+HANDLES_SIGTERM = """
+import signal, sys, time
+def stop(*_):
+    print('stopping', flush=True)
+    sys.exit(3)
+signal.signal(signal.SIGTERM, stop)
+print('ready', flush=True)
+time.sleep(60)
+"""
+
+IGNORES_SIGTERM = """
+import signal, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+print('ready', flush=True)
+time.sleep(60)
+"""
+
+
+def _python_step(code: str, timeout: float | None = 0.5) -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=".", timeout=timeout)
+
+
+def _is_dead(pid: int) -> bool:
+    # SIGKILL was sent to the whole group, a member dies once it is scheduled
+    deadline = time.monotonic() + 1
+    while time.monotonic() < deadline:
+        try:
+            if psutil.Process(pid).status() == psutil.STATUS_ZOMBIE: return True
+        except psutil.NoSuchProcess:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _kill(pid: int):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["spawn", "session"])
+def test_grace_period_lets_step_shut_down(session: bool):
+    shell = AgentShell(session=session, termination=TerminationPolicy(grace_period=5))
+    start = time.monotonic()
+    result = shell.run_sync(_python_step(HANDLES_SIGTERM))
+    elapsed = time.monotonic() - start
+    shell.close()
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert result.returncode == 3
+    assert result.stdout == "ready\nstopping"
+    assert elapsed < 2
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["spawn", "session"])
+def test_grace_period_escalates_to_sigkill(session: bool):
+    shell = AgentShell(session=session, termination=TerminationPolicy(grace_period=0.3))
+    start = time.monotonic()
+    result = shell.run_sync(_python_step(IGNORES_SIGTERM))
+    elapsed = time.monotonic() - start
+    shell.close()
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert result.returncode == -signal.SIGKILL
+    assert 0.8 <= elapsed < 2
+
+
+def test_timeout_kills_process_group():
+    code = (
+        "import subprocess, time\n"
+        "child = subprocess.Popen(['sleep', '60'])\n"
+        "print(child.pid, flush=True)\n"
+        "time.sleep(60)\n"
+    )
+    result = AgentShell().run_sync(_python_step(code))
+
+    child = int(result.stdout)
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert result.returncode == -signal.SIGKILL
+    assert _is_dead(child)
+
+
+def test_killed_step_returns_while_escaped_process_holds_pipes():
+    code = (
+        "import subprocess, time\n"
+        "child = subprocess.Popen(['sleep', '30'], start_new_session=True)\n"
+        "print(child.pid, flush=True)\n"
+        "time.sleep(60)\n"
+    )
+    start = time.monotonic()
+    result = AgentShell().run_sync(_python_step(code))
+    elapsed = time.monotonic() - start
+    _kill(int(result.stdout))
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert elapsed < 1
+    assert result.timing.drained - result.timing.killed < 0.5
+
+
+def test_drain_timeout_bounds_wait_for_background_output():
+    code = (
+        "import subprocess\n"
+        "child = subprocess.Popen(['sleep', '30'])\n"
+        "print(child.pid, flush=True)\n"
+    )
+    shell = AgentShell(termination=TerminationPolicy(drain_timeout=0.2))
+    start = time.monotonic()
+    result = shell.run_sync(_python_step(code, timeout=None))
+    elapsed = time.monotonic() - start
+    _kill(int(result.stdout))
+
+    assert result.status == ShellResultStatus.SUCCESS
+    assert result.returncode == 0
+    assert elapsed < 1
+
+
+PRINTS_THEN_HANGS = """
+import time
+for i in range(5):
+    print(i, flush=True)
+    time.sleep(0.1)
+time.sleep(60)
+"""
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["spawn", "session"])
+def test_idle_timeout_kills_silent_step(session: bool):
+    shell = AgentShell(session=session)
+    step = _python_step(PRINTS_THEN_HANGS, timeout=30)
+    step.idle_timeout = 0.3
+    start = time.monotonic()
+    result = shell.run_sync(step)
+    elapsed = time.monotonic() - start
+    shell.close()
+
+    assert result.status == ShellResultStatus.IDLE_TIMEOUT
+    assert result.stdout.split() == ["0", "1", "2", "3", "4"]
+    # the output kept the step alive past the idle timeout
+    assert 0.6 < elapsed < 3
+
+
+@pytest.mark.parametrize("session", [False, True], ids=["spawn", "session"])
+def test_soft_timeout_signals_before_hard_timeout(session: bool):
+    shell = AgentShell(session=session)
+    step = _python_step(HANDLES_SIGTERM, timeout=10)
+    step.soft_timeout = 0.3
+    start = time.monotonic()
+    result = shell.run_sync(step)
+    elapsed = time.monotonic() - start
+    shell.close()
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert result.stdout.split() == ["ready", "stopping"]
+    assert result.returncode == 3
+    assert result.timing.soft_deadline is not None
+    assert result.timing.killed is None
+    assert elapsed < 3
+
+
+def test_hard_timeout_after_ignored_soft_timeout():
+    shell = AgentShell()
+    step = _python_step(IGNORES_SIGTERM, timeout=0.6)
+    step.soft_timeout = 0.2
+    result = shell.run_sync(step)
+    shell.close()
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    assert result.returncode == -signal.SIGKILL
+    assert result.timing.soft_deadline < result.timing.killed
@@ -0,0 +1,71 @@
+import sys
+
+import pytest
+
+from dais_shell import AgentShell, CommandStep, ShellResultStatus, set_timing_hook
+
+
+def _python_step(code: str, timeout: float | None = None) -> CommandStep:
+    return CommandStep(command=sys.executable, args=["-c", code], env={}, cwd=".", timeout=timeout)
+
+
+@pytest.fixture
+def recorded():
+    records = []
+    set_timing_hook(lambda step, timing: records.append((step, timing)))
+    yield records
+    set_timing_hook(None)
+
+
+@pytest.mark.parametrize("session", [False, True])
+def test_result_timing_orders_phases(session: bool):
+    if session and sys.platform == "win32":
+        pytest.skip("sessions are bash only")
+    shell = AgentShell(session=session)
+    result = shell.run_sync(_python_step("import sys; print('out'); print('err', file=sys.stderr)"))
+    shell.close()
+
+    timing = result.timing
+    assert timing is not None
+    assert timing.killed is None
+    assert None not in (timing.env_built, timing.resolved, timing.spawned,
+                        timing.first_stdout, timing.first_stderr, timing.exited, timing.drained)
+    assert timing.started <= timing.env_built <= timing.resolved <= timing.spawned
+    assert timing.spawned <= timing.first_stdout <= timing.drained
+    assert timing.exited <= timing.drained
+    assert list(timing.offsets()) == ["env_built", "resolved", "spawned",
+                                      "first_stdout", "first_stderr", "exited", "drained"]
+
+
+def test_result_timing_records_kill():
+    shell = AgentShell()
+    result = shell.run_sync(_python_step("import time; time.sleep(10)", timeout=0.2))
+
+    assert result.status == ShellResultStatus.TIMEOUT
+    timing = result.timing
+    assert timing.first_stdout is None
+    assert timing.spawned + 0.2 <= timing.killed <= timing.exited <= timing.drained
+
+
+def test_timing_hook_receives_every_step(recorded):
+    shell = AgentShell()
+    step = _python_step("print('x')")
+    result = shell.run_sync(step)
+
+    assert len(recorded) == 1
+    recorded_step, timing = recorded[0]
+    assert timing is result.timing
+    assert recorded_step.command == step.command
+
+
+def test_failing_timing_hook_does_not_fail_the_step():
+    def hook(step, timing):
+        raise RuntimeError("broken hook")
+
+    set_timing_hook(hook)
+    try:
+        result = AgentShell().run_sync(_python_step("print('x')"))
+    finally:
+        set_timing_hook(None)
+
+    assert result.stdout == "x"